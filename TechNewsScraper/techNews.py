@@ -13,13 +13,18 @@ WEBSITES = {
     "Wired": "https://www.wired.com/tag/technology/",
 }
 
+# Reuse one keep-alive session and never wait on a site forever
+# (jobs.py fetches every site concurrently through news_fetcher.py)
+session = requests.Session()
+REQUEST_TIMEOUT = (5, 15)  # Connect and read timeouts in seconds
+
 def find_articles():
     articles = []  # Store scraped articles
     
     # Iterate through each website
     for siteName, url in WEBSITES.items():
         try:
-            httpResponse = requests.get(url)
+            httpResponse = session.get(url, timeout=REQUEST_TIMEOUT)
             httpResponse.raise_for_status()  # Check for HTTP errors
             soup = BeautifulSoup(httpResponse.text, 'html.parser')
             
@@ -0,0 +1,295 @@
+# asyncio entry point for the bot, served by uvicorn instead of gunicorn's sync workers
+# Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+# Every outbound Slack call goes through AsyncWebClient, so one process keeps hundreds of
+# Slack calls in flight instead of being capped at one per gunicorn worker. Events are
+# acked as soon as the signature is checked, and the onboarding, news and meme work runs
+# as concurrent coroutines, including the scheduled news and meme jobs. Dedup, message
+# formats are shared with bot.py, the outbox every post is recorded in with slack_setup.py,
+# and scraping and picking what to post with jobs.py, which is only imported once a job runs.
+import asyncio
+import importlib
+import json
+import logging
+import os
+import uuid
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.signature import SignatureVerifier
+from slack_sdk.web.async_client import AsyncWebClient
+
+# The scheduler thread bot.py starts runs this module's jobs, which post with AsyncWebClient
+os.environ['SCHEDULER_JOBS_MODULE'] = 'asgi_app'
+
+import bot  # noqa: E402
+import metrics  # noqa: E402
+import slack_setup  # noqa: E402
+from log_setup import event_context  # noqa: E402
+from outbox import failure_reason  # noqa: E402
+from replay_cache import event_id_from_body  # noqa: E402
+from slack_poster import AsyncSlackPoster  # noqa: E402
+
+logger = logging.getLogger(__name__)
+metrics.prune()  # uvicorn has no gunicorn master to clear earlier runs' metrics (see metrics.py)
+
+signature_verifier = SignatureVerifier(bot.SLACK_SIGNING_SECRET or "")
+# No slack_sdk retries: they would resend a post after a dropped connection (see slack_poster.py)
+async_client = AsyncWebClient(token=slack_setup.SLACK_BOT_TOKEN, base_url=slack_setup.SLACK_API_URL, retry_handlers=[])
+async_poster = AsyncSlackPoster(async_client)
+background_tasks = set()  # Keep references so running tasks aren't garbage collected
+event_loop = None  # The loop serving the app, once lifespan startup has run; scheduled jobs run on it
+
+
+# Run a coroutine in the background, logging anything it raises
+def spawn(coroutine):
+    task = asyncio.get_running_loop().create_task(coroutine)
+    background_tasks.add(task)
+
+    def finished(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Background task failed: %r", task.exception())
+
+    task.add_done_callback(finished)
+    return task
+
+
+# Send the never-attempted outbox records with these keys (see outbox.py), concurrently
+# or fanned out `concurrency` at a time; returns {key: response or exception}
+# Unsure records are never claimed by key, so they are left to the outbox's drainer thread,
+# which checks the channel before resending.
+async def deliver(keys, concurrency=1):
+    records = await asyncio.to_thread(slack_setup.outbox.claim, keys)
+    if not records:
+        return {}
+
+    async def send(record):
+        try:
+            return await async_poster.call_once(record.method, **slack_setup.outbox.send_arguments(record))
+        except (SlackApiError, *async_poster.transport_errors) as e:
+            return e
+
+    await asyncio.to_thread(slack_setup.outbox.mark_sending, records)  # All of them go out at once
+    if concurrency > 1 and len({record.method for record in records}) == 1:
+        responses = await async_poster.call_many(
+            records[0].method, [slack_setup.outbox.send_arguments(record) for record in records], concurrency, retry_server_errors=False
+        )
+    else:
+        responses = await asyncio.gather(*(send(record) for record in records))
+    await asyncio.to_thread(slack_setup.outbox.settle_many, list(zip(records, responses)))
+    return {record.key: response for record, response in zip(records, responses)}
+
+
+# Send recorded onboarding DMs (see bot.send_direct_onboarding_messages)
+async def send_direct_onboarding_messages(posts, batch_id):
+    results = await deliver([post["key"] for post in posts.values()], bot.ONBOARDING_DM_CONCURRENCY)
+
+    retry = []
+    sent = 0
+    for user_id, post in posts.items():
+        result = results.get(post["key"])
+        channel_id = post["arguments"]["channel"]
+        if result is None:
+            continue
+        if not isinstance(result, Exception):
+            sent += 1
+            if channel_id == user_id and result.get("channel") not in (None, user_id):
+                await asyncio.to_thread(bot.dm_channel_cache.set, user_id, result["channel"])
+        elif channel_id != user_id and isinstance(result, SlackApiError) and result.response['error'] in bot.STALE_DM_ERRORS:
+            await asyncio.to_thread(bot.dm_channel_cache.invalidate, user_id)
+            retry.append(user_id)
+        else:
+            logger.error("Error sending onboarding message to user %s: %s", user_id, failure_reason(result))
+    logger.info("Onboarding messages sent to %d of %d users", sent, len(posts))
+    if retry:
+        retry_posts = await asyncio.to_thread(bot.onboarding_posts, retry, batch_id)
+        await asyncio.to_thread(slack_setup.outbox.enqueue_many, retry_posts.values())
+        await send_direct_onboarding_messages(retry_posts, batch_id)
+
+
+# Welcome posts, then the onboarding DMs, all recorded in the outbox first (see bot.welcome_users)
+async def welcome_users(user_ids, batch_id=None):
+    batch_id = batch_id or uuid.uuid4().hex
+    welcomes = bot.welcome_posts(user_ids, batch_id)
+    direct_messages = await asyncio.to_thread(bot.onboarding_posts, user_ids, batch_id)
+    await asyncio.to_thread(slack_setup.outbox.enqueue_many, [post for _, post in welcomes] + list(direct_messages.values()))
+
+    results = await deliver([post["key"] for _, post in welcomes])
+    for group, post in welcomes:
+        result = results.get(post["key"])
+        if isinstance(result, Exception):
+            logger.error("Error sending welcome message to %d users in channel %s: %s", len(group), bot.MEMBER_LOG_ID, failure_reason(result))
+        elif result is not None:
+            logger.info("Welcome message sent to %d users in channel %s", len(group), bot.MEMBER_LOG_ID)
+    await send_direct_onboarding_messages(direct_messages, batch_id)
+
+
+# Welcome everyone who joined during the batch window
+async def flush_welcome_batch():
+    await asyncio.sleep(bot.WELCOME_BATCH_SECONDS)
+    await welcome_users(await asyncio.to_thread(bot.welcome_batch.take))
+
+
+# Handle user joining the channel; the welcome and the DM go out right away, or batched
+# with other joins (see bot.WELCOME_BATCH_SECONDS)
+async def handle_member_joined(event_data):
+    logger.info("Received member_joined_channel event", extra={"sampled": True, "event": event_data['event']})
+    # The state store may do file or network I/O, so keep it off the event loop
+    user_id = await asyncio.to_thread(bot.claim_welcome, event_data)
+    if user_id and bot.WELCOME_BATCH_SECONDS > 0:
+        if await asyncio.to_thread(bot.welcome_batch.add, user_id):
+            spawn(flush_welcome_batch())
+    elif user_id:
+        await welcome_users([user_id], event_data.get('event_id'))
+
+
+# Handle user leaving the channel
+async def handle_member_left(event_data):
+    await asyncio.to_thread(bot.handle_member_left, event_data)
+
+
+EVENT_HANDLERS = {
+    "member_joined_channel": handle_member_joined,
+    "member_left_channel": handle_member_left,
+}
+
+
+# jobs.py pulls in the scrapers, so it's imported on first use, and off the event loop
+async def load_jobs():
+    return await asyncio.to_thread(importlib.import_module, "jobs")
+
+
+# Record the posts in the outbox, then send them concurrently (the poster still keeps to
+# Slack's limits), logging any that failed; the async counterpart of jobs.post_through_outbox
+async def post_through_outbox(posts, error_message):
+    await asyncio.to_thread(slack_setup.outbox.enqueue_many, posts)
+    for result in (await deliver([post["key"] for post in posts])).values():
+        if isinstance(result, Exception):
+            logger.error(error_message, failure_reason(result))
+
+
+# The scheduled jobs: selecting what to post is shared with jobs.py and runs on a thread,
+# and the posts are sent from the event loop
+async def news_weekly_job():
+    jobs = await load_jobs()
+    with jobs.JOB_SECONDS.time(job="news_weekly"):
+        articles = await asyncio.to_thread(jobs.select_news_articles)  # Fetches every site on its own thread pool
+        if jobs.NEWS_DIGEST:
+            await post_through_outbox([jobs.digest_post(jobs.compile_news_digest(articles))], "Error posting news digest to Slack: %s")
+        else:
+            await post_through_outbox(jobs.news_posts(jobs.compile_news_weekly(articles)), "Error posting message to Slack: %s")
+        logger.info("Slack posting: %s", async_poster.stats())
+
+
+async def daily_meme_job():
+    jobs = await load_jobs()
+    with jobs.JOB_SECONDS.time(job="daily_memes"):
+        memes = await asyncio.to_thread(jobs.select_memes)
+        await post_through_outbox([jobs.meme_post(meme) for meme in memes], "Error posting meme to Slack: %s")
+
+
+# Run a job coroutine on the app's event loop and wait for it to finish
+# Called from the scheduler's thread, which has no loop of its own; without a lifespan
+# startup (uvicorn --lifespan off) the job gets a loop on that thread instead.
+def run_scheduled(job):
+    if event_loop is None:
+        return asyncio.run(job())
+    return asyncio.run_coroutine_threadsafe(job(), event_loop).result()
+
+
+# What scheduler.py runs under uvicorn (see SCHEDULER_JOBS_MODULE above)
+def run_news_weekly_job():
+    run_scheduled(news_weekly_job)
+
+
+def run_daily_meme_job():
+    run_scheduled(daily_meme_job)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status, body=b"", content_type=b"text/plain", extra_headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode()), *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Check the request timestamp and HMAC signature Slack sends with every request
+def is_signed_by_slack(body, headers):
+    timestamp = headers.get("x-slack-request-timestamp")
+    signature = headers.get("x-slack-signature")
+    if not timestamp or not signature:
+        return False
+    try:
+        return signature_verifier.is_valid(body, timestamp, signature)
+    except ValueError:  # Timestamp isn't a number
+        return False
+
+
+# Verify, parse and ack a Slack Events API request, then handle it in the background
+async def slack_events(scope, receive, send):
+    body = await read_body(receive)
+    headers = {key.decode().lower(): value.decode() for key, value in scope["headers"]}
+
+    # A retry of an event already acked here is acked before any other work (see bot.absorb_retry)
+    event_id = event_id_from_body(body)
+    if bot.absorb_retry(event_id, headers.get("x-slack-retry-reason")):
+        await respond(send, 200, extra_headers=[(b"x-slack-no-retry", b"1")])
+        return
+
+    if not is_signed_by_slack(body, headers):
+        await respond(send, 403)
+        return
+
+    event_data = json.loads(body)
+
+    # Echo the URL verification challenge code back to Slack
+    if "challenge" in event_data:
+        await respond(send, 200, event_data["challenge"].encode())
+        return
+
+    handler = EVENT_HANDLERS.get(event_data.get("event", {}).get("type"))
+    if handler:
+        with event_context(event_data):  # The task copies the context, so its records carry the event's IDs
+            spawn(handler(event_data))
+    await respond(send, 200)
+    if event_id:
+        bot.replay_cache.add(event_id)
+
+
+# ASGI application
+async def app(scope, receive, send):
+    global event_loop
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                event_loop = asyncio.get_running_loop()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Let in-flight Slack calls finish before the process exits
+                if background_tasks:
+                    await asyncio.wait(background_tasks, timeout=10)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/slack/events" and scope["method"] == "POST":
+        await slack_events(scope, receive, send)
+    elif scope["path"] == "/" and scope["method"] == "GET":
+        await respond(send, 200, b"Your app is running!")
+    elif scope["path"] == "/metrics" and scope["method"] == "GET" and metrics.METRICS_ENABLED:
+        body = await asyncio.to_thread(metrics.render)
+        await respond(send, 200, body.encode(), b"text/plain; version=0.0.4")
+    else:
+        await respond(send, 404)
@@ -0,0 +1,107 @@
+# Benchmark: single-pass headline extraction vs the old BeautifulSoup find_previous loop
+# Usage: python benchmarks/bench_extractor.py [page.html ...]
+# With no arguments it runs on the saved pages in benchmarks/fixtures/*.html, plus a
+# generated magazine-style front page. Each extractor's output is checked against the
+# old loop before timing. Then CSS and XPath selector profiles (site_profiles.py), which
+# stop at the first page prefix holding `limit` complete items, are timed against parsing
+# the whole page, and must scrape the same articles.
+import glob
+import os
+import sys
+import time
+from urllib.parse import urljoin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+import extractor  # noqa: E402
+import site_profiles  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASE_URL = "https://www.example.com/"
+REPEAT = 5
+SELECTORS = {
+    "css": {"type": "css", "item": "article", "title": "h3", "link": "a[href]", "image": "img"},
+    "xpath": {"type": "xpath", "item": "//article", "title": ".//h3", "link": ".//a/@href", "image": ".//img"},
+}
+
+
+# The pre-extractor implementation of find_articles' parsing loop, kept for comparison
+def old_extract(html, url, limit=4):
+    articles = []
+    soup = BeautifulSoup(html, 'html.parser')
+    articles_scraped = 0
+    for articleTag in soup.find_all(['h2', 'h3']):
+        if articles_scraped >= limit:
+            break
+        headlineTag = articleTag.get_text(strip=True)
+        linkTag = articleTag.find_parent('a')
+        imageTag = articleTag.find_previous('img')
+        if headlineTag and linkTag:
+            image_url = None
+            if imageTag and 'src' in imageTag.attrs:
+                image_url = urljoin(url, imageTag['src'])
+            articles.append({'title': headlineTag, 'link': urljoin(url, linkTag['href']), 'image_url': image_url})
+        articles_scraped += 1
+    return articles
+
+
+# A large front page: navigation, a long promo block, then article cards
+def generated_page(cards=400, nav_links=300, promos=None):
+    parts = ["<html><head><title>Front page</title></head><body><nav>"]
+    parts += [f'<a href="/section/{i}">Section {i}</a>' for i in range(nav_links)]
+    parts.append("</nav><main>")
+    parts += [f'<div class="promo"><img src="/promo/{i}.jpg"><p>Promo text {i}</p></div>' for i in range(cards if promos is None else promos)]
+    for i in range(cards):
+        parts.append(
+            f'<article><img src="/img/{i}.jpg" alt=""><a href="/news/{i}">'
+            f'<h3> Headline <b>number</b> {i} </h3></a><p>Summary {i}</p></article>'
+        )
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+def timed(func, *args, **kwargs):
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(paths):
+    pages = [(os.path.basename(path), open(path, encoding="utf-8", errors="replace").read()) for path in paths]
+    pages.append(("generated", generated_page()))
+    parsers = ["html.parser"] + (["lxml"] if extractor.etree is not None else [])
+
+    print(f"{'page':<24}{'KiB':>8}{'old (ms)':>12}" + "".join(f"{p + ' (ms)':>20}" for p in parsers))
+    for name, html in pages:
+        old_time, expected = timed(old_extract, html, BASE_URL)
+        row = f"{name:<24}{len(html) / 1024:>8.0f}{old_time * 1000:>12.2f}"
+        for parser in parsers:
+            new_time, result = timed(extractor.extract_articles, html, BASE_URL, parser=parser)
+            flag = "" if result == expected else " !"
+            row += f"{new_time * 1000:>11.2f} ({old_time / new_time:>4.0f}x){flag}"
+        print(row)
+    print("! = output differs from the old loop")
+
+    print(f"\n{'selectors':<24}{'KiB':>8}{'whole (ms)':>12}{'prefix (ms)':>14}")
+    html = generated_page(cards=2000, promos=100)  # Articles from about 18 KiB in
+    prefix_size = site_profiles.PREFIX_SIZE
+    for kind, spec in SELECTORS.items():
+        if kind == "xpath" and extractor.etree is None:
+            continue
+        for parser in parsers:
+            profile = site_profiles.compile_profile({"name": kind, "url": BASE_URL, "parser": parser, "selectors": spec})
+            site_profiles.PREFIX_SIZE = len(html)
+            whole_time, expected = timed(site_profiles.extract_site, profile, html)
+            site_profiles.PREFIX_SIZE = prefix_size
+            prefix_time, result = timed(site_profiles.extract_site, profile, html)
+            flag = "" if result == expected else " !"
+            print(f"{f'{kind}, {parser}':<24}{len(html) / 1024:>8.0f}{whole_time * 1000:>12.2f}{prefix_time * 1000:>14.2f}{flag}")
+    print("! = output differs from parsing the whole page")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))))
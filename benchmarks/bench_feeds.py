@@ -0,0 +1,130 @@
+# Benchmark: reading a site's stories from its RSS feed vs scraping its front page
+# Usage: python benchmarks/bench_feeds.py [--stories 60] [--limit 20] [--page-kb 900]
+# Generates a front page shaped like a modern news site (a large inline hydration script
+# and stylesheet, then story cards with srcsets and bylines) and an RSS feed of the same
+# stories with descriptions and full content, then for `limit` stories compares the bytes
+# each path pulls from the stream before stopping and the CPU time spent parsing.
+# It then streams generated feeds of 1k to 100k items through the feed parser without
+# stopping early, to check memory stays flat as the feed grows.
+import argparse
+import os
+import resource
+import sys
+import time
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extractor  # noqa: E402
+import feed_parser  # noqa: E402
+
+CHUNK = 16 * 1024  # news_fetcher.STREAM_CHUNK_SIZE
+REPEAT = 5
+BODY = "The company says the change rolls out over the coming weeks. Early reviews point to better battery life and a few rough edges. "
+
+
+def build_page(stories, page_bytes):
+    head = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Tech news</title><style>']
+    head.append(".card{display:flex;margin:0 0 1rem}" * 600)
+    head.append('</style><script id="__APP_DATA__" type="application/json">')
+    blob = '{"id":123456,"slot":"ad-top","targeting":{"section":"news","tags":["phones","laptops"]}},'
+    head.append("[" + blob * max(0, (page_bytes // 2) // len(blob)) + "{}]")
+    head.append('</script></head><body><header><nav>' + '<a href="/section">Section</a>' * 80 + '</nav></header><main>')
+    cards = []
+    for i in range(stories):
+        cards.append(
+            f'<article class="card"><a href="/news/story-{i}"><picture><source srcset="/img/{i}-320.webp 320w, /img/{i}-640.webp 640w, /img/{i}-1280.webp 1280w">'
+            f'<img src="/img/{i}.jpg" alt="" loading="lazy" width="640" height="360"></picture><h3>Story number {i} about phones and laptops</h3></a>'
+            f'<p class="byline">By Staff Writer · <time datetime="2024-03-18">March 18</time></p><p class="synopsis">{BODY}</p></article>'
+        )
+    page = "".join(head + cards) + "</main><footer>" + '<a href="/about">About</a>' * 200 + "</footer></body></html>"
+    return page.encode()
+
+
+def feed_item(i):
+    return (
+        f'<item><title><![CDATA[Story number {i} about phones and laptops]]></title><link>https://www.example.com/news/story-{i}</link>'
+        f'<guid isPermaLink="false">story-{i}</guid><description><![CDATA[{BODY}]]></description>'
+        f'<content:encoded><![CDATA[<p>{BODY * 4}</p>]]></content:encoded><pubDate>{formatdate(1710770000 - i * 3600)}</pubDate>'
+        f'<media:content type="image/jpeg" url="https://www.example.com/img/{i}.jpg" medium="image"/></item>'
+    )
+
+
+FEED_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/" '
+    'xmlns:content="http://purl.org/rss/1.0/modules/content/"><channel><title>Tech news</title><link>https://www.example.com</link>'
+)
+
+
+def build_feed(stories):
+    return (FEED_HEAD + "".join(feed_item(i) for i in range(stories)) + "</channel></rss>").encode()
+
+
+# Yields the feed in CHUNK-sized pieces as it's generated, so it's never held in memory
+def generate_feed_chunks(items):
+    buffer = FEED_HEAD
+    for i in range(items):
+        buffer += feed_item(i)
+        if len(buffer) >= CHUNK:
+            yield buffer.encode()
+            buffer = ""
+    yield (buffer + "</channel></rss>").encode()
+
+
+def counted_chunks(data, counter):
+    for start in range(0, len(data), CHUNK):
+        counter[0] += min(CHUNK, len(data) - start)
+        yield data[start:start + CHUNK]
+
+
+# (bytes pulled from the stream, best CPU seconds, stories found)
+def measure(extract, data):
+    best = None
+    for _ in range(REPEAT):
+        pulled = [0]
+        started = time.process_time()
+        articles = extract(counted_chunks(data, pulled))
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return pulled[0], best, len(articles)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stories", type=int, default=60, help="stories on the page and in the feed")
+    parser.add_argument("--limit", type=int, default=20, help="stories to read, like a site profile's limit")
+    parser.add_argument("--page-kb", type=int, default=900, help="approximate front page size")
+    args = parser.parse_args()
+
+    page = build_page(args.stories, args.page_kb * 1024)
+    feed = build_feed(args.stories)
+    print(f"Front page {len(page) / 1024:.0f} KB, feed {len(feed) / 1024:.0f} KB, reading {args.limit} stories")
+    html = measure(lambda chunks: extractor.extract_articles_from_chunks(chunks, "https://www.example.com/", args.limit), page)
+    rss = measure(lambda chunks: feed_parser.extract_feed_from_chunks(chunks, "https://www.example.com/", args.limit), feed)
+    print(f"{'':>12}  {'KB pulled':>9}  {'CPU ms':>7}  stories")
+    for name, (pulled, cpu, found) in (("html scrape", html), ("feed", rss)):
+        print(f"{name:>12}  {pulled / 1024:>9.0f}  {cpu * 1000:>7.2f}  {found:>7}")
+    print(f"Feed reads {html[0] / rss[0]:.1f}x fewer bytes and uses {html[1] / rss[1]:.1f}x less CPU")
+
+    # Stories are counted and dropped as they come out, so only the parser's own memory shows
+    print("\nWhole feed, streamed through the parser (peak RSS should stay flat):")
+    baseline = max_rss_mb()
+    for items in (1_000, 10_000, 100_000):
+        reader = feed_parser.FeedExtractor("https://www.example.com/", limit=float("inf"))
+        found, size = 0, 0
+        started = time.perf_counter()
+        for chunk in generate_feed_chunks(items):
+            size += len(chunk)
+            reader.feed(chunk)
+            found += len(reader.articles)
+            reader.articles.clear()
+        found += len(reader.close())
+        print(f"{found:>8} items  {size / 1024 / 1024:>6.1f} MB feed  {time.perf_counter() - started:>6.2f}s  peak RSS +{max_rss_mb() - baseline:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
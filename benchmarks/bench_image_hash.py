@@ -0,0 +1,128 @@
+# Benchmark: perceptual hashing throughput and near-duplicate lookup latency
+# Usage: python benchmarks/bench_image_hash.py [images ...]
+# Hashes generated JPEG/PNG memes (or the given image files) one at a time and as one
+# batch, then times multi-index hash table lookups against a linear scan at 10k and 100k stored hashes.
+# Also checks that re-encoded and resized copies land within the match distance.
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_hash  # noqa: E402
+
+if not image_hash.AVAILABLE:
+    sys.exit("This benchmark needs NumPy and Pillow")
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+GENERATED_IMAGES = 200
+LOOKUPS = 1000
+INDEX_SIZES = (10_000, 100_000)
+
+
+# A smooth random "meme": blurred noise with a few blocks, like a captioned picture
+def generate_image(rng, size=(640, 480)):
+    noise = rng.integers(0, 256, (size[1] // 32, size[0] // 32, 3), dtype=np.uint8)
+    image = Image.fromarray(noise).resize(size, Image.BICUBIC)
+    pixels = np.asarray(image).copy()
+    for _ in range(3):
+        x, y = rng.integers(0, size[0] - 100), rng.integers(0, size[1] - 40)
+        pixels[y:y + 40, x:x + 100] = rng.integers(0, 256, 3)
+    return Image.fromarray(pixels)
+
+
+def encode(image, format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def load_images(paths):
+    if paths:
+        return [open(path, "rb").read() for path in paths]
+    rng = np.random.default_rng(1)
+    return [encode(generate_image(rng), "JPEG" if i % 2 else "PNG") for i in range(GENERATED_IMAGES)]
+
+
+def bench_hashing(images):
+    start = time.perf_counter()
+    for data in images:
+        image_hash.dhash(data)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    thumbnails = [image_hash._thumbnail(data) for data in images]
+    decode = time.perf_counter() - start
+    start = time.perf_counter()
+    image_hash.dhash_many(thumbnails)
+    batch = time.perf_counter() - start
+
+    print(f"{len(images)} images ({sum(map(len, images)) // 1024} KiB)")
+    print(f"  one at a time:   {len(images) / single:10.0f} hashes/s")
+    print(f"  decode + shrink: {len(images) / decode:10.0f} images/s")
+    print(f"  batch dHash:     {len(images) / batch:10.0f} hashes/s (after decoding)")
+
+
+# Re-encoded and resized copies should match; unrelated images shouldn't
+def check_matching():
+    rng = np.random.default_rng(2)
+    original = generate_image(rng)
+    base = image_hash.dhash(encode(original, "PNG"))
+    copies = {
+        "JPEG q=40": encode(original, "JPEG", quality=40),
+        "resized 50%": encode(original.resize((320, 240)), "PNG"),
+        "resized 150% JPEG": encode(original.resize((960, 720)), "JPEG", quality=75),
+    }
+    for name, data in copies.items():
+        print(f"  {name:18} distance {image_hash.hamming(base, image_hash.dhash(data))}")
+    unrelated = [image_hash.hamming(base, image_hash.dhash(encode(generate_image(rng), "PNG"))) for _ in range(20)]
+    print(f"  unrelated images   distance >= {min(unrelated)} (match threshold {image_hash.DEFAULT_MAX_DISTANCE})")
+
+
+def bench_lookup(size):
+    rng = random.Random(size)
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    table = image_hash.HashTable(image_hash.DEFAULT_MAX_DISTANCE)
+    start = time.perf_counter()
+    for i, value in enumerate(hashes):
+        table.add(value, i)
+    build = time.perf_counter() - start
+
+    # Half the queries are near copies of stored hashes, half are new images
+    queries = []
+    for i in range(LOOKUPS):
+        if i % 2:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), 3):
+                value ^= 1 << bit
+            queries.append(value)
+        else:
+            queries.append(rng.getrandbits(64))
+
+    radius = image_hash.DEFAULT_MAX_DISTANCE
+    start = time.perf_counter()
+    table_results = [table.find(query) is not None for query in queries]
+    table_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_results = [any(image_hash.hamming(query, value) <= radius for value in hashes) for query in queries]
+    scan_time = time.perf_counter() - start
+
+    assert table_results == scan_results, "Hash table and linear scan disagree"
+    print(
+        f"{size:>7} hashes: build {build:6.2f}s, "
+        f"hash table {table_time / LOOKUPS * 1e6:8.0f} us/lookup, "
+        f"linear scan {scan_time / LOOKUPS * 1e6:8.0f} us/lookup"
+    )
+
+
+if __name__ == "__main__":
+    bench_hashing(load_images(sys.argv[1:]))
+    print("Matching:")
+    check_matching()
+    for size in INDEX_SIZES:
+        bench_lookup(size)
@@ -0,0 +1,247 @@
+# Benchmark: cost of recording outbound posts in the outbox, and exactly-once delivery across crashes
+# Usage: python benchmarks/bench_outbox.py [--messages 2000] [--crashes 5] [--post-errors 100]
+# 1. Enqueue cost per message, on a real file with an fsync per commit: one post per
+#    enqueue from one thread (a commit each), from many threads at once (group commit),
+#    and enqueue_many() batches like the news job's.
+# 2. Outbox overhead per delivered message (enqueue, claim, settle) against a poster that
+#    answers instantly, so only the outbox's own work is timed.
+# 3. Crash test: a child process records posts and sends them to benchmarks/fake_slack.py
+#    and is killed with SIGKILL part way through, then a fresh outbox drains what's left.
+#    Every post must land in Slack exactly once.
+# 4. Faults after posting: the fake Slack posts a share of messages and then answers with
+#    HTTP 500 or drops the connection. The outbox must find those in the channel history
+#    rather than resend them, and without the history scopes it must fail them, not resend.
+import argparse
+import logging
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_slack  # noqa: E402
+import outbox  # noqa: E402
+
+THREAD_COUNTS = (1, 8, 32)
+BATCH_SIZES = (7, 100)
+CRASH_POSTS = 200
+CRASH_LEASE = 1.0  # Seconds, so the test doesn't wait the default ten minutes
+POST_ERROR_RATE = 0.1
+POST_ERROR_BACKOFF = 0.2  # Seconds before a post that got a 500 is checked, instead of a minute
+
+
+# Answers every call at once, as Slack would if it took no time
+class InstantPoster:
+    def call(self, method, **kwargs):
+        return {"ok": True, "channel": kwargs.get("channel"), "ts": "1.000000"}
+
+    call_once = call
+
+    def call_many(self, method, calls, concurrency=8, retry_server_errors=True):
+        return [self.call(method, **kwargs) for kwargs in calls]
+
+
+def posts(prefix, count):
+    return [outbox.chat_post(f"{prefix}:{i}", f"C{i % 50}", text=f"Message {i}", attachments=[]) for i in range(count)]
+
+
+def fresh_outbox(workdir, name, poster=None):
+    return outbox.Outbox(os.path.join(workdir, name + ".db"), poster or InstantPoster())
+
+
+# Each of `threads` threads enqueues its share of the posts one at a time; returns (seconds, commits)
+def enqueue_one_at_a_time(box, all_posts, threads):
+    shares = [all_posts[i::threads] for i in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def run(share):
+        barrier.wait()
+        for post in share:
+            box.enqueue_many([post])
+
+    workers = [threading.Thread(target=run, args=(share,)) for share in shares]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started, box.commits
+
+
+def bench_enqueue(workdir, messages):
+    print(f"Enqueue, {messages} messages, fsync per commit")
+    print(f"{'':>26}  {'us/msg':>8}  {'msgs/commit':>11}")
+    for threads in THREAD_COUNTS:
+        box = fresh_outbox(workdir, f"threads{threads}")
+        seconds, commits = enqueue_one_at_a_time(box, posts("t", messages), threads)
+        print(f"{f'{threads} thread(s), 1 per call':>26}  {seconds / messages * 1e6:>8.1f}  {messages / commits:>11.1f}")
+    for size in BATCH_SIZES:
+        box = fresh_outbox(workdir, f"batch{size}")
+        batch = posts("b", messages)
+        started = time.perf_counter()
+        for start in range(0, messages, size):
+            box.enqueue_many(batch[start:start + size])
+        seconds = time.perf_counter() - started
+        print(f"{f'enqueue_many({size})':>26}  {seconds / messages * 1e6:>8.1f}  {messages / box.commits:>11.1f}")
+
+
+def bench_delivery(workdir, messages):
+    print("\nOutbox overhead per delivered message (enqueue + claim + send + settle, instant Slack)")
+    print(f"{'':>26}  {'us/msg':>8}")
+    for size, concurrency in ((7, 1), (100, 8)):
+        box = fresh_outbox(workdir, f"deliver{size}")
+        batch = posts("d", messages)
+        started = time.perf_counter()
+        for start in range(0, messages, size):
+            group = batch[start:start + size]
+            box.enqueue_many(group)
+            box.deliver([post["key"] for post in group], concurrency)
+        seconds = time.perf_counter() - started
+        if box.sent != messages:
+            sys.exit(f"Only {box.sent} of {messages} delivered")
+        label = f"batches of {size}" + (", fanned out" if concurrency > 1 else "")
+        print(f"{label:>26}  {seconds / messages * 1e6:>8.1f}")
+
+
+# Child: record CRASH_POSTS posts, one per channel so Slack's per-channel limit doesn't
+# pace them, and send them one by one until killed
+def crash_child(slack_url, path):
+    from slack_sdk import WebClient
+    from slack_poster import SlackPoster
+
+    box = outbox.Outbox(path, SlackPoster(WebClient(token="xoxb-bench", base_url=slack_url, retry_handlers=[])), lease=CRASH_LEASE)
+    batch = [outbox.chat_post(f"crash:{i}", f"C{i}", text=f"Crash test {i}") for i in range(CRASH_POSTS)]
+    box.enqueue_many(batch)
+    print("recorded", flush=True)
+    box.deliver([post["key"] for post in batch])
+
+
+# Messages per outbox key, from the metadata of everything the fake Slack has
+def posted_keys(fake):
+    with fake.lock:
+        messages = [message for channel in fake.messages.values() for message in channel]
+    return Counter(message.get("metadata", {}).get("event_payload", {}).get("key") for message in messages)
+
+
+def bench_crashes(workdir, crashes):
+    from slack_sdk import WebClient
+    from slack_poster import SlackPoster
+
+    print(f"\nCrash test: {CRASH_POSTS} posts, child killed part way, then drained by a new process")
+    print(f"{'run':>4}  {'sent before kill':>16}  {'recovered':>9}  {'sent by drainer':>15}  {'posted once':>11}  {'duplicates':>10}  {'missing':>7}")
+    rng = random.Random(7)
+    failures = 0
+    for run in range(crashes):
+        fake = fake_slack.FakeSlack(latency=0.01, jitter=0.5, seed=run)
+        server, url = fake_slack.serve(fake)
+        path = os.path.join(workdir, f"crash{run}.db")
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--crash-child", url, path], stdout=subprocess.PIPE, text=True)
+        child.stdout.readline()  # "recorded": every post is in the outbox
+        time.sleep(rng.uniform(0.2, 1.5))
+        child.send_signal(signal.SIGKILL)
+        child.wait()
+        time.sleep(0.1)  # Let a request the child was making finish on the fake
+        before = sum(posted_keys(fake).values())
+
+        box = outbox.Outbox(path, SlackPoster(WebClient(token="xoxb-bench", base_url=url, retry_handlers=[])), handoff=0)
+        time.sleep(CRASH_LEASE)  # The child's lease on its last record runs out
+        while box.drain():
+            pass
+        counts = posted_keys(fake)
+        once = sum(1 for i in range(CRASH_POSTS) if counts[f"crash:{i}"] == 1)
+        duplicates = sum(count - 1 for count in counts.values() if count > 1)
+        missing = sum(1 for i in range(CRASH_POSTS) if not counts[f"crash:{i}"])
+        failures += duplicates + missing
+        print(f"{run:>4}  {before:>16}  {box.recovered:>9}  {box.sent - box.recovered:>15}  {once:>11}  {duplicates:>10}  {missing:>7}")
+        server.shutdown()
+    if failures:
+        sys.exit("Crash test failed: posts were duplicated or lost")
+
+
+# Record `count` posts to a fake Slack with `faults`, send each once, half one at a time and
+# half fanned out, then run the drainer until nothing is left; returns (fake, outbox)
+def send_with_faults(workdir, name, count, **faults):
+    from slack_sdk import WebClient
+    from slack_poster import SlackPoster
+
+    fake = fake_slack.FakeSlack(latency=0.005, jitter=0.5, seed=11, **faults)
+    server, url = fake_slack.serve(fake)
+    box = outbox.Outbox(
+        os.path.join(workdir, name + ".db"), SlackPoster(WebClient(token="xoxb-bench", base_url=url, retry_handlers=[])),
+        handoff=0, retry_backoff=POST_ERROR_BACKOFF
+    )
+    batch = [outbox.chat_post(f"{name}:{i}", f"C{i}", text=f"Fault test {i}") for i in range(count)]
+    box.enqueue_many(batch)
+    half = count // 2
+    box.deliver([post["key"] for post in batch[:half]])
+    box.deliver([post["key"] for post in batch[half:]], concurrency=8)
+    deadline = time.monotonic() + 120
+    while box.stats()["pending"] + box.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(POST_ERROR_BACKOFF)
+        box.drain()
+    server.shutdown()
+    return fake, box
+
+
+def duplicates_and_missing(fake, name, count):
+    counts = posted_keys(fake)
+    duplicates = sum(n - 1 for n in counts.values() if n > 1)
+    missing = sum(1 for i in range(count) if not counts[f"{name}:{i}"])
+    return duplicates, missing
+
+
+# Slack posts a share of messages and then answers with a 500 or drops the connection. The
+# outbox must find those in the channel history rather than resend them.
+def bench_post_errors(workdir, count):
+    print(f"\nFaults after posting: {count} posts, {POST_ERROR_RATE:.0%} answered with 500 and {POST_ERROR_RATE:.0%} dropped after being posted")
+    fake, box = send_with_faults(workdir, "error", count, post_error_rate=POST_ERROR_RATE, post_drop_rate=POST_ERROR_RATE)
+    duplicates, missing = duplicates_and_missing(fake, "error", count)
+    print(f"{'posted then 500':>16}  {'posted then dropped':>19}  {'recovered':>9}  {'duplicates':>10}  {'missing':>7}")
+    print(f"{fake.faults['posted_then_failed']:>16}  {fake.faults['posted_then_dropped']:>19}  {box.recovered:>9}  {duplicates:>10}  {missing:>7}")
+    if duplicates or missing:
+        sys.exit("Server error test failed: posts were duplicated or lost")
+
+    # Without the history scopes an unsure post can't be looked up, so it must be failed, not resent
+    print("\nSame, with conversations.history failing with missing_scope")
+    logging.getLogger("outbox").setLevel(logging.CRITICAL)  # Giving up on every unsure post is expected here
+    fake, box = send_with_faults(workdir, "scope", count, post_error_rate=POST_ERROR_RATE, post_drop_rate=POST_ERROR_RATE, history_error="missing_scope")
+    duplicates, missing = duplicates_and_missing(fake, "scope", count)
+    unsure = fake.faults["posted_then_failed"] + fake.faults["posted_then_dropped"]
+    print(f"{'unsure':>16}  {'unchecked':>9}  {'failed':>6}  {'duplicates':>10}  {'missing':>7}")
+    print(f"{unsure:>16}  {box.unchecked:>9}  {box.failed:>6}  {duplicates:>10}  {missing:>7}")
+    if duplicates or missing or box.failed != unsure:
+        sys.exit("Missing scope test failed: unsure posts were resent or failed posts were lost")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--crashes", type=int, default=5)
+    parser.add_argument("--post-errors", type=int, default=100, help="posts in the server error test")
+    parser.add_argument("--crash-child", nargs=2, metavar=("SLACK_URL", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.crash_child:
+        crash_child(*args.crash_child)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench_outbox_", dir=os.getcwd())  # A real disk, so fsyncs cost what they would
+    try:
+        bench_enqueue(workdir, args.messages)
+        bench_delivery(workdir, args.messages)
+        bench_crashes(workdir, args.crashes)
+        bench_post_errors(workdir, args.post_errors)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
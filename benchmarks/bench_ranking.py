@@ -0,0 +1,106 @@
+# Benchmark: news candidate ranking time as the candidate pool grows
+# Usage: python benchmarks/bench_ranking.py
+# Generates headline pools of 10 to 10k candidates from 20 sources, some with publish
+# times and some without, and times news_ranker.rank_articles against a plain-Python
+# version of the same scoring. The two must pick the same articles before anything is timed.
+import math
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import news_ranker  # noqa: E402
+
+if not news_ranker.AVAILABLE:
+    sys.exit("This benchmark needs NumPy")
+
+POOL_SIZES = (10, 100, 1_000, 10_000)
+SOURCES = 20
+LIMIT = 7
+REPEAT = 5
+FILLER = ("review", "deal", "phone", "laptop", "launch", "update", "best", "new", "week", "guide", "camera", "price", "leak", "the", "of", "for", "in")
+
+
+def generate_pool(rng, size, now):
+    terms = list(news_ranker.INTEREST_TERMS)
+    pool = []
+    for i in range(size):
+        words = rng.sample(FILLER, rng.randint(4, 9)) + rng.sample(terms, rng.choice((0, 0, 0, 1, 1, 2)))
+        rng.shuffle(words)
+        article = {'title': " ".join(words).capitalize(), 'link': f"https://example.com/{i}", 'image_url': None, 'source': f"Site{i % SOURCES}"}
+        if i % SOURCES < SOURCES // 2:  # Half the sources are feeds with publish times
+            article['published'] = now - rng.uniform(0, 14 * 24 * 60 * 60)
+        pool.append(article)
+    return pool
+
+
+# Vocabulary columns of the words and adjacent word pairs in a headline, and its word count
+def term_columns(title):
+    words = re.findall(r"[a-z0-9]+", title.lower())
+    pairs = map(" ".join, zip(words, words[1:]))
+    return [news_ranker.VOCABULARY[term] for term in (*words, *pairs) if term in news_ranker.VOCABULARY], len(words)
+
+
+# The same scoring as news_ranker, one article at a time
+def python_rank(articles, limit, now):
+    tokenized = [term_columns(article['title']) for article in articles]
+    document_frequency = [0] * len(news_ranker.VOCABULARY)
+    for columns, _ in tokenized:
+        for column in set(columns):
+            document_frequency[column] += 1
+    weights = list(news_ranker.INTEREST_TERMS.values())
+    idf = [math.log((1 + len(articles)) / (1 + df)) + 1 for df in document_frequency]
+    relevance = [sum(weights[column] * idf[column] for column in columns) / max(length, 1) for columns, length in tokenized]
+    top = max(relevance, default=0)
+    relevance = [score / top for score in relevance] if top > 0 else relevance
+
+    positions = {}
+    scores = []
+    for article, score in zip(articles, relevance):
+        position = positions.get(article['source'], 0)
+        positions[article['source']] = position + 1
+        if article.get('published') is not None:
+            recency = math.exp(-max(now - article['published'], 0) / news_ranker.RECENCY_HALF_LIFE * math.log(2))
+        else:
+            recency = math.exp(-position / news_ranker.POSITION_HALF_LIFE * math.log(2))
+        scores.append(news_ranker.RELEVANCE_WEIGHT * score + news_ranker.RECENCY_WEIGHT * recency)
+
+    picks, ranked, available = {}, [], set(range(len(articles)))
+    for _ in range(min(limit, len(articles))):
+        best = max(sorted(available), key=lambda i: scores[i] * news_ranker.DIVERSITY_DECAY ** picks.get(articles[i]['source'], 0))
+        ranked.append(articles[best])
+        available.discard(best)
+        picks[articles[best]['source']] = picks.get(articles[best]['source'], 0) + 1
+    return ranked
+
+
+def best_of(function, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    news_ranker.logger.disabled = True
+    rng = random.Random(1)
+    now = time.time()
+    print(f"{'candidates':>10}  {'numpy ms':>9}  {'python ms':>9}  speedup")
+    for size in POOL_SIZES:
+        pool = generate_pool(rng, size, now)
+        expected = [article['link'] for article in python_rank(pool, LIMIT, now)]
+        actual = [article['link'] for article in news_ranker.rank_articles(pool, LIMIT, now)]
+        if actual != expected:
+            sys.exit(f"Rankings differ at {size} candidates:\n  numpy  {actual}\n  python {expected}")
+        vectorized = best_of(lambda: news_ranker.rank_articles(pool, LIMIT, now))
+        plain = best_of(lambda: python_rank(pool, LIMIT, now))
+        print(f"{size:>10}  {vectorized * 1000:>9.2f}  {plain * 1000:>9.2f}  {plain / vectorized:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Benchmark: cold start of the web entry point
+# Usage: python benchmarks/bench_startup.py [--runs 5] [--budget-ms 400]
+# Starts fresh interpreters and measures, for `import bot` (gunicorn's bot:app):
+#   - import time as reported by `python -X importtime`
+#   - wall time from interpreter start to the first response from the Flask app
+# and checks that none of the job-only dependencies were imported. Exits non-zero when
+# the median import time is over the budget or a heavy module sneaks back in, so it can
+# run as a startup budget check in CI.
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only jobs.py, scheduler leaders and asgi_app.py should need these
+HEAVY_MODULES = ["praw", "bs4", "soupsieve", "lxml", "numpy", "PIL", "apscheduler", "sqlalchemy", "requests", "aiohttp"]
+
+FIRST_RESPONSE = """
+import sys, time
+import bot
+response = bot.app.test_client().get('/')
+assert response.status_code == 200
+print(time.perf_counter())
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env.update({
+        "RUN_SCHEDULER": "false",  # Measure the web worker itself, not the scheduler thread
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "STATE_BACKEND": env.get("STATE_BACKEND", "sqlite"),  # The default, as a deploy would run it
+        "STATE_SQLITE_PATH": env.get("STATE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "bench_startup_state.db")),
+    })
+    return env
+
+
+# Cumulative microseconds for `import <module>` from -X importtime output
+def import_time_us(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=environment(), capture_output=True, text=True, check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+        if match and match.group(2) == module:
+            return int(match.group(1))
+    raise RuntimeError(f"No importtime line for {module}")
+
+
+# Seconds from launching the interpreter to the first response, and heavy modules loaded
+def first_response():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RESPONSE.format(heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=environment(), capture_output=True, text=True, check=True,
+    )
+    lines = result.stdout.split("\n")
+    # perf_counter is system-wide on Linux, so the child's reading is comparable
+    return float(lines[0]) - started, [name for name in lines[1].split(",") if name]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 400)))
+    args = parser.parse_args()
+
+    imports = [import_time_us("bot") / 1000 for _ in range(args.runs)]
+    responses = []
+    heavy = set()
+    for _ in range(args.runs):
+        seconds, loaded = first_response()
+        responses.append(seconds * 1000)
+        heavy.update(loaded)
+
+    print(f"import bot:      median {statistics.median(imports):7.1f} ms  (min {min(imports):.1f}, max {max(imports):.1f})")
+    print(f"first response:  median {statistics.median(responses):7.1f} ms  (min {min(responses):.1f}, max {max(responses):.1f})")
+    print(f"budget:                 {args.budget_ms:7.1f} ms for import bot")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: the web entry point imported {', '.join(sorted(heavy))}")
+        failed = True
+    if statistics.median(imports) > args.budget_ms:
+        print("FAIL: import time is over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
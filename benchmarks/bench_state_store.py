@@ -0,0 +1,190 @@
+# Benchmark and correctness check for the state store backends (see state_store.py)
+# Usage: python benchmarks/bench_state_store.py [--threads 16] [--keys 500] [--redis-url redis://...]
+# For each backend (memory, sqlite, and redis against benchmarks/fake_redis.py, or a real
+# server with --redis-url) it checks what the bot relies on:
+#   claim   many threads race to claim the same keys; each key must be won exactly once
+#   take    threads append to a shared list while others take() from it; every item must
+#           be taken exactly once (for redis this goes through MULTI/EXEC)
+#   ttl     claimed and set keys must expire after their ttl, and be claimable again
+#   values  get/set/delete round trips
+#   dropped for redis against the stand-in: commands whose reply is lost after they ran.
+#           A claim must still be won exactly once, an append must not be resent (so the
+#           value is queued once), and a get is retried
+# and reports claims per second. Exits 1 if any check fails.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_redis  # noqa: E402
+import state_store  # noqa: E402
+
+TTL = 0.3  # Seconds, for the expiry check
+APPENDED_PER_THREAD = 200
+
+
+def run_threads(count, target):
+    barrier = threading.Barrier(count)
+    threads = [threading.Thread(target=lambda i=i: (barrier.wait(), target(i))) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# Every thread claims every key; returns (failures, claims per second)
+def check_claims(store, prefix, threads, keys):
+    winners = Counter()
+    lock = threading.Lock()
+
+    def claim_all(_):
+        won = [key for key in range(keys) if store.claim(f"{prefix}:claim:{key}", 60)]
+        with lock:
+            winners.update(won)
+
+    started = time.perf_counter()
+    run_threads(threads, claim_all)
+    elapsed = time.perf_counter() - started
+    failures = [f"key {key} claimed {winners[key]} times" for key in range(keys) if winners[key] != 1]
+    return failures, threads * keys / elapsed
+
+
+# Half the threads append, the other half take until the appenders are done
+def check_take(store, prefix, threads):
+    key = f"{prefix}:list"
+    appenders = max(1, threads // 2)
+    taken = Counter()
+    lock = threading.Lock()
+    appending = threading.Event()
+    appending.set()
+    finished = Counter()
+
+    def work(i):
+        if i < appenders:
+            for n in range(APPENDED_PER_THREAD):
+                store.append(key, f"{i}:{n}", 60)
+            with lock:
+                finished["appenders"] += 1
+                if finished["appenders"] == appenders:
+                    appending.clear()
+            return
+        while True:
+            still_appending = appending.is_set()
+            items = store.take(key)
+            with lock:
+                taken.update(items)
+            if not still_appending and not items:
+                return
+
+    run_threads(max(2, threads), work)
+    taken.update(store.take(key))
+    expected = {f"{i}:{n}" for i in range(appenders) for n in range(APPENDED_PER_THREAD)}
+    failures = [f"item {item} taken {count} times" for item, count in taken.items() if count != 1]
+    failures += [f"{len(expected - set(taken))} items never taken"] if expected - set(taken) else []
+    return failures
+
+
+def check_ttl(store, prefix):
+    failures = []
+    if not store.claim(f"{prefix}:ttl", TTL) or store.claim(f"{prefix}:ttl", TTL):
+        failures.append("first claim of a fresh key must win and the second lose")
+    store.set(f"{prefix}:ttl_value", "x", TTL)
+    time.sleep(TTL + 0.1)
+    if not store.claim(f"{prefix}:ttl", TTL):
+        failures.append("an expired claim must be claimable again")
+    if store.get(f"{prefix}:ttl_value") is not None:
+        failures.append("an expired value must read as None")
+    return failures
+
+
+def check_values(store, prefix):
+    failures = []
+    store.set(f"{prefix}:value", 42)
+    if store.get(f"{prefix}:value") != "42":
+        failures.append("set then get must round-trip as a string")
+    store.delete(f"{prefix}:value")
+    if store.get(f"{prefix}:value") is not None:
+        failures.append("a deleted key must read as None")
+    if store.take(f"{prefix}:empty") != []:
+        failures.append("take of an empty list must be []")
+    return failures
+
+
+# The stand-in runs each command but closes the connection instead of replying
+def check_dropped_replies(store, fake, prefix):
+    failures = []
+    fake.drop_replies = 1
+    if not store.claim(f"{prefix}:dropped_claim", 60):
+        failures.append("a claim whose reply was lost must still be won")
+    if store.claim(f"{prefix}:dropped_claim", 60):
+        failures.append("a claim won before its reply was lost must not be won again")
+
+    fake.drop_replies = 1
+    try:
+        store.append(f"{prefix}:dropped_list", "x", 60)
+        failures.append("an append whose reply was lost must raise, not be resent")
+    except (ConnectionError, OSError):
+        pass
+    if store.take(f"{prefix}:dropped_list") != ["x"]:
+        failures.append("an append whose reply was lost must be queued exactly once")
+
+    store.set(f"{prefix}:dropped_value", "y", 60)
+    fake.drop_replies = 1
+    if store.get(f"{prefix}:dropped_value") != "y":
+        failures.append("a get whose reply was lost must be retried")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--redis-url", help="check a real Redis-protocol server instead of the stand-in")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_state_store_")
+    fake = None
+    if args.redis_url:
+        redis_url = args.redis_url
+    else:
+        fake = fake_redis.FakeRedis(password="bench")
+        server, redis_url = fake_redis.serve(fake)
+        redis_url = redis_url.rsplit("/", 1)[0] + "/1"  # A password and a non-zero db, so AUTH and SELECT are sent too
+    backends = {
+        "memory": state_store.MemoryStateStore(),
+        "sqlite": state_store.SQLiteStateStore(os.path.join(workdir, "state.db")),
+        "redis": state_store.RedisStateStore(redis_url),
+    }
+    prefix = f"bench:{os.getpid()}:{time.time():.0f}"  # Fresh keys on a real server
+
+    print(f"{'backend':>8}  {'claims/s':>9}  result")
+    failed = False
+    try:
+        for name, store in backends.items():
+            failures, rate = check_claims(store, prefix, args.threads, args.keys)
+            failures += check_take(store, prefix, args.threads)
+            failures += check_ttl(store, prefix)
+            failures += check_values(store, prefix)
+            if name == "redis" and fake is not None:
+                failures += check_dropped_replies(store, fake, prefix)
+            print(f"{name:>8}  {rate:>9.0f}  {'ok' if not failures else 'FAILED'}")
+            for failure in failures[:10]:
+                print(f"{'':>8}  {failure}")
+            failed = failed or bool(failures)
+        if fake is not None:
+            print(f"Stand-in commands: {dict(fake.commands)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit("State store check failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Benchmark: streamed, early-stopping scrape vs downloading and parsing the whole page
+# Usage: python benchmarks/bench_streaming.py [--size-mb 3] [--kbps 20000]
+# Serves a large magazine-style front page from a local server that trickles the body
+# out at a fixed rate, then compares wall time, bytes read and peak Python memory.
+import argparse
+import http.server
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+import extractor  # noqa: E402
+from news_fetcher import read_chunks  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+# Front page with the latest articles near the top and a long tail of older cards
+def build_page(size_bytes):
+    head = ['<html><head><meta charset="utf-8"></head><body><main>']
+    for i in range(8):
+        head.append(f'<article><img src="/img/{i}.jpg"><a href="/news/{i}"><h3>Top story {i}</h3></a></article>')
+    tail = []
+    card = '<div class="card"><img src="/old/{0}.jpg"><a href="/old/{0}"><h3>Older story {0}</h3></a><p>{1}</p></div>'
+    filler = "Lorem ipsum dolor sit amet. " * 20
+    size, i = 0, 0
+    while size < size_bytes:
+        tail.append(card.format(i, filler))
+        size += len(tail[-1])
+        i += 1
+    return ("".join(head + tail) + "</main></body></html>").encode()
+
+
+def serve(page, bytes_per_second):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            try:
+                for start in range(0, len(page), CHUNK):
+                    self.wfile.write(page[start:start + CHUNK])
+                    time.sleep(CHUNK / bytes_per_second)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The streaming client hung up early, as intended
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def full_download(url, parser):
+    response = requests.get(url, timeout=60)
+    articles = extractor.extract_articles(response.text, url, 4, parser)
+    return articles, len(response.content)
+
+
+def streamed(url, parser):
+    response = requests.get(url, timeout=60, stream=True)
+    try:
+        articles = extractor.extract_articles_from_chunks(read_chunks(response), url, 4, parser, response.encoding)
+        return articles, response.streamed_bytes
+    finally:
+        response.close()
+
+
+def measure(func, url, parser):
+    tracemalloc.start()
+    started = time.perf_counter()
+    articles, bytes_read = func(url, parser)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return articles, elapsed, bytes_read, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=3)
+    parser.add_argument("--kbps", type=float, default=20000, help="Server send rate in KiB/s")
+    args = parser.parse_args()
+
+    page = build_page(int(args.size_mb * 1024 * 1024))
+    url = serve(page, args.kbps * 1024)
+    parsers = ["html.parser"] + (["lxml"] if extractor.etree is not None else [])
+
+    print(f"page: {len(page) / 1024:.0f} KiB at {args.kbps:.0f} KiB/s")
+    print(f"{'mode':<10}{'parser':<14}{'time (ms)':>12}{'KiB read':>12}{'peak MiB':>12}")
+    for name in parsers:
+        expected = None
+        for mode, func in (("full", full_download), ("streamed", streamed)):
+            articles, elapsed, bytes_read, peak = measure(func, url, name)
+            if expected is None:
+                expected = articles
+            flag = "" if articles == expected else "  (output differs!)"
+            print(f"{mode:<10}{name:<14}{elapsed * 1000:>12.1f}{bytes_read / 1024:>12.0f}{peak / 1024 / 1024:>12.2f}{flag}")
+
+
+if __name__ == "__main__":
+    main()
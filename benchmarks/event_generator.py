@@ -0,0 +1,190 @@
+# Signed Slack Events API traffic for load tests
+# Usage: python benchmarks/event_generator.py URL --secret SIGNING_SECRET [--users 40] [--window 2] [--noise 200]
+#
+# Builds a schedule of member_joined_channel / member_left_channel deliveries shaped like
+# the bursts the bot sees in practice:
+#   - a cohort of new members joining the member log channel within a few seconds
+#     (a class or club invited at once)
+#   - Slack retrying a share of deliveries with X-Slack-Retry-Num 1-3 and the same
+#     event_id, as it does when an ack is slow
+#   - some members joining twice (a second event for someone already welcomed)
+#   - joins and leaves in other channels, which the bot must ack but not act on
+# Each request is signed like Slack signs it and sent at its scheduled time from a pool
+# of client threads; send() returns the ack status and latency of every delivery.
+# flood_schedule() sends everything at once instead, to find the maximum ack rate.
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MEMBER_LOG_ID = "C06Q2RN2MTJ"  # bot.MEMBER_LOG_ID
+OTHER_CHANNELS = ["C0GENERAL01", "C0RANDOM001", "C0INTROS001"]
+RETRY_DELAYS = (0.5, 1.5, 3.0)  # Seconds after the first delivery; Slack waits minutes, compressed here
+RETRY_REASONS = ("http_timeout", "http_error", "http_timeout")
+
+
+# The headers Slack adds to a signed request
+def sign(secret, body, timestamp=None):
+    timestamp = str(int(timestamp or time.time()))
+    digest = hmac.new(secret.encode(), f"v0:{timestamp}:{body}".encode(), hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": "v0=" + digest,
+    }
+
+
+def event_payload(event_type, user, channel, event_ts, event_id):
+    return {
+        "token": "bench-verification-token",
+        "team_id": "TBENCH",
+        "api_app_id": "ABENCH",
+        "type": "event_callback",
+        "event_id": event_id,
+        "event_time": int(float(event_ts)),
+        "event": {
+            "type": event_type,
+            "user": user,
+            "channel": channel,
+            "channel_type": "C",
+            "team": "TBENCH",
+            "event_ts": event_ts,
+        },
+    }
+
+
+# One scheduled delivery: send at `at` seconds after the start
+class Delivery:
+    def __init__(self, at, payload, retry_num=0, retry_reason=None):
+        self.at = at
+        self.payload = payload
+        self.retry_num = retry_num
+        self.retry_reason = retry_reason
+
+    @property
+    def kind(self):
+        return "retry" if self.retry_num else self.payload["event"]["type"]
+
+
+# Deliveries for one burst, sorted by send time
+# Returns (deliveries, users expected to be welcomed)
+def burst_schedule(users=40, window=2.0, retry_share=0.3, rejoin_share=0.1, noise=200, seed=1):
+    rng = random.Random(seed)
+    started = time.time()
+    deliveries = []
+    sequence = 0
+
+    def add(at, event_type, user, channel):
+        nonlocal sequence
+        sequence += 1
+        event_ts = f"{started + at:.6f}"
+        payload = event_payload(event_type, user, channel, event_ts, f"EvBENCH{seed:03d}{sequence:06d}")
+        deliveries.append(Delivery(at, payload))
+        if rng.random() < retry_share:
+            for retry_num in range(1, rng.randint(1, len(RETRY_DELAYS)) + 1):
+                deliveries.append(Delivery(at + RETRY_DELAYS[retry_num - 1], payload, retry_num, RETRY_REASONS[retry_num - 1]))
+
+    cohort = [f"UBENCH{seed:03d}{i:05d}" for i in range(users)]
+    for user in cohort:
+        add(rng.uniform(0, window), "member_joined_channel", user, MEMBER_LOG_ID)
+    for user in rng.sample(cohort, int(users * rejoin_share)):
+        add(window + rng.uniform(0, window), "member_joined_channel", user, MEMBER_LOG_ID)
+    for i in range(noise):
+        event_type = rng.choice(["member_joined_channel", "member_left_channel"])
+        add(rng.uniform(0, window), event_type, f"UNOISE{seed:03d}{i:05d}", rng.choice(OTHER_CHANNELS))
+
+    deliveries.sort(key=lambda delivery: delivery.at)
+    return deliveries, cohort
+
+
+# Deliveries all due at once, for measuring how many events per second the bot can ack
+# They're in other channels, so they cost the bot no Slack calls.
+def flood_schedule(count=2000, seed=2):
+    rng = random.Random(seed)
+    started = time.time()
+    return [
+        Delivery(0, event_payload("member_joined_channel", f"UFLOOD{seed:03d}{i:06d}", rng.choice(OTHER_CHANNELS), f"{started + i / 1000:.6f}", f"EvFLOOD{seed:03d}{i:06d}"))
+        for i in range(count)
+    ]
+
+
+_local = threading.local()
+
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+# Send every delivery at its scheduled time; returns [(kind, HTTP status or None, seconds)]
+def send(url, secret, deliveries, concurrency=32, timeout=10):
+    started = time.monotonic()
+
+    def deliver(delivery):
+        delay = started + delivery.at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        body = json.dumps(delivery.payload)
+        headers = sign(secret, body)
+        if delivery.retry_num:
+            headers["X-Slack-Retry-Num"] = str(delivery.retry_num)
+            headers["X-Slack-Retry-Reason"] = delivery.retry_reason
+        request_started = time.perf_counter()
+        try:
+            status = _session().post(url, data=body.encode(), headers=headers, timeout=timeout).status_code
+        except requests.RequestException:
+            status = None
+        return delivery.kind, status, time.perf_counter() - request_started
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="event-sender") as executor:
+        return list(executor.map(deliver, deliveries))
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+# Throughput and ack latency for a list of send() results
+def summarize(results, wall_seconds):
+    latencies = [seconds for _, status, seconds in results if status == 200]
+    return {
+        "deliveries": len(results),
+        "retries": sum(1 for kind, _, _ in results if kind == "retry"),
+        "acked": len(latencies),
+        "failed": len(results) - len(latencies),
+        "throughput_per_second": round(len(latencies) / wall_seconds, 1) if wall_seconds else None,
+        "ack_p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "ack_p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url", help="the bot's events endpoint, e.g. http://127.0.0.1:8000/slack/events")
+    parser.add_argument("--secret", required=True, help="SLACK_SIGNING_SECRET the bot was started with")
+    parser.add_argument("--users", type=int, default=40, help="new members in the burst")
+    parser.add_argument("--window", type=float, default=2.0, help="seconds the burst is spread over")
+    parser.add_argument("--retry-share", type=float, default=0.3)
+    parser.add_argument("--rejoin-share", type=float, default=0.1)
+    parser.add_argument("--noise", type=int, default=200, help="events in other channels")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--flood", type=int, default=0, help="send this many events at once instead of a burst")
+    args = parser.parse_args()
+    if args.flood:
+        deliveries = flood_schedule(args.flood, args.seed)
+    else:
+        deliveries, cohort = burst_schedule(args.users, args.window, args.retry_share, args.rejoin_share, args.noise, args.seed)
+    started = time.monotonic()
+    results = send(args.url, args.secret, deliveries, args.concurrency)
+    print(json.dumps(summarize(results, time.monotonic() - started), indent=2))
@@ -0,0 +1,179 @@
+# Local stand-in for a Redis-protocol server, for checks and load tests of the redis state backend
+# Usage: python benchmarks/fake_redis.py [--port 6390]
+# Point the bot at it with STATE_BACKEND=redis STATE_REDIS_URL=redis://127.0.0.1:<port>/0
+#
+# Speaks RESP over TCP and implements the commands state_store.RedisStateStore sends: PING,
+# AUTH, SELECT, SET (with NX and PX), GET, DEL, RPUSH, PEXPIRE, LRANGE and MULTI/EXEC/DISCARD.
+# Every command runs under one lock, and EXEC runs its queued commands under it in one go,
+# so transactions are atomic as on Redis. Keys with an expiry are dropped once it passes.
+# FakeRedis.commands counts the commands run, by name. Setting FakeRedis.drop_replies to N
+# makes the next N commands run but get no reply: the connection is closed instead, as when
+# a reply is lost to a timeout.
+import argparse
+import os
+import socketserver
+import threading
+import time
+from collections import Counter
+
+
+class FakeRedis:
+    def __init__(self, password=None):
+        self.password = password
+        self.lock = threading.Lock()
+        self.data = {}  # (db, key) -> str or list of str
+        self.expires = {}  # (db, key) -> expiry time
+        self.commands = Counter()  # Command name -> count
+        self.drop_replies = 0  # Commands still to run without replying
+
+    def _live(self, db, key, now):
+        if (db, key) in self.expires and self.expires[(db, key)] <= now:
+            self.data.pop((db, key), None)
+            self.expires.pop((db, key), None)
+        return self.data.get((db, key))
+
+    # Run one command for a connection in `db`; returns a reply value or an Exception to send as an error
+    # The caller holds the lock.
+    def run(self, db, args):
+        name, args = args[0].upper(), args[1:]
+        self.commands[name] += 1
+        now = time.time()
+        if name == "PING":
+            return "PONG"
+        if name == "SET":
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if "NX" in options and self._live(db, key, now) is not None:
+                return None
+            self.data[(db, key)] = value
+            self.expires.pop((db, key), None)
+            if "PX" in options:
+                self.expires[(db, key)] = now + int(args[2 + options.index("PX") + 1]) / 1000
+            return "OK"
+        if name == "GET":
+            value = self._live(db, args[0], now)
+            if isinstance(value, list):
+                return ValueError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            return value
+        if name == "DEL":
+            deleted = 0
+            for key in args:
+                if self._live(db, key, now) is not None:
+                    del self.data[(db, key)]
+                    self.expires.pop((db, key), None)
+                    deleted += 1
+            return deleted
+        if name == "RPUSH":
+            value = self._live(db, args[0], now)
+            if value is None:
+                value = self.data[(db, args[0])] = []
+            elif not isinstance(value, list):
+                return ValueError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            value.extend(args[1:])
+            return len(value)
+        if name == "PEXPIRE":
+            if self._live(db, args[0], now) is None:
+                return 0
+            self.expires[(db, args[0])] = now + int(args[1]) / 1000
+            return 1
+        if name == "LRANGE":
+            value = self._live(db, args[0], now) or []
+            start, stop = int(args[1]), int(args[2])
+            return value[start:(stop + 1) or None]
+        return ValueError(f"ERR unknown command '{name}'")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    fake = None
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if line[:1] != b"*":  # Inline command, e.g. from telnet
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    @staticmethod
+    def _encode(reply):
+        if isinstance(reply, Exception):
+            return b"-%s\r\n" % str(reply).encode()
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(_Handler._encode(item) for item in reply)
+        if reply in ("OK", "PONG", "QUEUED"):
+            return b"+%s\r\n" % reply.encode()
+        data = reply.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def handle(self):
+        fake = self.fake
+        db = 0
+        authenticated = fake.password is None
+        queued = None  # Commands queued since MULTI
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            if name == "AUTH":
+                authenticated = args[-1] == fake.password
+                reply = "OK" if authenticated else ValueError("WRONGPASS invalid password")
+            elif not authenticated:
+                reply = ValueError("NOAUTH Authentication required.")
+            elif name == "SELECT":
+                db, reply = int(args[1]), "OK"
+            elif name == "MULTI":
+                queued, reply = [], "OK"
+            elif name == "DISCARD":
+                queued, reply = None, "OK"
+            elif name == "EXEC":
+                if queued is None:
+                    reply = ValueError("ERR EXEC without MULTI")
+                else:
+                    with fake.lock:
+                        reply = [fake.run(db, command) for command in queued]
+                    queued = None
+            elif queued is not None:
+                queued.append(args)
+                reply = "QUEUED"
+            else:
+                with fake.lock:
+                    reply = fake.run(db, args)
+                    drop = fake.drop_replies > 0
+                    fake.drop_replies -= drop
+                if drop:
+                    return  # Closes the connection without the reply
+            self.wfile.write(self._encode(reply))
+
+
+# Serve a FakeRedis on a background thread; returns (server, URL for STATE_REDIS_URL)
+def serve(fake, host="127.0.0.1", port=0):
+    handler = type("FakeRedisHandler", (_Handler,), {"fake": fake})
+    server = socketserver.ThreadingTCPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    auth = f":{fake.password}@" if fake.password else ""
+    return server, f"redis://{auth}{host}:{server.server_address[1]}/0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_REDIS_PORT", 6390)))
+    parser.add_argument("--password")
+    args = parser.parse_args()
+    server, url = serve(FakeRedis(args.password), port=args.port)
+    print(f"Fake Redis at {url}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,241 @@
+# Local stand-in for the Slack Web API, for load tests and benchmarks
+# Usage: python benchmarks/fake_slack.py [--port 8930] [--latency-ms 40] [--rate-limit 0.02] [--error-rate 0.01] [--post-error-rate 0.01]
+#                                        [--post-drop-rate 0.01] [--history-error missing_scope]
+# Point the bot at it with SLACK_API_URL=http://127.0.0.1:<port>/api/
+#
+# Implements the methods the bot calls (chat.postMessage, conversations.open,
+# conversations.members, conversations.history, auth.test, apps.connections.open) with a configurable response
+# latency, a share of HTTP 429 responses with Retry-After, and a share of transient errors. A share of
+# chat.postMessage calls can also post the message and then answer with HTTP 500, as Slack sometimes does,
+# or post it and drop the connection without answering, so a sender that resends blindly posts twice.
+# With history_error set, conversations.history fails with that error, as for an app without the
+# history scopes. Every call that took effect is recorded; GET /_calls returns them and POST /_reset
+# clears them.
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeSlack:
+    def __init__(self, latency=0.04, jitter=0.5, rate_limit=0.0, retry_after=1, error_rate=0.0, post_error_rate=0.0, post_drop_rate=0.0,
+                 history_error=None, members=None, socket_url=None, seed=None):
+        self.latency = latency  # Mean response time in seconds
+        self.jitter = jitter  # Latency varies by up to this share either way
+        self.rate_limit = rate_limit  # Share of calls answered with HTTP 429
+        self.retry_after = retry_after
+        self.error_rate = error_rate  # Share of calls answered with a retryable error
+        self.post_error_rate = post_error_rate  # Share of chat.postMessage calls that post, then answer with a 500
+        self.post_drop_rate = post_drop_rate  # Share of chat.postMessage calls that post, then close the connection
+        self.history_error = history_error  # Error conversations.history fails with, e.g. "missing_scope"
+        self.members = members or {}  # channel -> member IDs, for conversations.members
+        self.socket_url = socket_url  # What apps.connections.open returns (see fake_socket_mode.py)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = []  # (method, arguments, time) of successful calls
+        self.messages = {}  # channel -> posted messages, newest last, for conversations.history
+        self.faults = Counter()  # "ratelimited" / "internal_error" / "posted_then_failed" / "posted_then_dropped" -> count
+        self.next_ts = 0
+
+    def reset(self):
+        with self.lock:
+            self.calls = []
+            self.messages = {}
+            self.faults.clear()
+
+    # Returns (HTTP status, headers, JSON body) for one Web API call; a status of None means
+    # the connection is closed without a response
+    def handle(self, method, arguments):
+        with self.lock:
+            roll = self.random.random()
+            post_roll = self.random.random()
+            delay = self.latency * (1 + self.random.uniform(-self.jitter, self.jitter))
+        time.sleep(max(0.0, delay))
+
+        # Faults are for the event handling being measured, not for connecting in Socket Mode
+        if method == "apps.connections.open":
+            roll = 1.0
+        if roll < self.rate_limit:
+            with self.lock:
+                self.faults["ratelimited"] += 1
+            return 429, {"Retry-After": str(self.retry_after)}, {"ok": False, "error": "ratelimited"}
+        if roll < self.rate_limit + self.error_rate:
+            with self.lock:
+                self.faults["internal_error"] += 1
+            return 500, {}, {"ok": False, "error": "internal_error"}
+
+        handler = getattr(self, "api_" + method.replace(".", "_"), None)
+        if handler is None:
+            return 200, {}, {"ok": False, "error": "unknown_method"}
+        status, body = handler(arguments)
+        if body.get("ok"):
+            with self.lock:
+                self.calls.append((method, arguments, time.time()))
+                if method == "chat.postMessage" and post_roll < self.post_error_rate:
+                    self.faults["posted_then_failed"] += 1
+                    return 500, {}, {"ok": False, "error": "internal_error"}
+                if method == "chat.postMessage" and post_roll < self.post_error_rate + self.post_drop_rate:
+                    self.faults["posted_then_dropped"] += 1
+                    return None, {}, {}
+        return status, {}, body
+
+    def api_auth_test(self, arguments):
+        return 200, {"ok": True, "user_id": "UBOT", "team_id": "TBENCH"}
+
+    def api_apps_connections_open(self, arguments):
+        if not self.socket_url:
+            return 200, {"ok": False, "error": "not_allowed_token_type"}
+        return 200, {"ok": True, "url": self.socket_url}
+
+    def api_chat_postMessage(self, arguments):
+        if not arguments.get("channel"):
+            return 200, {"ok": False, "error": "channel_not_found"}
+        channel = self.im_channel(arguments["channel"])
+        with self.lock:
+            self.next_ts += 1
+            ts = f"{int(time.time())}.{self.next_ts:06d}"
+            message = {"type": "message", "ts": ts, "text": arguments.get("text")}
+            if arguments.get("metadata"):
+                metadata = arguments["metadata"]
+                message["metadata"] = json.loads(metadata) if isinstance(metadata, str) else metadata
+            self.messages.setdefault(channel, []).append(message)
+        return 200, {"ok": True, "channel": channel, "ts": ts, "message": message}
+
+    # Posting to a user ID lands in the bot's DM with them, as on Slack
+    @staticmethod
+    def im_channel(channel):
+        return "D" + channel if channel[:1] in ("U", "W") else channel
+
+    def api_conversations_open(self, arguments):
+        users = arguments.get("users")
+        if not users:
+            return 200, {"ok": False, "error": "users_list_not_supplied"}
+        return 200, {"ok": True, "channel": {"id": self.im_channel(str(users).split(",")[0])}}
+
+    # Newest first, from `oldest` on
+    def api_conversations_history(self, arguments):
+        if self.history_error:
+            return 200, {"ok": False, "error": self.history_error}
+        oldest = float(arguments.get("oldest") or 0)
+        limit = int(arguments.get("limit") or 100)
+        with self.lock:
+            messages = [message for message in self.messages.get(arguments.get("channel"), []) if float(message["ts"]) >= oldest]
+        return 200, {"ok": True, "messages": messages[::-1][:limit], "has_more": len(messages) > limit}
+
+    # Cursor-paginated member list
+    def api_conversations_members(self, arguments):
+        members = self.members.get(arguments.get("channel"))
+        if members is None:
+            return 200, {"ok": False, "error": "channel_not_found"}
+        start = int(arguments.get("cursor") or 0)
+        limit = int(arguments.get("limit") or 100)
+        page = members[start:start + limit]
+        next_cursor = str(start + limit) if start + limit < len(members) else ""
+        return 200, {"ok": True, "members": page, "response_metadata": {"next_cursor": next_cursor}}
+
+    # Summary of what was posted: calls per method and messages posted more than once
+    def summary(self):
+        with self.lock:
+            calls = list(self.calls)
+            faults = dict(self.faults)
+        per_method = Counter(method for method, _, _ in calls)
+        posts = Counter((arguments.get("channel"), arguments.get("text")) for method, arguments, _ in calls if method == "chat.postMessage")
+        return {
+            "calls": dict(per_method),
+            "faults": faults,
+            "duplicate_messages": sum(count - 1 for count in posts.values() if count > 1),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        if status is None:
+            self.close_connection = True
+            return
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Arguments from the query string plus a form or JSON body, as slack_sdk sends either
+    def _arguments(self):
+        parts = urlsplit(self.path)
+        arguments = dict(parse_qsl(parts.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if body:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                arguments.update(json.loads(body))
+            else:
+                arguments.update(parse_qsl(body.decode()))
+        return parts.path, arguments
+
+    def do_GET(self):
+        path, arguments = self._arguments()
+        if path == "/_calls":
+            self._send(200, {"summary": self.fake.summary(), "calls": self.fake.calls})
+        elif path.startswith("/api/"):
+            self._send(*self._api(path, arguments))
+        else:
+            self._send(404, {"ok": False, "error": "not_found"})
+
+    def do_POST(self):
+        path, arguments = self._arguments()
+        if path == "/_reset":
+            self.fake.reset()
+            self._send(200, {"ok": True})
+        elif path.startswith("/api/"):
+            self._send(*self._api(path, arguments))
+        else:
+            self._send(404, {"ok": False, "error": "not_found"})
+
+    def _api(self, path, arguments):
+        status, headers, body = self.fake.handle(path[len("/api/"):], arguments)
+        return status, body, headers
+
+
+# Serve a FakeSlack on a background thread; returns (server, base URL for SLACK_API_URL)
+def serve(fake, host="127.0.0.1", port=0):
+    handler = type("FakeSlackHandler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-slack", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/api/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_SLACK_PORT", 8930)))
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument("--post-error-rate", type=float, default=0.0, help="share of posts answered with 500 after posting")
+    parser.add_argument("--post-drop-rate", type=float, default=0.0, help="share of posts whose connection is dropped after posting")
+    parser.add_argument("--history-error", help="error for every conversations.history call, e.g. missing_scope")
+    args = parser.parse_args()
+    fake = FakeSlack(
+        latency=args.latency_ms / 1000, rate_limit=args.rate_limit, error_rate=args.error_rate, post_error_rate=args.post_error_rate,
+        post_drop_rate=args.post_drop_rate, history_error=args.history_error
+    )
+    server, url = serve(fake, port=args.port)
+    print(f"Fake Slack API at {url} (GET /_calls for what was posted)")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,231 @@
+# Local stand-in for Slack's Socket Mode WebSocket, for load tests
+# Used with fake_slack.py: FakeSlack(socket_url=...) answers apps.connections.open with
+# this server's URL, and socket_mode.py connects here instead of to Slack.
+#
+# Speaks just enough of RFC 6455 for socket_mode.py's client: the upgrade handshake,
+# text frames, ping/pong and close. On connect it sends Slack's "hello"; send() wraps a
+# Events API payload in an envelope and waits for the client to ack its envelope_id. Like
+# Slack, an envelope that isn't acked within ACK_TIMEOUT is redelivered with retry_attempt
+# incremented, up to MAX_REDELIVERIES times.
+import base64
+import hashlib
+import itertools
+import json
+import socketserver
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+ACK_TIMEOUT = 3.0  # Seconds Slack waits for an ack before redelivering
+MAX_REDELIVERIES = 3
+
+
+# One WebSocket frame, unmasked (servers don't mask)
+def encode_frame(opcode, payload):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([126]) + struct.pack(">H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack(">Q", len(payload))
+    return header + payload
+
+
+# Read one frame from a client; returns (opcode, payload), or (None, b"") when closed
+def read_frame(reader):
+    head = reader.read(2)
+    if len(head) < 2:
+        return None, b""
+    opcode, length = head[0] & 0x0F, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", reader.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", reader.read(8))[0]
+    mask = reader.read(4) if head[1] & 0x80 else None
+    payload = reader.read(length)
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return opcode, payload
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def send_text(self, text):
+        with self.lock:
+            self.sock.sendall(encode_frame(0x1, text.encode()))
+
+    def send_frame(self, opcode, payload=b""):
+        with self.lock:
+            self.sock.sendall(encode_frame(opcode, payload))
+
+
+class FakeSocketMode:
+    def __init__(self, ack_timeout=ACK_TIMEOUT, max_redeliveries=MAX_REDELIVERIES):
+        self.ack_timeout = ack_timeout
+        self.max_redeliveries = max_redeliveries
+        self.connections = []
+        self.connected = threading.Condition()
+        self.lock = threading.Lock()
+        self.envelope_ids = itertools.count(1)
+        self.pending = {}  # envelope_id -> [envelope, first sent at, last sent at, acked event]
+        self.acked = {}  # envelope_id -> seconds from first send to ack
+        self.redeliveries = 0
+        self.next_connection = itertools.count()
+        self.url = None  # Set by serve()
+        self.server = None
+
+    def wait_connected(self, timeout=30):
+        with self.connected:
+            return self.connected.wait_for(lambda: self.connections, timeout)
+
+    def _connection(self):
+        with self.connected:
+            if not self.connections:
+                raise ConnectionError("No Socket Mode client connected")
+            return self.connections[next(self.next_connection) % len(self.connections)]
+
+    # Deliver a payload in an envelope; returns the envelope_id
+    def send(self, payload, retry_attempt=0, retry_reason=""):
+        envelope_id = f"env-{next(self.envelope_ids)}"
+        envelope = {
+            "envelope_id": envelope_id,
+            "type": "events_api",
+            "payload": payload,
+            "accepts_response_payload": False,
+            "retry_attempt": retry_attempt,
+            "retry_reason": retry_reason,
+        }
+        now = time.perf_counter()
+        with self.lock:
+            self.pending[envelope_id] = [envelope, now, now, threading.Event()]
+        self._connection().send_text(json.dumps(envelope))
+        return envelope_id
+
+    # Seconds from first send to ack, or None if not acked within `timeout`
+    def wait_ack(self, envelope_id, timeout):
+        with self.lock:
+            entry = self.pending.get(envelope_id)
+        if entry is not None:
+            entry[3].wait(timeout)
+        with self.lock:
+            return self.acked.get(envelope_id)
+
+    def _ack(self, envelope_id):
+        with self.lock:
+            entry = self.pending.pop(envelope_id, None)
+            if entry is None:
+                return
+            self.acked[envelope_id] = time.perf_counter() - entry[1]
+        entry[3].set()
+
+    # Redeliver envelopes that weren't acked in time, as Slack does
+    def _redeliver_loop(self):
+        while True:
+            time.sleep(self.ack_timeout / 10)
+            now = time.perf_counter()
+            with self.lock:
+                overdue = [entry for entry in self.pending.values() if now - entry[2] > self.ack_timeout]
+            for entry in overdue:
+                envelope = entry[0]
+                if envelope["retry_attempt"] >= self.max_redeliveries:
+                    continue
+                envelope["retry_attempt"] += 1
+                envelope["retry_reason"] = "timeout"
+                entry[2] = now
+                with self.lock:
+                    self.redeliveries += 1
+                try:
+                    self._connection().send_text(json.dumps(envelope))
+                except (ConnectionError, OSError):
+                    pass
+
+    def handle(self, request):
+        reader = request.makefile("rb")
+        headers = {}
+        reader.readline()  # GET /link HTTP/1.1
+        while True:
+            line = reader.readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+        request.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+
+        connection = _Connection(request)
+        connection.send_text(json.dumps({"type": "hello", "num_connections": 1, "connection_info": {"app_id": "ABENCH"}}))
+        with self.connected:
+            self.connections.append(connection)
+            self.connected.notify_all()
+        try:
+            while True:
+                opcode, payload = read_frame(reader)
+                if opcode is None or opcode == 0x8:
+                    break
+                if opcode == 0x9:  # Ping
+                    connection.send_frame(0xA, payload)
+                elif opcode == 0x1:
+                    message = json.loads(payload)
+                    if "envelope_id" in message:
+                        self._ack(message["envelope_id"])
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self.connected:
+                self.connections.remove(connection)
+            try:
+                connection.send_frame(0x8)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {"connections": len(self.connections), "acked": len(self.acked), "pending": len(self.pending), "redeliveries": self.redeliveries}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    fake = None
+
+    def handle(self):
+        self.fake.handle(self.request)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Serve a FakeSocketMode on a background thread; returns (server, ws:// URL)
+def serve(fake, host="127.0.0.1", port=0):
+    handler = type("FakeSocketModeHandler", (_Handler,), {"fake": fake})
+    server = _Server((host, port), handler)
+    fake.url = f"ws://{host}:{server.server_address[1]}/link"
+    fake.server = server
+    threading.Thread(target=server.serve_forever, name="fake-socket-mode", daemon=True).start()
+    threading.Thread(target=fake._redeliver_loop, name="fake-socket-mode-redeliver", daemon=True).start()
+    return server, fake.url
+
+
+# Deliver event_generator Deliveries at their scheduled times over the socket
+# Returns [(kind, 200 if acked else None, seconds to ack)], like event_generator.send()
+def deliver(fake, deliveries, timeout=10):
+    started = time.monotonic()
+    sent = []
+    for delivery in deliveries:
+        delay = started + delivery.at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        sent.append((delivery.kind, fake.send(delivery.payload, delivery.retry_num, delivery.retry_reason or "")))
+    results = []
+    for kind, envelope_id in sent:
+        seconds = fake.wait_ack(envelope_id, timeout)
+        results.append((kind, 200 if seconds is not None else None, seconds or 0.0))
+    return results
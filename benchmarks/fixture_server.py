@@ -0,0 +1,226 @@
+# Local stand-in for the news sites, Reddit and image hosts, for load tests and benchmarks
+# Usage: python benchmarks/fixture_server.py [--port 8931] [--latency-ms 50]
+#
+# Serves:
+#   /sites/<name>/...           benchmarks/fixtures/<name>.html (with an ETag, so the
+#                               conditional-GET cache sees 304s on repeat runs)
+#   /feeds/<name>               the same stories as an RSS or Atom feed (<name>.rss or
+#                               <name>.atom), also with an ETag
+#   /api/v1/access_token        a Reddit OAuth token
+#   /r/<subreddit>/hot          pages of benchmarks/fixtures/reddit_hot.json, honouring
+#                               limit and after; i.redd.it image URLs are rewritten to here
+#   /img/..., /i.redd.it/...    a small PNG generated from the path (so every image has a
+#                               different perceptual hash), honouring Range requests
+# news_sites_file() writes a news_sites.json pointing at the saved pages and feeds
+# (feeds=False leaves the feeds out, so every site is scraped), and reddit_env()
+# gives the variables that point the meme job's Reddit client at this server.
+import argparse
+import hashlib
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Saved front pages, their feeds, and the site profile each one is served under
+SITES = [
+    {"name": "TechRadar", "fixture": "techradar", "path": "/sites/techradar/", "feed": "techradar.rss", "limit": 4},
+    {"name": "Wired", "fixture": "wired", "path": "/sites/wired/tag/technology/", "feed": "wired.atom", "limit": 4},
+]
+FEED_TYPES = {".rss": "application/rss+xml", ".atom": "application/atom+xml"}
+IMAGE_WIDTH, IMAGE_HEIGHT = 320, 240
+GRID = 8  # Images are a GRID x GRID pattern of gray blocks
+
+
+# Grayscale PNG with a block pattern seeded by `name`
+def make_png(name):
+    rng = random.Random(name)
+    blocks = [[rng.randrange(256) for _ in range(GRID)] for _ in range(GRID)]
+    rows = []
+    for y in range(IMAGE_HEIGHT):
+        values = blocks[y * GRID // IMAGE_HEIGHT]
+        rows.append(b"\x00" + bytes(values[x * GRID // IMAGE_WIDTH] for x in range(IMAGE_WIDTH)))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", IMAGE_WIDTH, IMAGE_HEIGHT, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows))) + chunk(b"IEND", b"")
+
+
+class FixtureServer:
+    def __init__(self, latency=0.0):
+        self.latency = latency  # Added to every response, in seconds
+        self.pages = {}  # URL path -> (body, ETag, content type)
+        for site in SITES:
+            for path, filename in ((site["path"], site["fixture"] + ".html"), (feed_path(site), site["feed"])):
+                with open(os.path.join(FIXTURE_DIR, filename), "rb") as file:
+                    body = file.read()
+                content_type = FEED_TYPES.get(os.path.splitext(filename)[1], "text/html") + "; charset=utf-8"
+                self.pages[path] = (body, '"' + hashlib.sha1(body).hexdigest() + '"', content_type)
+        with open(os.path.join(FIXTURE_DIR, "reddit_hot.json")) as file:
+            self.reddit_posts = json.load(file)["data"]["children"]
+        self.images = {}  # Path -> PNG bytes
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.base_url = None  # Set by serve()
+
+    def image(self, path):
+        with self.lock:
+            data = self.images.get(path)
+            if data is None:
+                data = self.images[path] = make_png(path)
+            return data
+
+    # One page of a subreddit's hot listing; post IDs are prefixed per subreddit so each
+    # subreddit has its own posts but the same images (like real cross-posts)
+    def listing(self, subreddit, limit, after):
+        posts = []
+        for post in self.reddit_posts:
+            data = dict(post["data"])
+            data["id"] = f"{subreddit.lower()}_{data['id']}"
+            data["name"] = "t3_" + data["id"]
+            data["subreddit"] = subreddit
+            data["permalink"] = f"/r/{subreddit}/comments/{data['id']}/"
+            data["url"] = data["url"].replace("https://i.redd.it/", self.base_url + "/i.redd.it/")
+            posts.append({"kind": "t3", "data": data})
+        start = 0
+        if after:
+            names = [post["data"]["name"] for post in posts]
+            start = names.index(after) + 1 if after in names else len(posts)
+        page = posts[start:start + limit]
+        next_after = page[-1]["data"]["name"] if page and start + limit < len(posts) else None
+        return {"kind": "Listing", "data": {"after": next_after, "before": None, "dist": len(page), "children": page}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _json(self, body, status=200):
+        self._send(status, json.dumps(body).encode(), "application/json; charset=UTF-8")
+
+    def _image(self, path):
+        data = self.server_state.image(path)
+        byte_range = self.headers.get("Range", "")
+        if byte_range.startswith("bytes="):
+            start, _, end = byte_range[len("bytes="):].partition("-")
+            start = int(start or 0)
+            end = min(int(end) if end else len(data) - 1, len(data) - 1)
+            self._send(206, data[start:end + 1], "image/png", {"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+        else:
+            self._send(200, data, "image/png")
+
+    def do_GET(self):
+        state = self.server_state
+        with state.lock:
+            state.requests += 1
+        if state.latency:
+            time.sleep(state.latency)
+        parts = urlsplit(self.path)
+        path, query = parts.path, dict(parse_qsl(parts.query))
+
+        if path in state.pages:
+            body, etag, content_type = state.pages[path]
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", content_type, {"ETag": etag})
+            else:
+                self._send(200, body, content_type, {"ETag": etag, "Cache-Control": "max-age=0"})
+        elif path.startswith(("/img/", "/i.redd.it/")):
+            self._image(path)
+        elif path.startswith("/r/") and path.rstrip("/").endswith("/hot"):
+            subreddit = path.split("/")[2]
+            self._json(state.listing(subreddit, int(query.get("limit", 25)), query.get("after")))
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if urlsplit(self.path).path == "/api/v1/access_token":
+            self._json({"access_token": "fixture-token", "token_type": "bearer", "expires_in": 3600, "scope": "*"})
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # The scraper stops reading a page once it has enough articles, and image probes read
+    # only the header, so clients hanging up early is expected
+    def handle_error(self, request, client_address):
+        pass
+
+
+# Serve a FixtureServer on a background thread; returns (server, base URL)
+def serve(state, host="127.0.0.1", port=0):
+    handler = type("FixtureHandler", (_Handler,), {"server_state": state})
+    server = _Server((host, port), handler)
+    state.base_url = f"http://{host}:{server.server_port}"
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server, state.base_url
+
+
+def feed_path(site):
+    return "/feeds/" + site["fixture"]
+
+
+# Write a news_sites.json listing the saved pages (and feeds) on this server; returns its path
+def news_sites_file(base_url, directory=None, feeds=True):
+    sites = [{"name": site["name"], "url": base_url + site["path"], "limit": site["limit"], "retries": 0} for site in SITES]
+    if feeds:
+        for site, profile in zip(SITES, sites):
+            profile["feed"] = base_url + feed_path(site)
+    fd, path = tempfile.mkstemp(prefix="news_sites_", suffix=".json", dir=directory)
+    with os.fdopen(fd, "w") as file:
+        json.dump({"sites": sites}, file)
+    return path
+
+
+# Environment variables that point the meme job at this server instead of reddit.com
+def reddit_env(base_url):
+    return {
+        "REDDIT_API_URL": base_url,
+        "praw_check_for_updates": "false",
+        "REDDIT_CLIENT_ID": "fixture-client",
+        "REDDIT_SECRET": "fixture-secret",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=int(os.getenv("FIXTURE_SERVER_PORT", 8931)))
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    state = FixtureServer(latency=args.latency_ms / 1000)
+    server, url = serve(state, port=args.port)
+    print(f"Fixture server at {url}; NEWS_SITES_FILE={news_sites_file(url)}")
+    for name, value in reddit_env(url).items():
+        print(f"  {name}={value}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,266 +1,329 @@
 # Import necessary libraries and modules
+import hmac
+import logging
 import os
-from slack_sdk import WebClient
+import threading
+import time
+import uuid
 from slack_sdk.errors import SlackApiError
-from flask import Flask, request
+from flask import Flask, Response, g, request
 from slackeventsapi import SlackEventAdapter
-import time
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-import schedule
-import praw  # Reddit API library
+from event_queue import EventDispatcher
+from scheduler import start_scheduler_thread
+from state_store import create_state_store
+from dm_cache import DmChannelCache
+from welcome_batch import WelcomeBatch
+from replay_cache import ReplayCache, event_id_from_body
+from outbox import chat_post, failure_reason
+from slack_setup import MEMBER_LOG_ID, outbox, slack_poster, start_outbox_drainer
+import metrics
+from log_setup import configure_logging, event_context, stats as log_stats
+
+# JSON logs, written by a background thread so request handling never waits on stdout (see log_setup.py)
+configure_logging()
+logger = logging.getLogger("bot")
 
 app = Flask(__name__)  # Initialize Flask app
 
-# Slack and Reddit API credentials
-SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
+# Slack credentials; the bot token, WebClient, poster and outbox are in slack_setup.py,
+# shared with jobs.py
 SLACK_SIGNING_SECRET = os.getenv('SLACK_SIGNING_SECRET')
-REDDIT_CLIENT_ID = os.getenv('REDDIT_CLIENT_ID')
-REDDIT_SECRET = os.getenv('REDDIT_SECRET')
-REDDIT_USER_AGENT = "BTD Tech Meme Scraper"
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # Enables the /admin routes; send as "Authorization: Bearer <token>"
 
-# Initialize Slack event adapter and WebClient
+# Initialize Slack event adapter
 slack_event_adapter = SlackEventAdapter(SLACK_SIGNING_SECRET, '/slack/events', app)
-client = WebClient(token=SLACK_BOT_TOKEN)
 
-# Messages and Channel IDs
+# Messages (the channel IDs are in slack_setup.py)
 WELCOME_MESSAGE = "<@{user_id}> Welcome to the BTD Tech Community 🎉! Check your DMs to see the onboarding message I sent to you and then please provide a formal introduction in the #introductions channel!"
+BATCH_WELCOME_MESSAGE = "{mentions} Welcome to the BTD Tech Community 🎉! Check your DMs to see the onboarding message I sent to each of you and then please provide a formal introduction in the #introductions channel!"
 ONBOARDING_MESSAGE = "Hello <@{user_id}>, Beyond the Dome (BTD) is the preeminent career development program that provides the platform for College of Arts and Letters students to explore a range of potential career paths while creating access, exposure, and opportunities to break into their desired career industry. Please go to this link https://al.nd.edu/careers/ to learn more about!\n\n Anyways.. What is the BTD Tech Career Community? Well, we are a subset of BTD that establishes a community of Arts and Letters students who are more tech-focused and desire to break into the tech-industry. Our mission is to assist in paving your tech-oriented career path through different resources like tech info sessions, events, internship opportunities and certainly a centralized hub like our Slack Workspace! So I highly encourage you to be involved in the community! Thank you and Toodles!  "
-MEMBER_LOG_ID = "C06Q2RN2MTJ"  # Member log channel ID
-TECH_NEWS_ID = "C06PPLGLV2T"  # Tech News Channel ID
-COMMUNITY_MEMES_ID = "C06L8B2QFM2"  # Community Memes channel ID
 
-# Global variables for debouncing and tracking users
-welcomed_users = set()  # Track users who have been welcomed
-last_event_timestamp = {}  # Track the last event timestamp for each user
+# Shared dedup and welcome state, visible to every gunicorn worker (see state_store.py)
+# Keys: event:<user>:<channel>:<event_id>, last_event_ts:<user>, welcomed:<user>
+state_store = create_state_store()
+EVENT_CLAIM_TTL = 24 * 60 * 60  # Slack stops retrying an event long before this
+LAST_EVENT_TTL = 7 * 24 * 60 * 60  # Forget a user's last event timestamp after a week
+dm_channel_cache = DmChannelCache(state_store)  # user_id -> IM channel ID, saves a conversations.open per DM
+
+# Joins arriving within WELCOME_BATCH_SECONDS of each other get one shared welcome post, and
+# their DMs are sent a few at a time (see welcome_batch.py); 0 welcomes each join on its own
+WELCOME_BATCH_SECONDS = float(os.getenv('WELCOME_BATCH_SECONDS', 5))
+WELCOME_SWEEP_SECONDS = float(os.getenv('WELCOME_SWEEP_SECONDS', 30))  # How often each process looks for a batch whose flush was lost
+WELCOME_MAX_MENTIONS = 100  # Members mentioned per welcome post
+ONBOARDING_DM_CONCURRENCY = int(os.getenv('ONBOARDING_DM_CONCURRENCY', 8))
+welcome_batch = WelcomeBatch(state_store, WELCOME_BATCH_SECONDS)
+
+# Ack-first mode: the events endpoint only enqueues the event and returns 200 right away,
+# and a pool of background workers makes the Slack API calls (set EVENT_ACK_FIRST=false to disable)
+EVENT_ACK_FIRST = os.getenv('EVENT_ACK_FIRST', 'true').lower() != 'false'
+event_dispatcher = EventDispatcher(
+    workers=int(os.getenv('EVENT_WORKERS', 4)),
+    maxsize=int(os.getenv('EVENT_QUEUE_SIZE', 1000))
+)
+
+# Slack's retries of events this process already acked are answered before any parsing
+# or handler work (see replay_cache.py)
+replay_cache = ReplayCache()
+EVENT_RETRIES_ABSORBED = metrics.counter("event_retries_absorbed_total", "Slack retries acked from the replay cache without handling, by retry reason")
+
+# True if the delivery is a retry of an event already acked here, and should just be acked
+def absorb_retry(event_id, reason):
+    if event_id and replay_cache.seen(event_id):
+        EVENT_RETRIES_ABSORBED.inc(reason=reason or "none")
+        return True
+    return False
+
+# Hand an event to the background workers, or run it inline when ack-first mode is off
+def dispatch_event(handler, event_data):
+    if EVENT_ACK_FIRST:
+        event_dispatcher.submit(handler, event_data)
+    else:
+        with event_context(event_data):
+            handler(event_data)
 
 # Handle user joining the channel and send welcome/onboarding messages
 @slack_event_adapter.on("member_joined_channel")
 def recognize_member_joined(event_data):
+    dispatch_event(handle_member_joined, event_data)
+
+def handle_member_joined(event_data):
+    logger.info("Received member_joined_channel event", extra={"sampled": True, "event": event_data['event']})
+    user_id = claim_welcome(event_data)
+
+    # Send welcome and onboarding messages
+    if user_id and WELCOME_BATCH_SECONDS > 0:
+        if welcome_batch.add(user_id):
+            timer = threading.Timer(WELCOME_BATCH_SECONDS, flush_welcome_batch)
+            timer.daemon = True
+            timer.start()
+    elif user_id:
+        welcome_users([user_id], event_data.get('event_id'))  # A retry of the event gets the same outbox keys
+
+# Welcome everyone who joined during the batch window
+def flush_welcome_batch():
+    try:
+        welcome_users(welcome_batch.take())
+    except Exception:
+        logger.exception("Error flushing welcome batch")
+
+# Welcome posts for a batch of members: (members, text), one per WELCOME_MAX_MENTIONS members
+def batch_welcome_messages(user_ids):
+    messages = []
+    for start in range(0, len(user_ids), WELCOME_MAX_MENTIONS):
+        group = user_ids[start:start + WELCOME_MAX_MENTIONS]
+        if len(group) == 1:
+            messages.append((group, WELCOME_MESSAGE.format(user_id=group[0])))
+        else:
+            messages.append((group, BATCH_WELCOME_MESSAGE.format(mentions=", ".join(f"<@{user_id}>" for user_id in group))))
+    return messages
+
+# Outbox posts welcoming a batch of members: (members, post) per welcome post
+# `batch_id` makes the keys unique to this welcome.
+def welcome_posts(user_ids, batch_id):
+    return [(group, chat_post(f"welcome:{batch_id}:{index}", MEMBER_LOG_ID, text=text)) for index, (group, text) in enumerate(batch_welcome_messages(user_ids))]
+
+# Outbox posts of the onboarding DM, by user: to the cached IM channel, or else to the user
+# ID, which delivers to the DM with the bot. The channel is part of the key, so a resend to
+# the user ID after a stale IM channel is a post of its own.
+def onboarding_posts(user_ids, batch_id):
+    posts = {}
+    for user_id in user_ids:
+        channel_id = dm_channel_cache.get(user_id) or user_id
+        posts[user_id] = chat_post(f"onboarding:{batch_id}:{channel_id}", channel_id, text=ONBOARDING_MESSAGE.format(user_id=user_id))
+    return posts
+
+# One welcome post for the batch, then an onboarding DM to each member
+# About N + 1 Slack calls for N members, instead of 3N when each is welcomed on their own.
+# Every post is in the outbox before the first is sent, so none are lost to a crash.
+def welcome_users(user_ids, batch_id=None):
+    batch_id = batch_id or uuid.uuid4().hex
+    welcomes = welcome_posts(user_ids, batch_id)
+    direct_messages = onboarding_posts(user_ids, batch_id)
+    outbox.enqueue_many([post for _, post in welcomes] + list(direct_messages.values()))
+
+    results = outbox.deliver(post["key"] for _, post in welcomes)
+    for group, post in welcomes:
+        result = results.get(post["key"])
+        if isinstance(result, Exception):
+            logger.error("Error sending welcome message to %d users in channel %s: %s", len(group), MEMBER_LOG_ID, failure_reason(result))
+        elif result is not None:
+            logger.info("Welcome message sent to %d users in channel %s", len(group), MEMBER_LOG_ID)
+    send_direct_onboarding_messages(direct_messages, batch_id)
+
+WELCOME_DEDUP = metrics.counter("welcome_dedup_total", "member_joined_channel events, by dedup result")
+
+# Dedup and debounce a member_joined_channel event
+# Returns the user to welcome, or None if the event is a retry, stale, or the user was already welcomed
+def claim_welcome(event_data):
     event = event_data["event"]
-    print(f"Received event: {event}")
     user_id = event.get("user")
     channel_id = event.get("channel")
     event_ts = event.get("event_ts")
 
-    # Debounce logic to prevent duplicate messages
-    if user_id in last_event_timestamp and float(event_ts) <= float(last_event_timestamp[user_id]):
-        return
-    
-    last_event_timestamp[user_id] = event_ts
-
-    # Send welcome and onboarding messages if in the correct channel
-    if channel_id == MEMBER_LOG_ID:
-        if user_id not in welcomed_users:
-            welcomed_users.add(user_id)
-            send_channel_welcome_message(MEMBER_LOG_ID, user_id)
-            send_direct_onboarding_message(user_id)
+    # Only the first worker to claim this delivery handles it; retries are dropped
+    if not state_store.claim(f"event:{user_id}:{channel_id}:{event_data.get('event_id')}", EVENT_CLAIM_TTL):
+        WELCOME_DEDUP.inc(result="retry")
+        return None
 
-# Send onboarding message via direct message
-def send_direct_onboarding_message(user_id):
-    try:
-        # Pass user_id as a string, not a list
-        response = client.conversations_open(users=user_id)
-        channel_id = response["channel"]["id"]
-
-        client.chat_postMessage(
-            channel=channel_id,
-            text=ONBOARDING_MESSAGE.format(user_id=user_id)
-        )
-        print(f"Onboarding message sent to user {user_id}")
-    except SlackApiError as e:
-        print(f"Error sending onboarding message to user {user_id}: {e.response['error']}")
-
-# Send welcome message to the channel
-def send_channel_welcome_message(channel_id, user_id):
-    try:
-        client.chat_postMessage(
-            channel=channel_id,
-            text=WELCOME_MESSAGE.format(user_id=user_id)
-        )
-        print(f"Welcome message sent to user {user_id} in channel {channel_id}")
-    except SlackApiError as e:
-        print(f"Error sending welcome message to user {user_id} in channel {channel_id}: {e.response['error']}")
+    # Debounce logic to prevent duplicate messages
+    last_event_ts = state_store.get(f"last_event_ts:{user_id}")
+    if last_event_ts is not None and float(event_ts) <= float(last_event_ts):
+        WELCOME_DEDUP.inc(result="stale")
+        return None
+
+    state_store.set(f"last_event_ts:{user_id}", event_ts, LAST_EVENT_TTL)
+
+    # Only welcome users in the member log channel who haven't been welcomed yet
+    if channel_id != MEMBER_LOG_ID:
+        WELCOME_DEDUP.inc(result="other_channel")
+        return None
+    if not state_store.claim(f"welcomed:{user_id}"):
+        WELCOME_DEDUP.inc(result="already_welcomed")
+        return None
+    WELCOME_DEDUP.inc(result="new")
+    return user_id
+
+# Errors that mean a cached IM channel ID is no longer usable
+STALE_DM_ERRORS = {"channel_not_found", "is_archived"}
+
+# Send recorded onboarding DMs (see onboarding_posts), ONBOARDING_DM_CONCURRENCY at a time
+def send_direct_onboarding_messages(posts, batch_id):
+    results = outbox.deliver((post["key"] for post in posts.values()), ONBOARDING_DM_CONCURRENCY)
+
+    retry = []
+    sent = 0
+    for user_id, post in posts.items():
+        result = results.get(post["key"])
+        channel_id = post["arguments"]["channel"]
+        if result is None:
+            continue  # Already sent, or being sent by another worker
+        if not isinstance(result, Exception):
+            sent += 1
+            # A post to the user ID is answered with their IM channel, so the next DM can use it
+            if channel_id == user_id and result.get("channel") not in (None, user_id):
+                dm_channel_cache.set(user_id, result["channel"])
+        elif channel_id != user_id and isinstance(result, SlackApiError) and result.response['error'] in STALE_DM_ERRORS:
+            dm_channel_cache.invalidate(user_id)
+            retry.append(user_id)
+        else:
+            logger.error("Error sending onboarding message to user %s: %s", user_id, failure_reason(result))
+    logger.info("Onboarding messages sent to %d of %d users", sent, len(posts))
+    if retry:
+        retry_posts = onboarding_posts(retry, batch_id)  # Cache is cleared, so these go to the user IDs
+        outbox.enqueue_many(retry_posts.values())
+        send_direct_onboarding_messages(retry_posts, batch_id)
 
 # Handle user leaving the channel
 @slack_event_adapter.on("member_left_channel")
 def recognize_member_left(event_data):
+    dispatch_event(handle_member_left, event_data)
+
+def handle_member_left(event_data):
     event = event_data["event"]
-    print(f"Received event: {event}")
+    logger.info("Received member_left_channel event", extra={"sampled": True, "event": event})
     user_id = event.get("user")
     channel_id = event.get("channel")
     event_ts = event.get("event_ts")
     
-    # Remove user from welcomed users set
+    # Forget the user was welcomed so they get welcomed again if they rejoin
     if channel_id == MEMBER_LOG_ID:
-        if user_id in welcomed_users:
-            welcomed_users.remove(user_id)
-
-# Web scraping tech headlines from specified websites
-WEBSITES = {
-    "TechRadar": "https://www.techradar.com",
-    "Wired": "https://www.wired.com/tag/technology/",
-}
-
-def find_articles():
-    articles = []  # Store scraped articles
-    
-    # Iterate through each website
-    for siteName, url in WEBSITES.items():
-        try:
-            httpResponse = requests.get(url)
-            httpResponse.raise_for_status()  # Check for HTTP errors
-            soup = BeautifulSoup(httpResponse.text, 'html.parser')
-            
-            articles_scraped = 0
-
-            # Scrape headlines, links, and images
-            for articleTag in soup.find_all(['h2', 'h3']):
-                if articles_scraped >= 4:
-                    break
-                headlineTag = articleTag.get_text(strip=True)
-                linkTag = articleTag.find_parent('a')
-                imageTag = articleTag.find_previous('img')  # Find the image related to the article
-
-                # Default values
-                title = "No title available"
-                link = "No link available"
-                image_url = None
-
-                if headlineTag and linkTag:
-                    title = headlineTag
-                    link = urljoin(url, linkTag['href'])
-                    if imageTag and 'src' in imageTag.attrs:
-                        image_url = urljoin(url, imageTag['src'])
-
-                    articles.append({
-                        'title': title,
-                        'link': link,
-                        'image_url': image_url
-                    })
-                articles_scraped +=1
-        except requests.RequestException as e:
-            print(f"Error fetching articles from {siteName}: {e}")
-
-    return articles
-
-# Format and compile weekly news messages
-def compile_news_weekly(articles):
-    messages = []
-    for article in articles:  # Format each article posting
-        message_text = f"*Headline:* {article['title']}\n*Link:* {article['link']}\n"
-        
-        # Prepare attachment with image if available
-        attachments = []
-        if article['image_url']:
-            attachments.append({
-                "fallback": "Image not available.",
-                "text": "Image Preview :)",
-                "image_url": article['image_url']
-            })
-
-        messages.append({
-            "text": message_text,
-            "attachments": attachments
-        })
-    
-    return messages
-
-# Post the compiled messages to the Tech News channel on Slack
-def post_news_message_to_slack(messages):
-    messageMax = 7  # Max number of messages to post
-    messageCount = 0
-    
-    try:
-        for message in messages:
-            if messageCount >= messageMax:
-                break
-            client.chat_postMessage(
-                channel=TECH_NEWS_ID,
-                text=message["text"],
-                attachments=message["attachments"]
-            )
-            messageCount += 1
-            
-    except SlackApiError as e:
-        print(f"Error posting message to Slack: {e.response['error']}")
-
-# Schedule the weekly news job to run every Monday
-def schedule_news_weekly():
-    schedule.every().monday.at("09:00").do(run_news_weekly_job)
-
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  
-
-# Execute the news scraping and posting process
-def run_news_weekly_job():
-    articles = find_articles()
-    messages = compile_news_weekly(articles)
-    post_news_message_to_slack(messages)
-
-# Initialize Reddit API client
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID,
-    client_secret=REDDIT_SECRET,
-    user_agent=REDDIT_USER_AGENT
-)
-
-# Scrape memes from a specific subreddit
-def scrape_reddit_memes(subredditName, limit=3):
-    memes = []
-    subreddit = reddit.subreddit(subredditName)
-
-    for submission in subreddit.hot(limit=limit):
-        if not submission.stickied:
-            if submission.url.endswith(('jpg', 'png', 'gif', 'jpeg')) and not submission.over_18:
-                meme = {
-                    'title': submission.title,
-                    'url' : submission.url,
-                    'permalink': submission.permalink,
-                    'image_url': submission.url 
-                }
-            memes.append(meme)
-
-    return memes
-
-# Post memes to the Community Memes channel on Slack
-def post_reddit_memes_to_slack(memes):
-    for meme in memes:
-        try:
-            attachments = []
-            if meme['image_url']:
-                attachments.append({
-                    "fallback": "Image not available.",
-                    "text": f"<https://reddit.com{meme['permalink']}|{meme['title']}>",  
-                    "image_url": meme['image_url'],      
-                })
-            client.chat_postMessage(
-                channel=COMMUNITY_MEMES_ID,  # Community Memes channel ID
-                text= f"*{meme['title']}*",
-                attachments=attachments
-            )
-        except SlackApiError as e:
-            print(f"Error posting meme to Slack: {e.response['error']}")
-
-# Run the daily meme job to scrape and post memes
-def run_daily_meme_job():
-    memes = scrape_reddit_memes('ProgrammerHumor', limit=3)
-    post_reddit_memes_to_slack(memes)
-
-# Schedule the daily meme job to run every day
-def schedule_meme_job():
-    schedule.every().day.at("12:00").do(run_daily_meme_job)
+        state_store.delete(f"welcomed:{user_id}")
 
 @app.route('/')
 def home():
     return "Your Flask app is running!"
 
-# Main function to start the app and schedule jobs
+BACKFILL_PAGE_SIZE = 200  # Members per conversations.members page
+BACKFILL_LOCK_TTL = 60 * 60  # Seconds before a crashed backfill stops blocking the next one
+
+# Welcome every member of the member log channel who hasn't been welcomed yet, e.g. after
+# the bot was added to a channel that already has members. Runs in the background.
+@app.route('/admin/backfill-welcomes', methods=['POST'])
+def backfill_welcomes_endpoint():
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {ADMIN_TOKEN}"):
+        return {"error": "forbidden"}, 403
+    if not state_store.claim("backfill_welcomes", BACKFILL_LOCK_TTL):
+        return {"status": "already running"}, 409
+    threading.Thread(target=backfill_welcomes, name="welcome-backfill", daemon=True).start()
+    return {"status": "started", "channel": MEMBER_LOG_ID}, 202
+
+# Page through the channel's members with conversations.members and welcome each page's
+# new members as one batch
+def backfill_welcomes():
+    welcomed = 0
+    try:
+        bot_user_id = slack_poster.call("auth.test")["user_id"]
+        cursor = None
+        while True:
+            page = slack_poster.call("conversations.members", channel=MEMBER_LOG_ID, limit=BACKFILL_PAGE_SIZE, cursor=cursor)
+            new_users = [user_id for user_id in page["members"] if user_id != bot_user_id and state_store.claim(f"welcomed:{user_id}")]
+            welcome_users(new_users)
+            welcomed += len(new_users)
+            cursor = page.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+        logger.info("Welcome backfill finished: %d members welcomed", welcomed)
+    except SlackApiError as e:
+        logger.error("Welcome backfill stopped after %d members: %s", welcomed, e.response['error'])
+    finally:
+        state_store.delete("backfill_welcomes")
+
+# Request timing and the /metrics endpoint, merged across every gunicorn worker (see metrics.py)
+# Set METRICS_ENABLED=false to turn both off.
+HTTP_REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Time to answer an HTTP request, by path and status")
+metrics.register_collector("event_dispatcher", "Event queue stats", event_dispatcher.stats)
+metrics.register_collector("dm_channel_cache", "IM channel cache stats", dm_channel_cache.stats)
+metrics.register_collector("welcome_batch", "Welcome batching stats", welcome_batch.stats)
+metrics.register_collector("replay_cache", "Acked event ID cache stats", replay_cache.stats)
+metrics.register_collector("log_queue", "Log queue stats", log_stats)
+
+if metrics.METRICS_ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, path=request.url_rule.rule if request.url_rule else "other", status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Registered after the request timer, so absorbed retries are timed too
+# X-Slack-No-Retry tells Slack not to retry the delivery again.
+@app.before_request
+def absorb_slack_retries():
+    if request.path != '/slack/events' or request.method != 'POST':
+        return None
+    g.slack_event_id = event_id_from_body(request.get_data())
+    if absorb_retry(g.slack_event_id, request.headers.get('X-Slack-Retry-Reason')):
+        return Response(status=200, headers={"X-Slack-No-Retry": "1"})
+
+# Remember events once they've been acked, so their retries are absorbed
+@app.after_request
+def remember_slack_event(response):
+    if response.status_code == 200 and g.get('slack_event_id'):
+        replay_cache.add(g.slack_event_id)
+    return response
+
+# Weekly news and daily meme jobs run on a background scheduler thread (see scheduler.py).
+# Every gunicorn worker starts one, but only the worker holding the leader lock runs jobs.
+# Set RUN_SCHEDULER=false when the jobs run in a separate `python scheduler.py` process.
+if os.getenv('RUN_SCHEDULER', 'true').lower() != 'false':
+    start_scheduler_thread()
+
+# A welcome batch whose flush timer died with its worker is flushed by the next sweep in
+# any process, once the batch's flush key has expired (see welcome_batch.py)
+if WELCOME_BATCH_SECONDS > 0 and WELCOME_SWEEP_SECONDS > 0:
+    welcome_batch.start(WELCOME_SWEEP_SECONDS, welcome_users)
+
+# Posts left behind by a crash or a Slack outage are delivered by every process's drainer;
+# claiming a record is atomic, so each is sent once
+start_outbox_drainer()
+
+# Main function to start the app
 if __name__ == "__main__":
-    schedule_news_weekly()  # Schedule weekly news job
-    schedule_meme_job()  # Schedule daily meme job
+    metrics.prune()  # Drop earlier runs' metrics, as gunicorn_config.py does under gunicorn
     app.run(port=8000)
-    
-    
@@ -0,0 +1,60 @@
+# Cache of user ID -> IM channel ID, so repeat DMs skip conversations.open
+# A small in-process LRU sits in front of the shared state store (state_store.py), which
+# makes entries visible to every worker and keeps them across restarts. Entries expire
+# after a TTL and are dropped when Slack reports the channel is gone.
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL = 30 * 24 * 60 * 60  # IM channel IDs are stable, so keep them for a month
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class DmChannelCache:
+    def __init__(self, store, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local = OrderedDict()  # user_id -> channel_id, least recently used first
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remember(self, user_id, channel_id):
+        with self.lock:
+            self.local[user_id] = channel_id
+            self.local.move_to_end(user_id)
+            while len(self.local) > self.max_entries:
+                self.local.popitem(last=False)
+
+    # Cached IM channel for a user, or None
+    # The in-process LRU isn't checked against the TTL; a stale ID is caught by channel_not_found.
+    def get(self, user_id):
+        with self.lock:
+            channel_id = self.local.get(user_id)
+            if channel_id:
+                self.local.move_to_end(user_id)
+        if channel_id is None:
+            channel_id = self.store.get(f"dm_channel:{user_id}")
+            if channel_id:
+                self._remember(user_id, channel_id)
+        if channel_id:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return channel_id
+
+    def set(self, user_id, channel_id):
+        self.store.set(f"dm_channel:{user_id}", channel_id, self.ttl)
+        self._remember(user_id, channel_id)
+
+    def invalidate(self, user_id):
+        self.invalidations += 1
+        with self.lock:
+            self.local.pop(user_id, None)
+        self.store.delete(f"dm_channel:{user_id}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "size": len(self.local)}
@@ -0,0 +1,118 @@
+# Background dispatch queue for Slack events
+# The /slack/events handler only enqueues the event and returns 200, and a small
+# pool of worker threads drains the queue and makes the Slack API calls.
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+from log_setup import event_context
+
+SAMPLE_WINDOW = 1024  # Number of recent timings kept for percentiles
+
+logger = logging.getLogger(__name__)
+
+EVENT_ACK_SECONDS = metrics.histogram("slack_event_ack_seconds", "Time to queue an event before acking it")
+EVENT_QUEUE_WAIT_SECONDS = metrics.histogram("slack_event_queue_wait_seconds", "Time events wait in the queue for a worker")
+EVENT_HANDLER_SECONDS = metrics.histogram("slack_event_handler_seconds", "Time spent handling an event")
+EVENTS_TOTAL = metrics.counter("slack_events_total", "Events handled, by handler and outcome")
+
+
+# Return the given percentile (0-100) of a list of samples
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class EventDispatcher:
+    def __init__(self, workers=4, maxsize=1000):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.threads = []
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.overflow = 0  # Events run inline because the queue was full
+        self.ack_latency = deque(maxlen=SAMPLE_WINDOW)
+        self.queue_wait = deque(maxlen=SAMPLE_WINDOW)
+        self.handler_latency = deque(maxlen=SAMPLE_WINDOW)
+
+    # Start the worker threads on first use, so each gunicorn worker gets its own pool after fork
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"event-worker-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    # Queue a handler call and return straight away
+    def submit(self, handler, event_data):
+        started = time.perf_counter()
+        self.start()
+        try:
+            self.queue.put_nowait((handler, event_data, time.perf_counter()))
+            self.enqueued += 1
+        except queue.Full:
+            # Never drop an event: fall back to handling it on the request thread
+            self.overflow += 1
+            logger.warning("Event queue full (%d), handling event inline", self.queue.maxsize)
+            self._run(handler, event_data)
+        self.ack_latency.append(time.perf_counter() - started)
+        EVENT_ACK_SECONDS.observe(self.ack_latency[-1])
+
+    # Worker loop: drain the queue and run each handler
+    def _work(self):
+        while True:
+            handler, event_data, enqueued_at = self.queue.get()
+            self.queue_wait.append(time.perf_counter() - enqueued_at)
+            EVENT_QUEUE_WAIT_SECONDS.observe(self.queue_wait[-1])
+            try:
+                self._run(handler, event_data)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, handler, event_data):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            with event_context(event_data):
+                handler(event_data)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            outcome = "error"
+            logger.exception("Error handling event %s: %s", event_data.get('event_id'), e)
+        finally:
+            self.handler_latency.append(time.perf_counter() - started)
+            EVENT_HANDLER_SECONDS.observe(self.handler_latency[-1], handler=handler.__name__)
+            EVENTS_TOTAL.inc(handler=handler.__name__, outcome=outcome)
+
+    # Block until every queued event has been handled (used on shutdown and in benchmarks)
+    def join(self):
+        self.queue.join()
+
+    # Snapshot of queue depth and latency percentiles, in seconds
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "overflow": self.overflow,
+            "ack_latency_p50": percentile(self.ack_latency, 50),
+            "ack_latency_p99": percentile(self.ack_latency, 99),
+            "queue_wait_p50": percentile(self.queue_wait, 50),
+            "queue_wait_p99": percentile(self.queue_wait, 99),
+            "handler_latency_p50": percentile(self.handler_latency, 50),
+            "handler_latency_p99": percentile(self.handler_latency, 99),
+        }
@@ -0,0 +1,184 @@
+# Single-pass headline extractor for the news scraper
+# Walks the document once, in order, and links each h2/h3 heading to its enclosing <a>
+# and to the last <img> seen before it. This replaces the BeautifulSoup loop that called
+# find_previous('img') per heading, which walked back over the whole document each time.
+# Uses lxml's incremental parser when it is installed and falls back to the standard
+# library's html.parser otherwise. Parsing stops as soon as `limit` headings are seen,
+# and pages can be fed in chunks as they download (extract_articles_from_chunks).
+import codecs
+import os
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional
+    etree = None
+
+HEADING_TAGS = ("h2", "h3")
+FEED_CHUNK_SIZE = 64 * 1024  # Characters fed to the parser at a time
+DEFAULT_PARSER = os.getenv('NEWS_PARSER') or ("lxml" if etree is not None else "html.parser")
+
+
+# Collects articles from parser events; shared by both parser backends
+class _ArticleCollector:
+    def __init__(self, base_url, limit):
+        self.base_url = base_url
+        self.limit = limit
+        self.articles = []
+        self.headings_seen = 0
+        self.last_image_src = None
+        self.done = False
+
+    def image(self, src):
+        self.last_image_src = src
+
+    # Called once per heading with its text, enclosing link and the image seen before it
+    def heading(self, text, href, image_src):
+        if self.done:
+            return
+        if text and href:
+            self.articles.append({
+                'title': text,
+                'link': urljoin(self.base_url, href),
+                'image_url': urljoin(self.base_url, image_src) if image_src else None
+            })
+        self.headings_seen += 1
+        if self.headings_seen >= self.limit:
+            self.done = True
+
+
+# Standard library backend: an event-driven parser that keeps only an anchor stack
+class _StdlibHeadlineParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+        self.anchor_stack = []  # href (or None) of each open <a>
+        self.heading_tag = None  # Tag of the heading being read, if any
+        self.heading_text = []
+        self.heading_href = None
+        self.heading_image = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self.anchor_stack.append(dict(attrs).get("href"))
+        elif tag == "img":
+            self.collector.image(dict(attrs).get("src"))
+        elif tag in HEADING_TAGS and self.heading_tag is None:
+            self.heading_tag = tag
+            self.heading_text = []
+            self.heading_href = self.anchor_stack[-1] if self.anchor_stack else None
+            self.heading_image = self.collector.last_image_src
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "img":
+            self.collector.image(dict(attrs).get("src"))
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self.anchor_stack:
+            self.anchor_stack.pop()
+        elif tag == self.heading_tag:
+            text = "".join(self.heading_text)
+            self.heading_tag = None
+            self.collector.heading(text, self.heading_href, self.heading_image)
+
+    def handle_data(self, data):
+        if self.heading_tag is not None:
+            stripped = data.strip()
+            if stripped:
+                self.heading_text.append(stripped)
+
+
+# lxml backend: incremental C parser, reading start/end events as they arrive
+class _LxmlHeadlineParser:
+    def __init__(self, collector):
+        self.collector = collector
+        self.parser = etree.HTMLPullParser(events=("start", "end"))
+        self.heading = None
+        self.heading_image = None
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self._drain()
+
+    def close(self):
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        self._drain()
+
+    def _drain(self):
+        for event, element in self.parser.read_events():
+            if self.collector.done:
+                return
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue  # Comments and processing instructions
+            if event == "start":
+                if tag == "img":
+                    self.collector.image(element.get("src"))
+                elif tag in HEADING_TAGS and self.heading is None:
+                    self.heading = element
+                    self.heading_image = self.collector.last_image_src
+            elif element is self.heading:
+                text = "".join(part.strip() for part in element.itertext())
+                anchor = next(element.iterancestors("a"), None)
+                href = anchor.get("href") if anchor is not None else None
+                self.heading = None
+                self.collector.heading(text, href, self.heading_image)
+
+
+# Incremental extractor: feed() page text as it arrives, stop once .done is set
+class HeadlineExtractor:
+    def __init__(self, base_url, limit=4, parser=None):
+        self.collector = _ArticleCollector(base_url, limit)
+        parser = parser or DEFAULT_PARSER
+        if parser == "lxml" and etree is not None:
+            self.backend = _LxmlHeadlineParser(self.collector)
+        else:
+            self.backend = _StdlibHeadlineParser(self.collector)
+
+    @property
+    def done(self):
+        return self.collector.done
+
+    @property
+    def articles(self):
+        return self.collector.articles
+
+    def feed(self, data):
+        if not self.done:
+            self.backend.feed(data)
+
+    def close(self):
+        if not self.done:
+            self.backend.close()
+        return self.articles
+
+
+# Extract up to `limit` headings from a whole page, stopping early once they are found
+def extract_articles(html, base_url, limit=4, parser=None):
+    extractor = HeadlineExtractor(base_url, limit, parser)
+    for start in range(0, len(html), FEED_CHUNK_SIZE):
+        extractor.feed(html[start:start + FEED_CHUNK_SIZE])
+        if extractor.done:
+            break
+    return extractor.close()
+
+
+# Extract up to `limit` headings from a stream of raw byte chunks (e.g. iter_content)
+# Stops pulling chunks as soon as enough headings are found, so the rest of the page is
+# never downloaded, decoded or held in memory.
+def extract_articles_from_chunks(chunks, base_url, limit=4, parser=None, encoding=None):
+    try:
+        decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    extractor = HeadlineExtractor(base_url, limit, parser)
+    for chunk in chunks:
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done:
+            return extractor.articles
+    extractor.feed(decoder.decode(b"", final=True))
+    return extractor.close()
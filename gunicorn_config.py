@@ -1,3 +1,9 @@
+import metrics
+
 bind = "0.0.0.0:8000"
 workers = 3 
 
+
+# Start every deploy with fresh metrics; each worker writes its own file (see metrics.py)
+def on_starting(server):
+    metrics.clear()
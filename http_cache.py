@@ -0,0 +1,100 @@
+# Persistent conditional-GET cache for scraped news pages
+# For each page the cache keeps its ETag / Last-Modified validators, its size and the
+# articles scraped from it. The next fetch sends If-None-Match / If-Modified-Since; on a
+# 304 the stored articles are reused without downloading or parsing the page again.
+# Entries carry the fingerprint of the site profile they were scraped with (see
+# site_profiles.py), so after a change to a site's limit, selectors, parser or feed the
+# page is fetched and scraped again even if the server says it hasn't changed.
+# The store is bounded in bytes of stored articles and evicts the least recently used
+# pages first.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class HttpCache:
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY, fingerprint TEXT, etag TEXT, last_modified TEXT,"
+            " size INTEGER NOT NULL, last_access REAL NOT NULL, parsed TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+        # Counters
+        self.hits = 0  # 304 responses served from the cache
+        self.misses = 0  # Full downloads
+        self.stale = 0  # Entries ignored because they were scraped with a different profile
+        self.bytes_saved = 0  # Page bytes not downloaded thanks to a 304
+
+    # Request headers that let the server answer 304 Not Modified
+    # Empty when the page isn't cached with this profile fingerprint, so it's fetched in full.
+    def conditional_headers(self, url, fingerprint=None):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified FROM pages WHERE url = ? AND fingerprint IS ?", (url, fingerprint)
+            ).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    # Articles stored for a page that came back 304, or None if the page isn't cached
+    # (or was scraped with a different profile)
+    def not_modified(self, url, fingerprint=None):
+        with self.lock:
+            row = self.conn.execute("SELECT size, parsed, fingerprint FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            if row[2] != fingerprint:
+                self.stale += 1
+                return None
+            self.conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+            self.hits += 1
+            self.bytes_saved += row[0]
+        return json.loads(row[1])
+
+    # Record a full 200 response of `size` bytes and the articles scraped from it
+    def store(self, url, response_headers, size, parsed, fingerprint=None):
+        self.misses += 1
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return  # The server can't answer a conditional GET, so there's nothing to gain
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, fingerprint, etag, last_modified, size, last_access, parsed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, fingerprint, etag, last_modified, size, time.time(), json.dumps(parsed))
+            )
+            self._evict()
+            self.conn.commit()
+
+    # Drop least recently used pages until the stored articles fit in max_bytes
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(LENGTH(parsed)), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self.conn.execute(
+            "SELECT url, LENGTH(parsed) FROM pages ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "bytes_saved": self.bytes_saved}
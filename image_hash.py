@@ -0,0 +1,230 @@
+# Near-duplicate image detection for memes, using perceptual hashes
+# The same meme is often reposted under a different URL (another subreddit, a mirror, a
+# re-encode), so URL dedup in seen_index.py misses it. Each candidate image is downloaded
+# (all at once, on a thread pool) and reduced to a 64-bit difference hash (dHash): the
+# image is shrunk to 9x8 grayscale and each bit records whether a pixel is brighter than
+# its right-hand neighbour. Re-encodes and resizes change only a few bits, so two images
+# are treated as the same when their hashes differ in at most `max_distance` bits.
+#
+# Hashes of posted images are kept in SQLite next to the seen index and loaded into a
+# multi-index hash table, which answers "anything within N bits?" without comparing
+# against every entry.
+#
+# Needs NumPy and Pillow; when either is missing AVAILABLE is False and jobs.py skips
+# this stage.
+import io
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from news_fetcher import get_session
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # NumPy and Pillow are optional
+    np = None
+    Image = None
+
+AVAILABLE = np is not None and Image is not None
+HASH_SIZE = 8  # 8x8 comparisons -> 64-bit hash
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DEFAULT_MAX_DISTANCE = 6  # Bits that may differ between two copies of the same image
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = (5, 15)  # Connect and read timeouts in seconds
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # Don't hash anything bigger than this
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+if hasattr(int, "bit_count"):
+    def hamming(a, b):
+        return (a ^ b).bit_count()
+else:  # Python < 3.10
+    def hamming(a, b):
+        return bin(a ^ b).count("1")
+
+
+# Shrink an encoded image to the (HASH_SIZE, HASH_SIZE + 1) grayscale grid dHash compares
+def _thumbnail(data):
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # Lets JPEG decode at reduced size
+        image = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+        return np.asarray(image, dtype=np.int16)
+
+
+# dHash of several images at once; the comparisons and bit packing run over the whole batch
+def dhash_many(thumbnails):
+    if not thumbnails:
+        return []
+    grids = np.stack(thumbnails)  # (n, 8, 9)
+    bits = (grids[:, :, 1:] > grids[:, :, :-1]).reshape(len(thumbnails), -1)  # (n, 64)
+    packed = np.packbits(bits, axis=1)  # (n, 8) bytes, most significant bit first
+    return [int(value) for value in packed.view(">u8").ravel()]
+
+
+def dhash(data):
+    return dhash_many([_thumbnail(data)])[0]
+
+
+# Multi-index hash table for "anything within `radius` bits?" lookups
+# The 64 bits are split into radius + 1 chunks. Two hashes that differ in at most `radius`
+# bits must agree exactly on at least one chunk (pigeonhole), so a lookup only compares
+# against hashes that share a chunk with it, found through one dict per chunk.
+class HashTable:
+    def __init__(self, radius):
+        self.radius = radius
+        chunks = radius + 1
+        self.chunks = []  # (shift, mask) of each chunk
+        shift = 0
+        for i in range(chunks):
+            width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.chunks]  # Chunk value -> hashes with that chunk
+        self.values = {}  # Hash -> values stored under it
+        self.size = 0
+
+    def add(self, value_hash, value):
+        self.size += 1
+        if value_hash in self.values:
+            self.values[value_hash].append(value)
+            return
+        self.values[value_hash] = [value]
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            table.setdefault((value_hash >> shift) & mask, []).append(value_hash)
+
+    # Closest (distance, hash, values) within radius, or None
+    def find(self, value_hash):
+        if value_hash in self.values:
+            return 0, value_hash, self.values[value_hash]
+        best = None
+        compared = set()
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            for candidate in table.get((value_hash >> shift) & mask, ()):
+                if candidate in compared:
+                    continue
+                compared.add(candidate)
+                distance = hamming(value_hash, candidate)
+                if distance <= self.radius and (best is None or distance < best[0]):
+                    best = (distance, candidate, self.values[candidate])
+        return best
+
+
+# Download an image, giving up on anything that isn't an image or is too large
+def download_image(url, session=None):
+    session = session or get_session()
+    with session.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        if not response.headers.get("Content-Type", "image/").startswith("image/"):
+            raise ValueError(f"Not an image: {url}")
+        data = bytearray()
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            data += chunk
+            if len(data) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image too large: {url}")
+        return bytes(data)
+
+
+# Download and hash images concurrently; returns {url: hash}, leaving out any that failed
+def hash_images(urls, workers=DOWNLOAD_WORKERS):
+    def fetch(url):
+        try:
+            return url, _thumbnail(download_image(url))
+        except Exception as e:
+            logger.warning("Couldn't hash image %s: %s", url, e)
+            return url, None
+
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls)), thread_name_prefix="image-hash") as executor:
+        thumbnails = [(url, thumbnail) for url, thumbnail in executor.map(fetch, urls) if thumbnail is not None]
+    return dict(zip((url for url, _ in thumbnails), dhash_many([thumbnail for _, thumbnail in thumbnails])))
+
+
+# Stored 64-bit hashes are unsigned; SQLite integers are signed
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class ImageHashIndex:
+    def __init__(self, path, retention=90 * 24 * 60 * 60, max_distance=DEFAULT_MAX_DISTANCE):
+        self.retention = retention
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS image_hashes (hash INTEGER NOT NULL, key TEXT NOT NULL, first_seen REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS image_hashes_first_seen ON image_hashes (first_seen)")
+
+        # Counters
+        self.hashed = 0  # Candidate images downloaded and hashed
+        self.duplicates = 0  # Candidates dropped as near-duplicates
+
+        self.compact()
+
+    # Add hashes written since the last load (e.g. by another process) to the table
+    def _load_new_hashes(self):
+        for value_hash, key, first_seen in self.conn.execute(
+            "SELECT hash, key, first_seen FROM image_hashes WHERE first_seen > ? ORDER BY first_seen", (self.loaded_until,)
+        ):
+            self.table.add(_to_unsigned(value_hash), key)
+            self.loaded_until = first_seen
+
+    # Drop hashes older than the retention window and rebuild the table
+    def compact(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM image_hashes WHERE first_seen < ?", (time.time() - self.retention,))
+            self.table = HashTable(self.max_distance)
+            self.loaded_until = 0.0
+            self._load_new_hashes()
+
+    def refresh(self):
+        with self.lock:
+            self._load_new_hashes()
+
+    # Key of a previously posted image within max_distance bits of this hash, or None
+    def find(self, value_hash):
+        with self.lock:
+            match = self.table.find(value_hash)
+        return match[2][0] if match else None
+
+    def add(self, value_hash, key):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT INTO image_hashes (hash, key, first_seen) VALUES (?, ?, ?)", (_to_signed(value_hash), key, now))
+            self._load_new_hashes()  # Picks up the new row, and any added by other processes
+
+    # Drop memes whose image matches an already posted image, or an earlier meme in the
+    # same list. Kept memes get an "image_hash" to record with add() once posted; memes
+    # whose image couldn't be downloaded are kept without one. A meme that already has an
+    # "image_hash" (kept by an earlier call) isn't downloaded again.
+    def drop_near_duplicates(self, memes):
+        self.refresh()
+        hashes = hash_images(meme['image_url'] for meme in memes if meme['image_url'] and meme.get('image_hash') is None)
+        self.hashed += len(hashes)
+        batch = HashTable(self.max_distance)
+        kept = []
+        for meme in memes:
+            value_hash = meme.get('image_hash')
+            if value_hash is None:
+                value_hash = hashes.get(meme['image_url'])
+            if value_hash is not None:
+                if self.find(value_hash) or batch.find(value_hash):
+                    self.duplicates += 1
+                    continue
+                batch.add(value_hash, meme['id'])
+                meme = {**meme, "image_hash": value_hash}
+            kept.append(meme)
+        return kept
+
+    def stats(self):
+        return {"hashed": self.hashed, "duplicates": self.duplicates, "indexed": self.table.size}
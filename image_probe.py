@@ -0,0 +1,198 @@
+# Check preview image URLs before they are attached to a Slack message
+# Scraped image URLs are often lazy-load placeholders, data: URIs, tracking pixels or
+# files Slack can't render, and Slack silently drops the preview. Each URL is probed with
+# a ranged GET over the shared fetch session: the response headers give the content type
+# and the total size (Content-Range), and only the first few KiB are read to find the
+# width and height in the image header. All URLs are probed at once on a thread pool,
+# and results are cached by URL, so an image that shows up again isn't probed again.
+# Only definitive answers are kept for CACHE_TTL; a timeout, connection error or server
+# error is kept for FAILURE_CACHE_TTL, so one transient CDN error doesn't drop an image
+# for a day.
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from news_fetcher import get_session
+
+SUPPORTED_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}  # What Slack unfurls
+MIN_DIMENSION = 32  # Anything smaller is a tracking pixel or spacer
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+PROBE_BYTES = 64 * 1024  # Most JPEGs have their size within the first few KiB, EXIF data permitting
+PROBE_CHUNK_SIZE = 4 * 1024
+PROBE_TIMEOUT = (3, 5)  # Connect and read timeouts in seconds
+PROBE_WORKERS = 16
+CACHE_TTL = 24 * 60 * 60
+FAILURE_CACHE_TTL = 5 * 60  # For transient failures
+TRANSIENT_STATUSES = {408, 429}  # Besides 5xx
+CACHE_MAX_ENTRIES = 2000
+
+# URLs that mark an image as a placeholder rather than content: "placeholder" anywhere, or
+# a file named just spacer.gif, blank-1x1.png, pixel.gif and the like
+PLACEHOLDER_PATTERN = re.compile(
+    r"placeholder|/(spacer|blank|transparent|lazy-?load|loading|1x1|pixel)([_.-]?\d+(x\d+)?)?\.\w+$",
+    re.IGNORECASE,
+)
+
+
+# Width and height from the start of a PNG, GIF, JPEG or WebP file, or None
+def image_dimensions(data):
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return None
+    if data[:2] == b"\xff\xd8":
+        # Walk the JPEG segments to the start-of-frame marker
+        position = 2
+        while position + 9 <= len(data):
+            if data[position] != 0xFF:
+                return None
+            marker = data[position + 1]
+            if marker == 0xFF:  # Fill byte
+                position += 1
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[position + 5:position + 9])
+                return width, height
+            position += 2 + struct.unpack(">H", data[position + 2:position + 4])[0]
+    return None
+
+
+# Why a URL can't be a preview without fetching it, or None
+def reject_without_fetching(url):
+    if not url:
+        return "missing"
+    if not url.lower().startswith(("http://", "https://")):
+        return "not http"  # data: URIs, relative or protocol-less leftovers
+    if PLACEHOLDER_PATTERN.search(url.split("?", 1)[0]):
+        return "placeholder"
+    return None
+
+
+class ImageProber:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, workers=PROBE_WORKERS, failure_ttl=FAILURE_CACHE_TTL):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        self.workers = workers
+        self.cache = OrderedDict()  # url -> (expires at, result), least recently used first
+        self.lock = threading.Lock()
+
+        # Counters
+        self.probes = 0  # Requests made
+        self.cache_hits = 0
+        self.rejected = 0  # URLs found unusable
+        self.bytes_read = 0
+
+    def _cached(self, url):
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry and time.monotonic() < entry[0]:
+                self.cache.move_to_end(url)
+                self.cache_hits += 1
+                return entry[1]
+        return None
+
+    def _remember(self, url, result, transient=False):
+        expires_at = time.monotonic() + (self.failure_ttl if transient else self.ttl)
+        with self.lock:
+            self.cache[url] = (expires_at, result)
+            self.cache.move_to_end(url)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    # Fetch just enough of an image to check it
+    # Returns {"ok", "reason", "status", "content_type", "size", "width", "height"}
+    def _fetch(self, url):
+        result = {"ok": False, "reason": None, "status": None, "content_type": None, "size": None, "width": None, "height": None}
+        self.probes += 1
+        headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+        with get_session().get(url, headers=headers, timeout=PROBE_TIMEOUT, stream=True, allow_redirects=True) as response:
+            result["status"] = response.status_code
+            if response.status_code not in (200, 206):
+                result["reason"] = f"HTTP {response.status_code}"
+                return result
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            result["content_type"] = content_type
+            if content_type not in SUPPORTED_TYPES:
+                result["reason"] = f"unsupported type {content_type or 'unknown'}"
+                return result
+
+            # Total size from "Content-Range: bytes 0-65535/123456", or Content-Length on a 200
+            content_range = response.headers.get("Content-Range", "")
+            if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                result["size"] = int(content_range.rsplit("/", 1)[1])
+            elif response.status_code == 200 and response.headers.get("Content-Length", "").isdigit():
+                result["size"] = int(response.headers["Content-Length"])
+            if result["size"] is not None and result["size"] > MAX_IMAGE_BYTES:
+                result["reason"] = "too large"
+                return result
+
+            # Read header bytes until the dimensions turn up; closing drops the rest
+            data = b""
+            for chunk in response.iter_content(PROBE_CHUNK_SIZE):
+                data += chunk
+                dimensions = image_dimensions(data)
+                if dimensions or len(data) >= PROBE_BYTES:
+                    break
+            else:
+                dimensions = image_dimensions(data)
+            self.bytes_read += len(data)
+
+        if dimensions is None:
+            result["reason"] = "unreadable image header"
+            return result
+        result["width"], result["height"] = dimensions
+        if min(dimensions) < MIN_DIMENSION:
+            result["reason"] = "too small"
+            return result
+        result["ok"] = True
+        return result
+
+    def probe(self, url):
+        cached = self._cached(url)
+        if cached is not None:
+            return cached
+        reason = reject_without_fetching(url)
+        transient = False
+        if reason:
+            result = {"ok": False, "reason": reason}
+        else:
+            try:
+                result = self._fetch(url)
+                transient = result["status"] >= 500 or result["status"] in TRANSIENT_STATUSES
+            except Exception as e:
+                result = {"ok": False, "reason": f"error: {e}"}
+                transient = True  # Timeouts and connection errors
+        if not result["ok"]:
+            self.rejected += 1
+        self._remember(url, result, transient)
+        return result
+
+    # Probe several URLs at once; returns {url: result}
+    def probe_many(self, urls):
+        urls = [url for url in dict.fromkeys(urls) if url]
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls)), thread_name_prefix="image-probe") as executor:
+            return dict(zip(urls, executor.map(self.probe, urls)))
+
+    # Usable preview URLs out of the given ones
+    def usable(self, urls):
+        return {url for url, result in self.probe_many(urls).items() if result["ok"]}
+
+    def stats(self):
+        return {"probes": self.probes, "cache_hits": self.cache_hits, "rejected": self.rejected, "bytes_read": self.bytes_read}
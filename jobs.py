@@ -0,0 +1,325 @@
+# Scheduled content jobs: the weekly tech news post and the daily meme post
+# Kept out of bot.py so the web workers that serve /slack/events never import the
+# scrapers, PRAW, NumPy or Pillow; this module is only imported by the process that runs
+# the jobs (see scheduler.py) and by asgi_app.py when a job runs there. It gets the Slack
+# poster and outbox from slack_setup.py, never from bot.py.
+import hashlib
+import logging
+import os
+import time
+
+import image_hash
+import metrics
+from http_cache import HttpCache
+from image_probe import ImageProber
+from meme_harvester import MemeHarvester
+from news_ranker import rank_articles
+from news_fetcher import fetch_all, read_chunks
+from outbox import chat_post, failure_reason
+from seen_index import SeenIndex, article_key, meme_keys
+from site_profiles import load_site_profiles, extract_site, extract_site_feed, extract_site_stream, feed_source
+from slack_setup import COMMUNITY_MEMES_ID, TECH_NEWS_ID, outbox, slack_poster, start_outbox_drainer
+
+logger = logging.getLogger(__name__)
+
+# Web scraping tech headlines from the sites listed in news_sites.json
+# Each site has an extraction profile (selectors, item limit, parser) and a fetch budget;
+# see site_profiles.py. Profiles are loaded and their selectors compiled once at startup.
+NEWS_SITES_FILE = os.getenv('NEWS_SITES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_sites.json'))
+NEWS_SITES = load_site_profiles(NEWS_SITES_FILE)
+NEWS_JOB_DEADLINE = int(os.getenv('NEWS_JOB_DEADLINE', 60))  # Seconds for fetching every site
+NEWS_MESSAGE_MAX = 7  # Max number of articles to post
+NEWS_DIGEST = os.getenv('NEWS_DIGEST', 'false').lower() == 'true'  # Post one Block Kit digest instead of one message per article
+
+# On-disk conditional-GET cache for news pages (set NEWS_CACHE_DIR to an empty string to disable)
+NEWS_CACHE_DIR = os.getenv('NEWS_CACHE_DIR', '.news_cache')
+NEWS_CACHE_MAX_BYTES = int(os.getenv('NEWS_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+news_cache = HttpCache(NEWS_CACHE_DIR, NEWS_CACHE_MAX_BYTES) if NEWS_CACHE_DIR else None
+
+def find_articles():
+    articles = []  # Store scraped articles
+    started = time.monotonic()
+
+    # Fetch every site at the same time, from its feed when it has one, and read each
+    # feed or page as it arrives
+    sources = [feed_source(site) if site['feed'] else site for site in NEWS_SITES]
+    results = fetch_all(sources, scrape_site, deadline=NEWS_JOB_DEADLINE, cache=news_cache)
+
+    # Scrape the pages of sites whose feed failed or was empty, in the time left
+    fallback = [site for site in NEWS_SITES if site['feed'] and not results.get(site['name'])]
+    remaining = NEWS_JOB_DEADLINE - (time.monotonic() - started)
+    if fallback and remaining > 0:
+        logger.info("Scraping %d sites whose feeds had no stories: %s", len(fallback), ", ".join(site['name'] for site in fallback))
+        results.update(fetch_all(fallback, scrape_site, deadline=remaining, cache=news_cache))
+    if news_cache:
+        logger.info("News page cache: %s", news_cache.stats())
+
+    # Keep the articles in config file order, tagged with the site they came from
+    for site in NEWS_SITES:
+        articles.extend({**article, 'source': site['name']} for article in results.get(site['name'], []))
+
+    return articles
+
+# Scrape headlines, links, and images from one fetched feed or page using the site's profile
+# Feeds and streaming sites are parsed as they download, and the download stops once the
+# site's article limit is reached
+def scrape_site(site, httpResponse):
+    if site['is_feed']:
+        return extract_site_feed(site, read_chunks(httpResponse))
+    if site['stream']:
+        return extract_site_stream(site, read_chunks(httpResponse), httpResponse.encoding)
+    return extract_site(site, httpResponse.text)
+
+# Index of articles and memes already posted, so they aren't posted again (see seen_index.py)
+SEEN_INDEX_PATH = os.getenv('SEEN_INDEX_PATH', 'seen_content.db')
+SEEN_RETENTION_DAYS = int(os.getenv('SEEN_RETENTION_DAYS', 90))
+seen_index = SeenIndex(SEEN_INDEX_PATH, retention=SEEN_RETENTION_DAYS * 24 * 60 * 60)
+
+# Checks preview images before they're attached, so broken previews are left off (see image_probe.py)
+image_prober = ImageProber()
+
+# Drop preview images that Slack couldn't show; the articles are still posted
+def check_article_images(articles):
+    usable = image_prober.usable(article['image_url'] for article in articles)
+    logger.info("Image probes: %s", image_prober.stats())
+    return [article if article['image_url'] in usable else {**article, 'image_url': None} for article in articles]
+
+JOB_SECONDS = metrics.histogram("job_run_seconds", "Duration of scheduled job runs, by job")
+CONTENT_DEDUP = metrics.counter("content_dedup_total", "Articles and memes checked against the seen index, by kind and result")
+metrics.register_collector("seen_index", "Seen-content index stats", seen_index.stats)
+metrics.register_collector("image_prober", "Preview image probe stats", image_prober.stats)
+if news_cache:
+    metrics.register_collector("news_cache", "News page cache stats", news_cache.stats)
+
+# Drop items that were already posted (or repeat within this run) before any Slack call is made
+def filter_unseen(items, keys_for, kind="article"):
+    seen_index.refresh()
+    unseen = []
+    run_keys = set()
+    for item in items:
+        keys = keys_for(item)
+        if run_keys.intersection(keys) or seen_index.contains_any(keys):
+            CONTENT_DEDUP.inc(kind=kind, result="seen")
+            continue
+        CONTENT_DEDUP.inc(kind=kind, result="new")
+        run_keys.update(keys)
+        unseen.append(item)
+    return unseen
+
+# Format and compile weekly news messages
+def compile_news_weekly(articles):
+    messages = []
+    for article in articles:  # Format each article posting
+        message_text = f"*Headline:* {article['title']}\n*Link:* {article['link']}\n"
+        
+        # Prepare attachment with image if available
+        attachments = []
+        if article['image_url']:
+            attachments.append({
+                "fallback": "Image not available.",
+                "text": "Image Preview :)",
+                "image_url": article['image_url']
+            })
+
+        messages.append({
+            "text": message_text,
+            "attachments": attachments,
+            "seen_keys": [article_key(article)]
+        })
+    
+    return messages
+
+# Escape text for use inside Slack mrkdwn
+def escape_mrkdwn(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+# Combine the articles into a single Block Kit digest message
+def compile_news_digest(articles):
+    blocks = [{"type": "header", "text": {"type": "plain_text", "text": "This Week in Tech :newspaper:"}}]
+    for article in articles:
+        section = {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": f"*<{article['link']}|{escape_mrkdwn(article['title'])}>*"}
+        }
+        if article['image_url']:
+            section["accessory"] = {"type": "image", "image_url": article['image_url'], "alt_text": article['title'][:2000]}
+        blocks.append(section)
+        blocks.append({"type": "divider"})
+
+    return {"text": "This week's tech headlines", "blocks": blocks, "seen_keys": [article_key(article) for article in articles]}
+
+# Outbox key for a post of some content: the same articles or meme always get the same key,
+# so recording a post again (e.g. when a job is rerun after a crash) doesn't post it twice
+def post_key(kind, seen_keys):
+    return f"{kind}:" + hashlib.sha256("\n".join(seen_keys).encode()).hexdigest()[:32]
+
+# Posted articles are added to the seen index by the outbox, before the post is marked sent
+outbox.register_hook("seen_keys", lambda keys: seen_index.add(*keys))
+
+# Outbox posts of the compiled news messages, at most NEWS_MESSAGE_MAX
+def news_posts(messages):
+    posts = []
+    for message in messages[:NEWS_MESSAGE_MAX]:
+        seen_keys = message.get("seen_keys", [])
+        key = post_key("news", seen_keys or [message["text"]])
+        posts.append(chat_post(key, TECH_NEWS_ID, hook="seen_keys", data=seen_keys, text=message["text"], attachments=message["attachments"]))
+    return posts
+
+def digest_post(digest):
+    return chat_post(post_key("news_digest", digest["seen_keys"]), TECH_NEWS_ID, hook="seen_keys", data=digest["seen_keys"], text=digest["text"], blocks=digest["blocks"])
+
+# Record the posts in the outbox (see outbox.py), then send them, logging any that failed
+# Every post is in the outbox before the first is sent, so a crash or a Slack outage part
+# way through leaves the rest to the outbox's drainer
+def post_through_outbox(posts, error_message):
+    outbox.enqueue_many(posts)
+    # A failed message no longer stops the rest from being posted
+    for result in outbox.deliver(post["key"] for post in posts).values():
+        if isinstance(result, Exception):
+            logger.error(error_message, failure_reason(result))
+
+# Post the compiled messages to the Tech News channel on Slack
+def post_news_message_to_slack(messages):
+    post_through_outbox(news_posts(messages), "Error posting message to Slack: %s")
+
+# Post the weekly digest as one message to the Tech News channel on Slack
+def post_news_digest_to_slack(digest):
+    post_through_outbox([digest_post(digest)], "Error posting news digest to Slack: %s")
+
+# This week's articles: new ones only, best first, with broken previews dropped
+def select_news_articles():
+    seen_index.compact()  # Forget articles older than the retention window
+    articles = filter_unseen(find_articles(), lambda article: [article_key(article)])
+    articles = rank_articles(articles, NEWS_MESSAGE_MAX)  # Best candidates first (see news_ranker.py)
+    return check_article_images(articles)  # Only probe what will be posted
+
+# Execute the news scraping and posting process
+# asgi_app.py runs the same steps and sends the posts with AsyncWebClient
+@JOB_SECONDS.time(job="news_weekly")
+def run_news_weekly_job():
+    articles = select_news_articles()
+    if NEWS_DIGEST:
+        post_news_digest_to_slack(compile_news_digest(articles))
+    else:
+        messages = compile_news_weekly(articles)
+        post_news_message_to_slack(messages)
+    logger.info("Slack posting: %s", slack_poster.stats())
+
+# Reddit API credentials
+REDDIT_CLIENT_ID = os.getenv('REDDIT_CLIENT_ID')
+REDDIT_SECRET = os.getenv('REDDIT_SECRET')
+REDDIT_USER_AGENT = "BTD Tech Meme Scraper"
+
+# Build a Reddit API client
+# PRAW clients aren't thread-safe, so the harvester builds one per fetch thread
+# Set REDDIT_API_URL to send every Reddit call somewhere else (benchmarks/fixture_server.py for load tests)
+REDDIT_API_URL = os.getenv('REDDIT_API_URL')
+
+def create_reddit_client():
+    import praw  # Reddit API library; slow to import, so only loaded when memes are fetched
+
+    endpoints = {"oauth_url": REDDIT_API_URL, "reddit_url": REDDIT_API_URL} if REDDIT_API_URL else {}
+    return praw.Reddit(
+        client_id=REDDIT_CLIENT_ID,
+        client_secret=REDDIT_SECRET,
+        user_agent=REDDIT_USER_AGENT,
+        **endpoints
+    )
+
+# Subreddits to take memes from (comma-separated in MEME_SUBREDDITS) and memes per run
+MEME_SUBREDDITS = [name.strip() for name in os.getenv('MEME_SUBREDDITS', 'ProgrammerHumor').split(',') if name.strip()]
+MEMES_PER_RUN = int(os.getenv('MEMES_PER_RUN', 3))
+meme_harvester = MemeHarvester(create_reddit_client)  # Shares one Reddit rate-limit budget across subreddits
+
+# Drop memes whose image looks like one already posted (needs NumPy and Pillow; see image_hash.py)
+MEME_IMAGE_DEDUP = os.getenv('MEME_IMAGE_DEDUP', 'true').lower() != 'false' and image_hash.AVAILABLE
+MEME_IMAGE_MAX_DISTANCE = int(os.getenv('MEME_IMAGE_MAX_DISTANCE', image_hash.DEFAULT_MAX_DISTANCE))
+MEME_CANDIDATES_PER_POST = 2  # Harvest extra candidates to make up for memes the probes or dedup drop
+MEME_HARVEST_ROUNDS = 3  # Harvests per run while memes are still missing
+image_index = None
+if MEME_IMAGE_DEDUP:
+    image_index = image_hash.ImageHashIndex(SEEN_INDEX_PATH, retention=SEEN_RETENTION_DAYS * 24 * 60 * 60, max_distance=MEME_IMAGE_MAX_DISTANCE)
+    metrics.register_collector("image_index", "Near-duplicate image stats", image_index.stats)
+metrics.register_collector("meme_harvester", "Reddit harvest stats", meme_harvester.stats)
+
+def meme_is_seen(meme):
+    seen = seen_index.contains_any(meme_keys(meme))
+    CONTENT_DEDUP.inc(kind="meme", result="seen" if seen else "new")
+    return seen
+
+# Scrape memes from the given subreddits, all at the same time
+# Returns exactly `limit` image posts when the subreddits have that many. The probes and
+# the image dedup can drop candidates, so each round harvests extra ones, and while memes
+# are still missing another round harvests past every candidate already considered.
+def scrape_reddit_memes(subredditNames, limit=3):
+    seen_index.refresh()
+    memes = []
+    considered = set()  # Keys of candidates already harvested, kept or not (so cross-posts match too)
+
+    def is_seen(meme):
+        return any(key in considered for key in meme_keys(meme)) or meme_is_seen(meme)
+
+    for _ in range(MEME_HARVEST_ROUNDS):
+        candidates = meme_harvester.harvest(subredditNames, (limit - len(memes)) * MEME_CANDIDATES_PER_POST, is_seen=is_seen)
+        logger.info("Reddit harvest: %s", meme_harvester.stats())
+        if not candidates:
+            break
+        considered.update(key for meme in candidates for key in meme_keys(meme))
+        # A meme is its image, so drop memes whose image Slack couldn't show
+        usable = image_prober.usable(meme['image_url'] for meme in candidates)
+        memes += [meme for meme in candidates if meme['image_url'] in usable]
+        logger.info("Image probes: %s", image_prober.stats())
+        if image_index:
+            memes = image_index.drop_near_duplicates(memes)  # Earlier rounds' memes keep their hashes
+            logger.info("Image dedup: %s", image_index.stats())
+        if len(memes) >= limit:
+            break
+    return memes[:limit]
+
+# Record a posted meme so neither it nor a copy of its image is posted again
+def mark_meme_posted(meme):
+    seen_index.add(*meme_keys(meme))
+    if image_index and meme.get('image_hash') is not None:
+        image_index.add(meme['image_hash'], meme_keys(meme)[0])
+
+outbox.register_hook("meme_posted", mark_meme_posted)
+
+# Records with these hooks are only drained by a process that imported this module, so a
+# worker that runs just the jobs (`python scheduler.py`) needs a drainer of its own; in
+# the web app this is the drainer bot.py already started
+start_outbox_drainer()
+
+# Outbox post of a meme; the outbox records it as posted (mark_meme_posted) once it's sent
+def meme_post(meme):
+    attachments = []
+    if meme['image_url']:
+        attachments.append({
+            "fallback": "Image not available.",
+            "text": f"<https://reddit.com{meme['permalink']}|{meme['title']}>",
+            "image_url": meme['image_url'],
+        })
+    image_hash = int(meme['image_hash']) if meme.get('image_hash') is not None else None
+    return chat_post(
+        post_key("meme", meme_keys(meme)),
+        COMMUNITY_MEMES_ID,  # Community Memes channel ID
+        hook="meme_posted",
+        data={'id': meme['id'], 'url': meme['url'], 'image_hash': image_hash},
+        text=f"*{meme['title']}*",
+        attachments=attachments
+    )
+
+# Post memes to the Community Memes channel on Slack, through the outbox
+def post_reddit_memes_to_slack(memes):
+    post_through_outbox([meme_post(meme) for meme in memes], "Error posting meme to Slack: %s")
+
+# Today's memes, not posted before
+def select_memes():
+    if image_index:
+        image_index.compact()  # Forget images older than the retention window
+    return scrape_reddit_memes(MEME_SUBREDDITS, limit=MEMES_PER_RUN)
+
+# Run the daily meme job to scrape and post memes
+@JOB_SECONDS.time(job="daily_memes")
+def run_daily_meme_job():
+    memes = select_memes()
+    post_reddit_memes_to_slack(memes)
@@ -0,0 +1,183 @@
+# Structured, non-blocking logging for the bot
+# Log calls only put the record on an in-memory queue (QueueHandler); a listener thread
+# formats each record as one JSON line and writes it out (QueueListener), so a slow
+# stdout or log drain never holds up a request. When the queue is full, records are
+# dropped and counted instead of blocking.
+#
+# Records carry correlation fields bound with log_context() / event_context() (event_id,
+# user, channel...), which follow the code into threads started with asyncio.to_thread.
+# Records logged with extra={"sampled": True} are high-volume (one per incoming event) and
+# only a LOG_SAMPLE_RATE share of them is kept, chosen by event_id so all sampled records
+# of one event are kept or dropped together. Slack tokens, secrets and bearer tokens are
+# redacted from every record.
+import atexit
+import contextlib
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))  # Share of sampled records kept
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+# Slack tokens (xoxb-, xoxp-, xapp-...) and "Bearer ..." values
+TOKEN_PATTERN = re.compile(r"\b(?:xox[abposr]|xapp)-[A-Za-z0-9-]+|\b[Bb]earer\s+[A-Za-z0-9._~+/=-]+")
+# Values of secret-looking keys, e.g. token=..., "client_secret": "..."
+SECRET_VALUE_PATTERN = re.compile(r"""((?:token|secret|password)[\w]*["']?\s*[:=]\s*["']?)[^\s"',&}]+""", re.IGNORECASE)
+# Record attributes that every LogRecord has; anything else came from `extra`
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_context = contextvars.ContextVar("log_context", default={})
+
+
+def redact(text):
+    return SECRET_VALUE_PATTERN.sub(r"\1[REDACTED]", TOKEN_PATTERN.sub("[REDACTED]", text))
+
+
+# Bind correlation fields to every record logged inside the block (including in
+# threads started from it with asyncio.to_thread or contextvars.copy_context)
+@contextlib.contextmanager
+def log_context(**fields):
+    token = _context.set({**_context.get(), **{key: value for key, value in fields.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+# Correlation fields for a Slack Events API payload
+def event_context(event_data):
+    event = event_data.get("event", {})
+    return log_context(
+        event_id=event_data.get("event_id"),
+        event_type=event.get("type"),
+        user=event.get("user"),
+        channel=event.get("channel"),
+    )
+
+
+# Adds the bound context to each record and drops most sampled records
+# Runs in the thread that logged, where the context is visible.
+class ContextFilter(logging.Filter):
+    def __init__(self, sample_rate=LOG_SAMPLE_RATE):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        if getattr(record, "sampled", False) and record.levelno < logging.WARNING:
+            return self.keep(getattr(record, "event_id", None))
+        return True
+
+    def keep(self, key):
+        if self.sample_rate >= 1:
+            return True
+        if key is None:
+            return random.random() < self.sample_rate
+        digest = hashlib.blake2b(str(key).encode(), digest_size=4).digest()
+        return int.from_bytes(digest, "little") / 2 ** 32 < self.sample_rate
+
+
+# One JSON object per line: timestamp, level, logger, message, correlation fields, extras
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, default=str, ensure_ascii=False))
+
+
+# Queue handler that drops records instead of blocking when the listener falls behind
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    # Merge the message arguments now, since they may change before the listener runs,
+    # but leave the JSON formatting to the listener thread
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+# Route all logging through the queue; safe to call more than once
+def configure_logging(stream=None):
+    global _listener, _handler
+    with _lock:
+        if _handler is not None:
+            return _handler
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = DroppingQueueHandler(log_queue)
+        _handler.addFilter(ContextFilter())
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+        root = logging.getLogger()
+        root.handlers[:] = [_handler]
+        root.setLevel(LOG_LEVEL)
+    return _handler
+
+
+# The listener thread doesn't survive fork, so a forked worker starts its own
+def _restart_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+# Write out everything still queued before the process exits
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_stop_listener)
+
+
+def stats():
+    if _handler is None:
+        return {"dropped": 0, "queued": 0}
+    return {"dropped": _handler.dropped, "queued": _handler.queue.qsize()}
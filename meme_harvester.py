@@ -0,0 +1,111 @@
+# Concurrent meme harvester for several subreddits
+# Each subreddit is read on its own thread, a page of hot posts at a time, and the posts
+# are filtered as they arrive until the subreddit has yielded enough usable images.
+# Every Reddit request first takes a token from one shared bucket, so all threads stay
+# inside a single OAuth rate-limit budget. PRAW clients aren't thread-safe, so each
+# thread builds its own client from the factory it is given.
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import TokenBucket
+
+IMAGE_EXTENSIONS = ('jpg', 'png', 'gif', 'jpeg')
+REDDIT_REQUESTS_PER_MINUTE = 60  # Stay well under Reddit's OAuth limit of 100 per minute
+PAGE_SIZE = 25  # Posts requested per listing call
+MAX_PAGES = 4  # Give up on a subreddit after this many listing calls
+
+logger = logging.getLogger(__name__)
+
+
+# Skip stickied, NSFW and non-image posts
+def is_postable(submission):
+    return (
+        not submission.stickied
+        and not submission.over_18
+        and submission.url.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def to_meme(submission, subreddit_name):
+    return {
+        'id': submission.id,
+        'subreddit': subreddit_name,
+        'title': submission.title,
+        'url': submission.url,
+        'permalink': submission.permalink,
+        'image_url': submission.url
+    }
+
+
+class MemeHarvester:
+    def __init__(self, client_factory, requests_per_minute=REDDIT_REQUESTS_PER_MINUTE):
+        self.client_factory = client_factory
+        self.budget = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute // 6))
+        self.local = threading.local()
+
+        # Counters
+        self.requests = 0  # Listing calls made
+        self.scanned = 0  # Posts looked at
+        self.skipped = 0  # Posts filtered out
+
+    def client(self):
+        if getattr(self.local, "client", None) is None:
+            self.local.client = self.client_factory()
+        return self.local.client
+
+    # Read hot posts page by page until `count` usable memes are found
+    # is_seen(meme) lets the caller skip memes that were already posted
+    def harvest_subreddit(self, name, count, is_seen=None, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        memes = []
+        after = None
+        subreddit = self.client().subreddit(name)
+        for _ in range(max_pages):
+            self.budget.acquire()
+            self.requests += 1
+            # A limit of at most 100 makes the listing a single request
+            page = list(subreddit.hot(limit=page_size, params={"after": after} if after else {}))
+            for submission in page:
+                self.scanned += 1
+                if not is_postable(submission):
+                    self.skipped += 1
+                    continue
+                meme = to_meme(submission, name)
+                if is_seen and is_seen(meme):
+                    self.skipped += 1
+                    continue
+                memes.append(meme)
+                if len(memes) >= count:
+                    return memes
+            if len(page) < page_size:
+                break  # Reached the end of the listing
+            after = page[-1].fullname
+        return memes
+
+    # Harvest every subreddit at once and return up to `count` memes, taking them from
+    # each subreddit in turn (in hot order) and skipping cross-posted duplicates
+    def harvest(self, subreddits, count, is_seen=None):
+        if not subreddits:
+            return []
+        with ThreadPoolExecutor(max_workers=len(subreddits), thread_name_prefix="meme-harvest") as executor:
+            futures = [executor.submit(self.harvest_subreddit, name, count, is_seen) for name in subreddits]
+        per_subreddit = []
+        for name, future in zip(subreddits, futures):
+            try:
+                per_subreddit.append(future.result())
+            except Exception as e:
+                logger.error("Error fetching memes from r/%s: %s", name, e)
+
+        memes = []
+        seen_urls = set()
+        for rank in range(max(map(len, per_subreddit), default=0)):
+            for candidates in per_subreddit:
+                if rank < len(candidates) and candidates[rank]['url'] not in seen_urls:
+                    seen_urls.add(candidates[rank]['url'])
+                    memes.append(candidates[rank])
+                    if len(memes) == count:
+                        return memes
+        return memes
+
+    def stats(self):
+        return {"requests": self.requests, "scanned": self.scanned, "skipped": self.skipped}
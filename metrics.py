@@ -0,0 +1,325 @@
+# Prometheus-style counters and histograms, shared across gunicorn workers
+# Each process keeps its metrics in memory and writes a snapshot to METRICS_DIR/<pid>.json
+# every few seconds (and when /metrics is scraped). render() merges every process's file,
+# summing counters and histogram buckets, and returns the Prometheus text format, so any
+# worker can answer /metrics for the whole app. Counters from workers that have exited
+# are kept so totals don't go backwards; gunicorn_config.py clears the directory when the
+# master starts. Entry points without a gunicorn master (asgi_app.py under uvicorn,
+# socket_mode.py, `python bot.py`) call prune() instead, which drops the files of earlier
+# runs' processes, so a PID reused after a restart doesn't carry old counters.
+#
+# Stats that the existing components already keep (queue depth, cache hits...) are
+# exported as gauges through register_collector(), labelled with the process ID, and only
+# for processes that are still running.
+#
+# With METRICS_ENABLED=false, counter() and histogram() return a shared no-op object, so
+# the instrumented code paths cost one empty method call.
+import atexit
+import bisect
+import contextlib
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'btd_bot_metrics')
+FLUSH_INTERVAL = 5  # Seconds between snapshots of this process's metrics
+CLEARED_ENV = 'METRICS_DIR_CLEARED'  # Set by clear() in the gunicorn master; its workers inherit it
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger(__name__)
+
+_registry = {}  # name -> Counter or Histogram
+_collectors = []  # (prefix, help, stats function)
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # The flush thread and render() both write this process's file
+_flusher_pid = None
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # label key -> total
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+# Times a block or a function into a histogram
+class _Timer(contextlib.ContextDecorator):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    # Use as `with histogram.time(...):` or as a decorator
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        return [[list(key), list(counts)] for key, counts in self.values.items()]
+
+
+# Stands in for every metric when metrics are disabled
+class _NoopMetric:
+    def inc(self, amount=1, **labels):
+        pass
+
+    def observe(self, value, **labels):
+        pass
+
+    def time(self, **labels):
+        return _NOOP_TIMER
+
+
+class _NoopTimer(contextlib.ContextDecorator):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP = _NoopMetric()
+_NOOP_TIMER = _NoopTimer()
+
+
+def _register(metric):
+    with _lock:
+        existing = _registry.get(metric.name)
+        if existing is None:
+            _registry[metric.name] = metric
+            existing = metric
+    _start_flusher()
+    return existing
+
+
+def counter(name, help):
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _register(Counter(name, help))
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS):
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _register(Histogram(name, help, buckets))
+
+
+# Export the numeric values of stats() as gauges named <prefix>_<key>
+def register_collector(prefix, help, stats):
+    if METRICS_ENABLED:
+        _collectors.append((prefix, help, stats))
+        _start_flusher()
+
+
+def _process_snapshot():
+    with _lock:
+        metrics = {
+            name: {"type": metric.type, "help": metric.help, "buckets": list(getattr(metric, "buckets", [])), "values": metric.snapshot()}
+            for name, metric in _registry.items()
+        }
+    gauges = {}
+    for prefix, help, stats in _collectors:
+        try:
+            values = stats()
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", prefix, e)
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[f"{prefix}_{key}"] = {"help": f"{help} ({key})", "value": value}
+    return {"pid": os.getpid(), "metrics": metrics, "gauges": gauges}
+
+
+# Write this process's snapshot, replacing the previous one atomically
+# One flush at a time, so a scrape and a periodic flush don't share the temporary file.
+def flush():
+    if not METRICS_ENABLED:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    temporary = f"{path}.tmp"
+    with _flush_lock:
+        with open(temporary, "w") as file:
+            json.dump(_process_snapshot(), file)
+        os.replace(temporary, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            logger.warning("Error writing metrics: %s", e)
+
+
+# One flush thread per process, started when the first metric is registered
+def _start_flusher():
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+# A forked child starts from zero; its parent's values are in the parent's file
+def _reset_after_fork():
+    global _lock, _flush_lock, _flusher_pid
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _flusher_pid = None
+    for metric in _registry.values():
+        metric.values = {}
+    if _registry or _collectors:
+        _start_flusher()
+
+
+if METRICS_ENABLED:
+    os.register_at_fork(after_in_child=_reset_after_fork)
+    atexit.register(lambda: flush() if _flusher_pid == os.getpid() else None)
+
+
+# Remove every process's snapshot; called by the gunicorn master on startup
+def clear():
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        with contextlib.suppress(OSError):
+            os.remove(path)
+    os.environ[CLEARED_ENV] = '1'
+
+
+# Remove snapshots of processes that are no longer running, and any earlier snapshot under
+# this process's PID; for entry points that start without a gunicorn master
+# Under gunicorn (e.g. asgi_app.py with uvicorn workers) the master already cleared the
+# directory, and the files of workers that have exited since are kept.
+def prune():
+    if os.environ.get(CLEARED_ENV):
+        return
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+        except ValueError:
+            continue
+        if pid == os.getpid() or not _is_running(pid):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Merge every process's snapshot into the Prometheus text exposition format
+def render():
+    flush()
+    merged = {}  # name -> {"type", "help", "buckets", "values": {label key: value or counts}}
+    gauges = {}  # name -> (help, [(pid, value)])
+    for path in sorted(glob.glob(os.path.join(METRICS_DIR, "*.json"))):
+        try:
+            with open(path) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue  # Being replaced, or a process died mid-write
+        for name, metric in snapshot["metrics"].items():
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for labels, value in metric["values"]:
+                key = tuple(tuple(pair) for pair in labels)
+                if metric["type"] == "counter":
+                    target["values"][key] = target["values"].get(key, 0) + value
+                else:
+                    current = target["values"].get(key)
+                    target["values"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+        if _is_running(snapshot["pid"]):
+            for name, gauge in snapshot["gauges"].items():
+                gauges.setdefault(name, (gauge["help"], []))[1].append((snapshot["pid"], gauge["value"]))
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["values"].items()):
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [math.inf], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+    for name in sorted(gauges):
+        help, samples = gauges[name]
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for pid, value in samples:
+            lines.append(f"{name}{_format_labels((('pid', str(pid)),))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,167 @@
+# Concurrent fetch engine for the news scrapers
+# Every site is fetched at the same time on a thread pool, over one pooled keep-alive
+# session. Each site has its own connect/read timeouts and retry budget, and the whole
+# job has a deadline, so the job takes about as long as the slowest site.
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+USER_AGENT = "BTD Tech News Scraper"
+MAX_WORKERS = 32  # Fetch threads, and connections kept per host
+DEFAULT_JOB_DEADLINE = 60  # Seconds for the whole job
+
+# Per-site defaults; any of these can be overridden in a site's settings
+DEFAULT_SITE_SETTINGS = {
+    "connect_timeout": 5,
+    "read_timeout": 15,
+    "retries": 2,
+    "backoff": 0.5,  # Seconds before the first retry, doubled on each attempt
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STREAM_CHUNK_SIZE = 16 * 1024  # Bytes read at a time from streamed responses
+
+FETCH_SECONDS = metrics.histogram("news_fetch_seconds", "Time until a news site's response headers arrive, by site")
+PARSE_SECONDS = metrics.histogram("news_parse_seconds", "Time to read and scrape a news page, by site")
+FETCH_BYTES = metrics.counter("news_fetch_bytes_total", "News page bytes downloaded, by site")
+FETCH_RESULTS = metrics.counter("news_fetch_total", "News site fetches, by site and result")
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Raised when a site's retries or the job deadline run out
+class FetchBudgetExceeded(requests.RequestException):
+    pass
+
+
+# Shared keep-alive session, created once per process
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+    return _session
+
+
+# Fetch one site, retrying with exponential backoff and jitter inside its budget
+# With stream=True only the headers are read; the body is read later by read_chunks().
+def fetch_site(site, deadline_at, session=None, headers=None, stream=False):
+    session = session or get_session()
+    settings = {**DEFAULT_SITE_SETTINGS, **site}
+    retries = settings["retries"]
+
+    for attempt in range(retries + 1):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise FetchBudgetExceeded(f"Job deadline reached before fetching {site['url']}")
+        # Never let a single request outlive the job deadline
+        timeout = (min(settings["connect_timeout"], remaining), min(settings["read_timeout"], remaining))
+        try:
+            response = session.get(site["url"], timeout=timeout, headers=headers, stream=stream)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response
+            response.close()
+            logger.info("Retrying %s after HTTP %d", site['name'], response.status_code, extra={"site": site['name']})
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            logger.info("Retrying %s after error: %s", site['name'], e, extra={"site": site['name']})
+
+        delay = settings["backoff"] * (2 ** attempt) * (1 + random.random())
+        time.sleep(max(0, min(delay, deadline_at - time.monotonic())))
+
+    raise FetchBudgetExceeded(f"Retries exhausted for {site['url']}")
+
+
+# Read a streamed response body chunk by chunk, counting the bytes read in streamed_bytes
+# Closing the response before the end drops the connection instead of downloading the rest.
+def read_chunks(response, chunk_size=STREAM_CHUNK_SIZE):
+    response.streamed_bytes = 0
+    for chunk in response.iter_content(chunk_size):
+        response.streamed_bytes += len(chunk)
+        yield chunk
+
+
+# Size of the whole page: its Content-Length, or the bytes read when the server sent none
+def page_size(response, bytes_read):
+    length = response.headers.get("Content-Length", "")
+    return int(length) if length.isdigit() else bytes_read
+
+
+# Fetch every site concurrently and run handle_response(site, response) on each page
+# Returns {site name: handler result}; sites that fail or miss the deadline are left out.
+# With an http_cache.HttpCache, pages are fetched conditionally and a 304 reuses the
+# stored result instead of calling handle_response. Results are stored under the site's
+# profile fingerprint, so a changed profile scrapes the page again. Sites with
+# "stream": True are fetched with stream=True, and handle_response reads the body itself
+# through read_chunks().
+def fetch_all(sites, handle_response, deadline=DEFAULT_JOB_DEADLINE, max_workers=MAX_WORKERS, cache=None):
+    if not sites:
+        return {}
+    deadline_at = time.monotonic() + deadline
+    results = {}
+
+    def run(site):
+        started = time.monotonic()
+        stream = site.get("stream", False)
+        fingerprint = site.get("fingerprint")
+        headers = cache.conditional_headers(site["url"], fingerprint) if cache else None
+        with FETCH_SECONDS.time(site=site["name"]):
+            response = fetch_site(site, deadline_at, headers=headers, stream=stream)
+        try:
+            if response.status_code == 304:
+                cached = cache.not_modified(site["url"], fingerprint)
+                if cached is not None:
+                    FETCH_RESULTS.inc(site=site["name"], result="not_modified")
+                    return cached
+                # The entry was evicted or replaced in the meantime, so fetch the full page
+                response.close()
+                response = fetch_site(site, deadline_at, stream=stream)
+            with PARSE_SECONDS.time(site=site["name"]):
+                result = handle_response(site, response)
+            bytes_read = getattr(response, "streamed_bytes", 0) if stream else len(response.content)
+            FETCH_BYTES.inc(bytes_read, site=site["name"])
+            FETCH_RESULTS.inc(site=site["name"], result="ok")
+            if cache:
+                cache.store(site["url"], response.headers, page_size(response, bytes_read), result, fingerprint)
+            return result
+        finally:
+            response.close()
+            logger.info("Fetched %s in %.2fs", site['name'], time.monotonic() - started, extra={"site": site['name']})
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(sites)), thread_name_prefix="news-fetch")
+    futures = {executor.submit(run, site): site for site in sites}
+    done, not_done = wait(futures, timeout=deadline)
+    # Don't wait for stragglers; their requests are already capped by the deadline
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for future in done:
+        site = futures[future]
+        try:
+            results[site["name"]] = future.result()
+        except requests.RequestException as e:
+            FETCH_RESULTS.inc(site=site["name"], result="fetch_error")
+            logger.error("Error fetching articles from %s: %s", site['name'], e, extra={"site": site['name']})
+        except Exception as e:
+            FETCH_RESULTS.inc(site=site["name"], result="scrape_error")
+            logger.exception("Error scraping articles from %s: %s", site['name'], e, extra={"site": site['name']})
+    for future in not_done:
+        FETCH_RESULTS.inc(site=futures[future]["name"], result="deadline")
+        logger.error("Error fetching articles from %s: job deadline of %ss reached", futures[future]['name'], deadline, extra={"site": futures[future]['name']})
+
+    return results
@@ -0,0 +1,133 @@
+# Relevance ranking for news candidates, so the best NEWS_MESSAGE_MAX articles are posted
+# rather than the first ones in scrape order
+# Each candidate's score combines:
+#   relevance  TF-IDF weight of the community's interest terms in the headline (internships,
+#              careers, AI, ...; see INTEREST_TERMS). IDF is computed over the candidate
+#              pool, so a term every headline shares counts for less.
+#   recency    exp(-age / RECENCY_HALF_LIFE * ln 2) from the article's "published" time when
+#              the source gives one, otherwise from its position on the page (front pages
+#              list the newest stories first)
+# and the picks are then spread across sources: each article already picked from a source
+# multiplies the rest of that source's scores by DIVERSITY_DECAY.
+#
+# The interest vocabulary is compiled once at import. A run tokenizes all the headlines in
+# one pass, builds the (candidates x terms) count matrix with one bincount and scores the
+# whole pool with a few array operations, so ranking thousands of candidates takes
+# milliseconds (see benchmarks/bench_ranking.py).
+#
+# Needs NumPy; when it's missing AVAILABLE is False and rank_articles keeps scrape order.
+import logging
+import math
+import os
+import time
+from itertools import repeat
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+AVAILABLE = np is not None
+
+# Community interests and how much each counts; two-word terms match adjacent words
+INTEREST_TERMS = {
+    "internship": 3.0, "internships": 3.0, "intern": 2.5, "interns": 2.5,
+    "career": 2.5, "careers": 2.5, "hiring": 2.0, "job": 2.0, "jobs": 2.0, "layoffs": 1.5,
+    "student": 1.5, "students": 1.5, "graduates": 1.5, "college": 1.5, "university": 1.0,
+    "ai": 2.0, "artificial intelligence": 2.0, "machine learning": 2.0, "chatgpt": 1.5,
+    "openai": 1.5, "llm": 1.5, "startup": 1.0, "startups": 1.0, "coding": 1.0,
+    "programming": 1.0, "developer": 1.0, "developers": 1.0, "software": 1.0,
+    "cybersecurity": 1.0, "ethics": 1.0, "privacy": 1.0, "policy": 0.5,
+}
+RELEVANCE_WEIGHT = 0.7  # Relevance and recency are each scaled to 0-1 before weighting
+RECENCY_WEIGHT = 0.3
+RECENCY_HALF_LIFE = float(os.getenv('NEWS_RECENCY_HALF_LIFE_DAYS', 3)) * 24 * 60 * 60  # Seconds
+POSITION_HALF_LIFE = 5  # Without a publish time, an article this far down the page counts half as recent
+DIVERSITY_DECAY = 0.6
+
+logger = logging.getLogger(__name__)
+
+
+# Compiled once: term -> column, the weight of each column, an ID for every word that
+# appears in a term (and the separator), and the column of each one-word term and word
+# pair by word ID
+VOCABULARY = {term: column for column, term in enumerate(INTEREST_TERMS)}
+TERM_WEIGHTS = np.array(list(INTEREST_TERMS.values())) if AVAILABLE else None
+SEPARATOR = b"\0"  # Token between headlines
+WORD_IDS = {word: i for i, word in enumerate(dict.fromkeys([SEPARATOR, *(word.encode() for term in INTEREST_TERMS for word in term.split())]))}
+WORD_COLUMNS = np.array([VOCABULARY.get(word.decode(), -1) for word in WORD_IDS]) if AVAILABLE else None
+PAIR_COLUMNS = [(WORD_IDS[first.encode()], WORD_IDS[second.encode()], VOCABULARY[term]) for term in INTEREST_TERMS if len(term.split()) == 2 for first, second in [term.split()]]
+
+# Maps every byte but [a-z0-9] and the separator to a space, so split() yields words
+_WORD_BYTES = set(b"abcdefghijklmnopqrstuvwxyz0123456789" + SEPARATOR)
+WORD_TABLE = bytes(byte if byte in _WORD_BYTES else ord(" ") for byte in range(256))
+
+
+# Relevance of each headline: TF-IDF of the interest terms, weighted, scaled to 0-1
+# The headlines are tokenized together, as one buffer with a separator token between
+# headlines, and term counts come from array operations over the word IDs.
+def relevance_scores(titles):
+    text = (b" " + SEPARATOR + b" ").join(title.lower().encode() for title in titles)
+    words = text.translate(WORD_TABLE).split()
+    ids = np.fromiter(map(WORD_IDS.get, words, repeat(-1)), dtype=np.intp, count=len(words))
+    is_separator = ids == WORD_IDS[SEPARATOR]
+    rows = np.cumsum(is_separator)  # Headline of each word
+
+    columns = np.where(ids >= 0, WORD_COLUMNS[ids], -1)
+    found = [np.flatnonzero(columns >= 0)]
+    found_columns = [columns[found[0]]]
+    for first, second, column in PAIR_COLUMNS:
+        starts = np.flatnonzero((ids[:-1] == first) & (ids[1:] == second))
+        found.append(starts)
+        found_columns.append(np.full(len(starts), column))
+    found, found_columns = np.concatenate(found), np.concatenate(found_columns)
+    counts = np.bincount(rows[found] * len(VOCABULARY) + found_columns, minlength=len(titles) * len(VOCABULARY))
+    counts = counts.reshape(len(titles), len(VOCABULARY))
+    lengths = np.bincount(rows[~is_separator], minlength=len(titles))
+
+    term_frequency = counts / np.maximum(lengths, 1)[:, None]
+    document_frequency = np.count_nonzero(counts, axis=0)
+    inverse_document_frequency = np.log((1 + len(titles)) / (1 + document_frequency)) + 1
+    scores = (term_frequency * inverse_document_frequency) @ TERM_WEIGHTS
+    top = scores.max(initial=0)
+    return scores / top if top > 0 else scores
+
+
+# Recency of each article, 0-1: from "published" (epoch seconds) when set, else from its
+# position within its source, in the order the articles were scraped
+def recency_scores(articles, now=None):
+    now = now if now is not None else time.time()
+    positions, published, seen = np.empty(len(articles)), np.full(len(articles), np.nan), {}
+    for row, article in enumerate(articles):
+        source = article.get('source')
+        positions[row] = seen.get(source, 0)
+        seen[source] = positions[row] + 1
+        if article.get('published') is not None:
+            published[row] = article['published']
+    by_position = np.exp(-positions / POSITION_HALF_LIFE * math.log(2))
+    by_age = np.exp(-np.maximum(now - published, 0) / RECENCY_HALF_LIFE * math.log(2))
+    return np.where(np.isnan(published), by_position, by_age)
+
+
+# The `limit` best articles, best first
+def rank_articles(articles, limit, now=None):
+    if not AVAILABLE or len(articles) <= 1:
+        return articles[:limit]
+    started = time.perf_counter()
+    scores = RELEVANCE_WEIGHT * relevance_scores([article['title'] for article in articles]) + RECENCY_WEIGHT * recency_scores(articles, now)
+
+    # Pick greedily, discounting a source's remaining articles each time one of them is picked
+    source_ids = {}
+    sources = np.array([source_ids.setdefault(article.get('source'), len(source_ids)) for article in articles])
+    picks_per_source = np.zeros(len(source_ids))
+    available = np.ones(len(articles), dtype=bool)
+    ranked = []
+    for _ in range(min(limit, len(articles))):
+        effective = np.where(available, scores * DIVERSITY_DECAY ** picks_per_source[sources], -np.inf)
+        best = int(effective.argmax())
+        ranked.append(articles[best])
+        available[best] = False
+        picks_per_source[sources[best]] += 1
+
+    logger.info("Ranked %d news candidates in %.1f ms", len(articles), (time.perf_counter() - started) * 1000)
+    return ranked
@@ -0,0 +1,430 @@
+# Durable outbox for outbound Slack posts
+# A post is written to a SQLite table under an idempotency key before anything is sent,
+# and only marked sent once Slack has accepted it. If the process dies or Slack fails part
+# way through a job or a welcome, the posts not yet sent are still in the table and a
+# drainer thread delivers them later. Recording a post under a key that is already there
+# (a rerun job, a retried event) is a no-op, so a rerun doesn't post anything twice.
+#
+# Writes use group commit: concurrent enqueue and settle calls queue their rows, and the
+# first caller to find no commit running writes everything queued in one transaction,
+# with one fsync (synchronous=FULL), then wakes the rest. A job records all of its posts
+# with one enqueue_many().
+#
+# Each post is delivered exactly once, across restarts:
+#   - records are claimed (status "claimed", leased for `lease` seconds) in a transaction,
+#     so no two threads or processes send the same record, and each is marked "sending"
+#     just before its call goes out
+#   - chat.postMessage posts carry their key in Slack message metadata. A record whose
+#     outcome is unknown (its lease ran out while it was sending, Slack answered with a
+#     server error, or the call got no answer at all) is looked up in its channel's
+#     history first, and only resent if no message there carries its key. A record whose
+#     lease ran out before it was sent is just sent. Sends go through the poster's
+#     call_once(), so a server or transport error comes back here instead of being retried
+#     blindly; only rate-limited calls are retried inline.
+#   - the lookup needs the bot's channels:history, groups:history and im:history scopes. A
+#     lookup that fails is never taken to mean "not posted": after a transient error the
+#     record is put back, still unsure, and after a permanent one (missing_scope,
+#     not_in_channel...) it is failed rather than risk posting twice.
+#   - follow-up work, such as adding an article to the seen index, is a named hook that
+#     runs before the record is marked sent, so a crash means it runs again rather than
+#     being skipped. Hooks must be idempotent.
+#
+# Record lifecycle: pending -> claimed -> sending -> sent. After a transient error the
+# record goes back to pending for a later attempt. After MAX_ATTEMPTS, or a permanent
+# error, it is failed.
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from slack_sdk.errors import SlackApiError
+
+from slack_poster import TRANSPORT_ERRORS, is_rate_limited, retry_delay
+
+HANDOFF = 60  # Seconds a new record is left to the caller that recorded it before the drainer may send it
+LEASE = 10 * 60  # Seconds a claimed record is held before it's presumed stranded by a crash
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 60  # Seconds before the first redelivery after a transient error; doubles each time
+RETENTION = 30 * 24 * 60 * 60  # Sent and failed records are kept this long, so their keys still dedup
+DRAIN_BATCH = 100  # Records claimed per drainer pass
+PRUNE_EVERY = 60 * 60  # Seconds between prunes of old records
+HISTORY_LIMIT = 200  # Messages searched for an unsure post in its channel
+HISTORY_SLACK = 60  # Seconds before a record was created that its message could be stamped with (clock skew)
+METADATA_EVENT_TYPE = "outbox_post"
+
+logger = logging.getLogger(__name__)
+
+# A claimed record; `attempts` includes the current one
+OutboxRecord = namedtuple("OutboxRecord", "key method arguments hook data attempts unsure created_at")
+
+
+# A chat.postMessage post for Outbox.enqueue_many()
+# `hook` names a function registered with register_hook(), called with `data` once the post is sent.
+def chat_post(key, channel, hook=None, data=None, **arguments):
+    return {"key": key, "method": "chat.postMessage", "arguments": {"channel": channel, **arguments}, "hook": hook, "data": data}
+
+
+# Stands in for the result of an unsure record whose channel couldn't be searched
+class UncheckedPost(Exception):
+    def __init__(self, cause):
+        super().__init__(cause)
+        self.cause = cause  # The SlackApiError or transport error from the lookup
+
+
+# Short reason a send failed, for logs and the outbox's error column
+def failure_reason(result):
+    if isinstance(result, UncheckedPost):
+        return f"couldn't check the channel: {failure_reason(result.cause)}"
+    if isinstance(result, SlackApiError):
+        return result.response.get("error") or f"HTTP {result.response.status_code}"
+    return repr(result)
+
+
+# One caller's writes, waiting for a group commit
+class _Waiter:
+    __slots__ = ("writes", "changes", "error", "done")
+
+    def __init__(self, writes):
+        self.writes = writes  # [(statement, parameter rows)]
+        self.changes = None  # Rows changed by each write
+        self.error = None
+        self.done = False
+
+
+class Outbox:
+    def __init__(self, path, poster, handoff=HANDOFF, lease=LEASE, max_attempts=MAX_ATTEMPTS, retry_backoff=RETRY_BACKOFF):
+        self.poster = poster
+        self.handoff = handoff
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.hooks = {}  # name -> function(data)
+        self.drainer = None
+        self.db_lock = threading.Lock()  # One connection, shared by the committer, claims and stats
+        self.condition = threading.Condition()  # Guards queued and committing
+        self.queued = []  # Waiters for the next group commit
+        self.committing = False
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")  # fsync the WAL on every commit
+        self.conn.execute("PRAGMA busy_timeout=10000")
+        # due_at: when a pending record may be sent by the drainer, or when a claimed or sending record's lease runs out
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, method TEXT NOT NULL, arguments TEXT NOT NULL,"
+            " hook TEXT, data TEXT, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,"
+            " unsure INTEGER NOT NULL DEFAULT 0, due_at REAL NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " channel TEXT, ts TEXT, error TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_status_due ON outbox (status, due_at)")
+
+        # Counters
+        self.enqueued = 0  # Records written
+        self.duplicates = 0  # Posts ignored because their key was already recorded
+        self.commits = 0  # Group commits, one fsync each
+        self.sent = 0
+        self.recovered = 0  # Unsure records found already posted, so not sent again
+        self.unchecked = 0  # Unsure records put back or failed because their channel couldn't be searched
+        self.retried = 0  # Records put back for a later attempt
+        self.failed = 0
+
+    # Register the function a record's hook name refers to
+    # The drainer only claims records whose hook is registered in this process.
+    def register_hook(self, name, function):
+        self.hooks[name] = function
+
+    # Queue writes for the next group commit and wait until they are on disk
+    # Returns the number of rows changed by each (statement, parameter rows) write.
+    def _commit(self, writes):
+        waiter = _Waiter(writes)
+        with self.condition:
+            self.queued.append(waiter)
+            while not waiter.done:
+                if self.committing:
+                    self.condition.wait()
+                    continue
+                group, self.queued = self.queued, []
+                self.committing = True
+                self.condition.release()
+                try:
+                    self._write(group)
+                finally:
+                    self.condition.acquire()
+                    self.committing = False
+                    self.condition.notify_all()
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter.changes
+
+    # Write every waiter's rows in one transaction
+    def _write(self, group):
+        error = None
+        with self.db_lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for waiter in group:
+                    waiter.changes = [self.conn.executemany(statement, rows).rowcount for statement, rows in waiter.writes]
+                self.conn.execute("COMMIT")
+                self.commits += 1
+            except Exception as e:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                error = e
+        for waiter in group:
+            waiter.error = error
+            waiter.done = True
+
+    # Record posts (see chat_post); returns once they are committed, with the number recorded
+    # A post whose key is already recorded, sent or not, is left as it is.
+    def enqueue_many(self, posts):
+        now = time.time()
+        rows = [
+            (post["key"], post["method"], json.dumps(post["arguments"]), post.get("hook"),
+             json.dumps(post["data"]) if post.get("data") is not None else None, now + self.handoff, now, now)
+            for post in posts
+        ]
+        if not rows:
+            return 0
+        inserted, = self._commit([(
+            "INSERT OR IGNORE INTO outbox (key, method, arguments, hook, data, due_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )])
+        self.enqueued += inserted
+        self.duplicates += len(rows) - inserted
+        return inserted
+
+    def enqueue(self, key, method, arguments, hook=None, data=None):
+        return self.enqueue_many([{"key": key, "method": method, "arguments": arguments, "hook": hook, "data": data}]) == 1
+
+    # Claim records matching a WHERE clause: lease them to this caller
+    def _claim(self, where, parameters):
+        now = time.time()
+        with self.db_lock:
+            # Write lock first, so no other process can claim the same rows in between
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, key, method, arguments, hook, data, attempts, unsure, status, created_at FROM outbox WHERE " + where,
+                    parameters
+                ).fetchall()
+                # A record still marked sending was stranded mid-send, so it may have been posted
+                self.conn.executemany(
+                    "UPDATE outbox SET status = 'claimed', attempts = attempts + 1, unsure = unsure OR status = 'sending',"
+                    " due_at = ?, updated_at = ? WHERE id = ?",
+                    [(now + self.lease, now, row[0]) for row in rows]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [
+            OutboxRecord(key, method, json.loads(arguments), hook, json.loads(data) if data is not None else None,
+                         attempts + 1, bool(unsure) or status == "sending", created_at)
+            for _, key, method, arguments, hook, data, attempts, unsure, status, created_at in rows
+        ]
+
+    # Claim the never-attempted records with these keys, for the caller that just recorded them
+    # Retries and stranded records are left to the drainer.
+    def claim(self, keys):
+        keys = list(keys)
+        if not keys:
+            return []
+        return self._claim(f"status = 'pending' AND attempts = 0 AND key IN ({', '.join('?' * len(keys))})", keys)
+
+    # Claim records that are due: retries whose backoff is over, records their caller
+    # didn't send within the handoff, and records whose lease ran out
+    def claim_due(self, limit=DRAIN_BATCH):
+        hooks = list(self.hooks)
+        return self._claim(
+            f"status IN ('pending', 'claimed', 'sending') AND due_at <= ? AND (hook IS NULL OR hook IN ({', '.join('?' * len(hooks))}))"
+            " ORDER BY id LIMIT ?",
+            [time.time(), *hooks, limit]
+        )
+
+    # Arguments to send a record with; posts carry their key so an unsure one can be found later
+    def send_arguments(self, record):
+        if record.method != "chat.postMessage":
+            return record.arguments
+        return {**record.arguments, "metadata": {"event_type": METADATA_EVENT_TYPE, "event_payload": {"key": record.key}}}
+
+    # Look for an unsure record's message in its channel, by the key in its metadata
+    # Returns a response-like dict for the message, or None if it isn't there. Raises the
+    # poster's error if the channel can't be searched.
+    def _find_post(self, record):
+        if record.method != "chat.postMessage":
+            return None
+        channel = record.arguments["channel"]
+        if channel[:1] in ("U", "W"):  # Posted to a user ID, which lands in the bot's DM with them
+            channel = self.poster.call("conversations.open", users=channel)["channel"]["id"]
+        history = self.poster.call(
+            "conversations.history", channel=channel, oldest=f"{record.created_at - HISTORY_SLACK:.6f}",
+            include_all_metadata=True, limit=HISTORY_LIMIT
+        )
+        for message in history.get("messages", []):
+            if ((message.get("metadata") or {}).get("event_payload") or {}).get("key") == record.key:
+                return {"ok": True, "channel": channel, "ts": message.get("ts")}
+        return None
+
+    # Mark claimed records as about to be sent, so a crash from here on leaves them unsure
+    def mark_sending(self, records):
+        self._commit([("UPDATE outbox SET status = 'sending', updated_at = ? WHERE key = ?", [(time.time(), record.key) for record in records])])
+
+    # Send claimed records and settle them; returns {key: response or exception}
+    # A failed record's exception is the SlackApiError or transport error (see failure_reason).
+    # With concurrency > 1, records of one method are fanned out with the poster's
+    # call_many(), `concurrency` records at a time.
+    def send(self, records, concurrency=1):
+        results = {}
+        ready = []
+        for record in records:
+            if not record.unsure:
+                ready.append(record)
+                continue
+            try:
+                posted = self._find_post(record)
+            except (SlackApiError, *TRANSPORT_ERRORS) as e:
+                self.unchecked += 1
+                posted = UncheckedPost(e)
+            else:
+                if posted is None:
+                    ready.append(record)
+                    continue
+                self.recovered += 1
+            self.settle_many([(record, posted)])
+            results[record.key] = posted
+
+        if concurrency > 1 and len({record.method for record in ready}) == 1:
+            for start in range(0, len(ready), concurrency):
+                chunk = ready[start:start + concurrency]
+                self.mark_sending(chunk)
+                responses = self.poster.call_many(
+                    chunk[0].method, [self.send_arguments(record) for record in chunk], concurrency, retry_server_errors=False
+                )
+                self.settle_many(list(zip(chunk, responses)))
+                results.update((record.key, response) for record, response in zip(chunk, responses))
+            return results
+
+        # One at a time, settling each as soon as it's sent
+        for record in ready:
+            self.mark_sending([record])
+            try:
+                response = self.poster.call_once(record.method, **self.send_arguments(record))
+            except (SlackApiError, *TRANSPORT_ERRORS) as e:
+                response = e
+            self.settle_many([(record, response)])
+            results[record.key] = response
+        return results
+
+    # Claim and send the never-attempted records with these keys
+    # Keys already sent, or being sent by someone else, are left out of the results.
+    def deliver(self, keys, concurrency=1):
+        return self.send(self.claim(keys), concurrency)
+
+    def _run_hook(self, record):
+        function = self.hooks.get(record.hook)
+        if function is None:
+            logger.warning("No outbox hook %r registered for %s", record.hook, record.key)
+            return
+        try:
+            function(record.data)
+        except Exception:
+            logger.exception("Outbox hook %r failed for %s", record.hook, record.key)
+
+    # Whether a failed send or lookup is worth another attempt, and whether the post may
+    # have gone out
+    @staticmethod
+    def _classify(result):
+        if isinstance(result, UncheckedPost):
+            transient, _ = Outbox._classify(result.cause)
+            return transient, True  # Still unknown
+        if isinstance(result, SlackApiError):
+            # Slack may have posted the message before a server error; it didn't before a rate limit
+            return retry_delay(result, 0) is not None, not is_rate_limited(result)
+        return True, True  # No answer at all
+
+    # Record how sends went, as (record, response or exception) pairs
+    # A sent record's hook runs before it's marked sent.
+    def settle_many(self, outcomes):
+        now = time.time()
+        sent, retry, failed = [], [], []
+        for record, result in outcomes:
+            if not isinstance(result, Exception):
+                if record.hook:
+                    self._run_hook(record)
+                sent.append((result.get("channel"), result.get("ts"), now, record.key))
+                continue
+            transient, unsure = self._classify(result)
+            reason = failure_reason(result)
+            if transient and record.attempts < self.max_attempts:
+                due_at = now + self.retry_backoff * 2 ** (record.attempts - 1)
+                retry.append((unsure, due_at, now, reason, record.key))
+            else:
+                failed.append((now, reason, record.key))
+                if isinstance(result, UncheckedPost):
+                    logger.error(
+                        "Giving up on outbox record %s, which may already be posted: %s (searching its channel needs"
+                        " the channels:history, groups:history and im:history scopes)", record.key, reason
+                    )
+                else:
+                    logger.error("Giving up on outbox record %s after %d attempts: %s", record.key, record.attempts, reason)
+        self._commit([
+            ("UPDATE outbox SET status = 'sent', channel = ?, ts = ?, updated_at = ?, error = NULL WHERE key = ?", sent),
+            ("UPDATE outbox SET status = 'pending', unsure = ?, due_at = ?, updated_at = ?, error = ? WHERE key = ?", retry),
+            ("UPDATE outbox SET status = 'failed', updated_at = ?, error = ? WHERE key = ?", failed),
+        ])
+        self.sent += len(sent)
+        self.retried += len(retry)
+        self.failed += len(failed)
+
+    # Send whatever is due; returns {key: response or exception}
+    def drain(self):
+        records = self.claim_due()
+        if not records:
+            return {}
+        logger.info("Draining %d outbox records", len(records))
+        return self.send(records)
+
+    # Forget sent and failed records older than `retention` seconds
+    def prune(self, retention=RETENTION):
+        deleted, = self._commit([("DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at < ?", [(time.time() - retention,)])])
+        return deleted
+
+    # Drain due records every `interval` seconds on a daemon thread
+    def start(self, interval):
+        if self.drainer is not None:
+            return self.drainer
+
+        def run():
+            pruned_at = 0.0
+            while True:
+                time.sleep(interval)
+                try:
+                    self.drain()
+                    if time.monotonic() - pruned_at > PRUNE_EVERY:
+                        self.prune()
+                        pruned_at = time.monotonic()
+                except Exception:
+                    logger.exception("Outbox drain failed")
+
+        self.drainer = threading.Thread(target=run, name="outbox-drainer", daemon=True)
+        self.drainer.start()
+        return self.drainer
+
+    def stats(self):
+        with self.db_lock:
+            backlog = dict(self.conn.execute("SELECT status, COUNT(*) FROM outbox WHERE status IN ('pending', 'claimed', 'sending') GROUP BY status").fetchall())
+        return {
+            "pending": backlog.get("pending", 0),
+            "in_flight": backlog.get("claimed", 0) + backlog.get("sending", 0),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "commits": self.commits,
+            "sent": self.sent,
+            "recovered": self.recovered,
+            "unchecked": self.unchecked,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
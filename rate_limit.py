@@ -0,0 +1,44 @@
+# Token bucket rate limiter shared by the outbound API clients
+# reserve() books a token and returns how long the caller must wait before using it, so
+# the same bucket works for threads (acquire) and for asyncio code (await asyncio.sleep).
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity  # Largest burst allowed
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    # Take a token and return the seconds to wait before it may be used
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    # Block the calling thread until a token is available
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    # Whether the bucket has refilled to a full burst and isn't paused, so dropping it and
+    # later starting a new one changes nothing
+    def is_idle(self):
+        with self.lock:
+            now = time.monotonic()
+            return self.paused_until <= now and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    # Stop handing out usable tokens for `seconds`, e.g. after an HTTP 429 Retry-After
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
@@ -0,0 +1,63 @@
+# Event IDs this process has already acked, so Slack's retries are acked without any work
+# Slack retries a delivery it didn't see acked in time (X-Slack-Retry-Num 1-3, over about
+# five minutes), and every retry carries the first delivery's event_id. The event_id is
+# pulled out of the raw body with a regex, so a hit costs one dict lookup: no JSON
+# parsing, signature check, dispatch or state store round trip.
+#
+# Entries are added once a delivery has been acked with a 200, which happens before it is
+# handled: the handler runs afterwards on the dispatcher (event_queue.py), and Slack won't
+# retry an acked delivery even if handling it fails. A delivery answered with an error
+# isn't added, so Slack's retry of it is handled. The cache is per process: a retry that
+# lands on a different gunicorn worker misses and falls through to claim_welcome's shared
+# dedup.
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 60 * 60  # Slack's last retry comes about five minutes after the first delivery
+DEFAULT_MAX_ENTRIES = 10000
+EVENT_ID_PATTERN = re.compile(rb'"event_id"\s*:\s*"([^"\\]+)"')
+
+
+# The event_id of a raw Events API request body, or None
+def event_id_from_body(body):
+    match = EVENT_ID_PATTERN.search(body)
+    return match.group(1).decode() if match else None
+
+
+class ReplayCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # event_id -> expiry time, oldest first
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+
+    def add(self, event_id):
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[event_id] = expires_at
+            self.entries.move_to_end(event_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # True if the event was acked within the last `ttl` seconds
+    def seen(self, event_id):
+        now = time.monotonic()
+        with self.lock:
+            # Entries are in expiry order, so expired ones are all at the front
+            while self.entries:
+                oldest, expires_at = next(iter(self.entries.items()))
+                if expires_at > now:
+                    break
+                del self.entries[oldest]
+            if event_id in self.entries:
+                self.hits += 1
+                return True
+        return False
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits}
@@ -0,0 +1,137 @@
+# Background job runner for the weekly news and daily meme jobs, built on APScheduler
+# Jobs live in a persistent SQLAlchemy job store, so run times survive restarts and missed
+# runs are coalesced into one. Only one process runs the scheduler at a time: every
+# candidate tries to take an exclusive lock on SCHEDULER_LOCK_FILE, and the others keep
+# retrying so one of them takes over if the leader exits.
+#
+# Two ways to run it:
+#   - inside the web app: bot.py calls start_scheduler_thread() in every gunicorn worker
+#     (RUN_SCHEDULER=true), and exactly one of them becomes the leader
+#   - as its own process: `python scheduler.py` (the `worker` entry in the Procfile). The
+#     web processes must then run with RUN_SCHEDULER=false, as the Procfile's `web` entry
+#     does: the lock only works between processes on one machine, so a web worker on
+#     another dyno would run the jobs too, against its own seen index and outbox.
+#
+# The jobs are jobs.py's, except under uvicorn: asgi_app.py sets SCHEDULER_JOBS_MODULE to
+# itself, so its jobs run on the app's event loop and post with AsyncWebClient.
+#
+# APScheduler and SQLAlchemy are imported only once this process is the leader, so the
+# web workers that never become leader don't pay for them at startup.
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from log_setup import configure_logging
+
+SCHEDULER_DB_URL = os.getenv('SCHEDULER_DB_URL', 'sqlite:///scheduler_jobs.db')
+SCHEDULER_LOCK_FILE = os.getenv('SCHEDULER_LOCK_FILE', 'scheduler.lock')
+SCHEDULER_TIMEZONE = os.getenv('SCHEDULER_TIMEZONE')  # Defaults to the server's local timezone
+LEADER_RETRY_SECONDS = 30  # How often followers try to take over leadership
+
+logger = logging.getLogger(__name__)
+
+# Jobs are referenced by import path (SCHEDULER_JOBS_MODULE:func) so the persistent job
+# store can reload them; "cron" holds CronTrigger fields
+JOBS = [
+    {"id": "news_weekly", "func": "run_news_weekly_job", "cron": {"day_of_week": "mon", "hour": 9, "minute": 0}},
+    {"id": "daily_memes", "func": "run_daily_meme_job", "cron": {"hour": 12, "minute": 0}},
+]
+JOB_DEFAULTS = {
+    "coalesce": True,  # Run a job once, not once per missed run, after downtime
+    "max_instances": 1,  # Never run two copies of the same job at once
+    "misfire_grace_time": 6 * 60 * 60,  # Still run a job that was missed by up to 6 hours
+}
+
+
+# Exclusive, non-blocking lock on a file; released by the OS if the process dies
+class LeaderLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+# Start a background scheduler on the persistent job store
+# Jobs already in the store keep their next run time, so a run that was due while no
+# process was leader still fires (once) on startup; only new or changed jobs are replaced.
+def start_scheduler():
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    options = {
+        "jobstores": {"default": SQLAlchemyJobStore(url=SCHEDULER_DB_URL)},
+        "executors": {"default": ThreadPoolExecutor(2)},
+        "job_defaults": JOB_DEFAULTS,
+    }
+    if SCHEDULER_TIMEZONE:
+        options["timezone"] = SCHEDULER_TIMEZONE
+    scheduler = BackgroundScheduler(**options)
+    scheduler.start(paused=True)
+    jobs_module = os.getenv('SCHEDULER_JOBS_MODULE', 'jobs')  # Read now, as asgi_app.py sets it at import
+    for job in JOBS:
+        trigger = CronTrigger(timezone=SCHEDULER_TIMEZONE, **job["cron"])
+        func = f"{jobs_module}:{job['func']}"
+        stored = scheduler.get_job(job["id"])
+        if stored is None or str(stored.trigger) != str(trigger) or stored.func_ref != func:
+            scheduler.add_job(func, trigger, id=job["id"], replace_existing=True)
+    scheduler.resume()
+    return scheduler
+
+
+# Wait until this process holds the leader lock
+def wait_for_leadership(lock):
+    while not lock.try_acquire():
+        time.sleep(LEADER_RETRY_SECONDS)
+    logger.info("Process %d is the scheduler leader", os.getpid())
+
+
+_scheduler_thread = None
+
+
+# Start a daemon thread that becomes the leader when it can and then runs the scheduler
+# in the background; request handling is never blocked
+def start_scheduler_thread():
+    global _scheduler_thread
+    if _scheduler_thread is not None:
+        return _scheduler_thread
+
+    def run():
+        wait_for_leadership(LeaderLock(SCHEDULER_LOCK_FILE))
+        start_scheduler()
+
+    _scheduler_thread = threading.Thread(target=run, name="scheduler-leader", daemon=True)
+    _scheduler_thread.start()
+    return _scheduler_thread
+
+
+# Standalone worker process
+if __name__ == "__main__":
+    configure_logging()
+    wait_for_leadership(LeaderLock(SCHEDULER_LOCK_FILE))
+    scheduler = start_scheduler()
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        scheduler.shutdown()
@@ -0,0 +1,140 @@
+# Persistent index of content that has already been posted to Slack
+# Keys are canonicalized article URLs ("url:...") and Reddit submission IDs ("reddit:...").
+# The exact record lives in SQLite; an in-memory Bloom filter in front of it answers most
+# "never seen" lookups without touching the database. Entries older than the retention
+# window are deleted by compact(), which also rebuilds the filter.
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src", "cmpid", "_ga", "igshid"}
+
+
+# Normalize a URL so the same article always gets the same key
+def canonicalize_url(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def article_key(article):
+    return "url:" + canonicalize_url(article['link'])
+
+
+def meme_keys(meme):
+    # The submission ID, plus the image URL so cross-posts of the same image match too
+    return ["reddit:" + meme['id'], "url:" + canonicalize_url(meme['url'])]
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1000)
+        self.size = int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))  # Bits
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Bit positions for a key, by double hashing one 128-bit digest
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenIndex:
+    def __init__(self, path, retention=90 * 24 * 60 * 60, error_rate=0.01):
+        self.retention = retention
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, first_seen REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS seen_first_seen ON seen (first_seen)")
+
+        # Counters
+        self.filter_negatives = 0  # Lookups answered by the Bloom filter alone
+        self.exact_lookups = 0  # Lookups that had to check SQLite
+        self.false_positives = 0  # ...and found the key wasn't there after all
+
+        self.compact()
+
+    # Rebuild the Bloom filter from every key in the database
+    def _rebuild_filter(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        self.filter = BloomFilter(count * 2, self.error_rate)
+        self.loaded_until = 0.0
+        self._load_new_keys()
+
+    # Add keys written since the last load (e.g. by another process) to the filter
+    def _load_new_keys(self):
+        for key, first_seen in self.conn.execute(
+            "SELECT key, first_seen FROM seen WHERE first_seen >= ?", (self.loaded_until,)
+        ):
+            self.filter.add(key)
+            self.loaded_until = max(self.loaded_until, first_seen)
+
+    # Drop entries older than the retention window and rebuild the filter
+    def compact(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM seen WHERE first_seen < ?", (time.time() - self.retention,))
+            self._rebuild_filter()
+
+    # Pick up keys other processes have added since the last refresh
+    def refresh(self):
+        with self.lock:
+            self._load_new_keys()
+
+    def contains(self, key):
+        with self.lock:
+            if key not in self.filter:
+                self.filter_negatives += 1
+                return False
+            self.exact_lookups += 1
+            found = self.conn.execute("SELECT 1 FROM seen WHERE key = ?", (key,)).fetchone() is not None
+            if not found:
+                self.false_positives += 1
+            return found
+
+    def contains_any(self, keys):
+        return any(self.contains(key) for key in keys)
+
+    def add(self, *keys):
+        now = time.time()
+        with self.lock:
+            with self.conn:  # One transaction for the whole batch
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR IGNORE INTO seen (key, first_seen) VALUES (?, ?)", [(key, now) for key in keys])
+            for key in keys:
+                self.filter.add(key)
+            # Keep the false positive rate near its target as the index grows
+            if self.filter.count > self.filter.capacity:
+                self._rebuild_filter()
+
+    def stats(self):
+        return {
+            "filter_negatives": self.filter_negatives,
+            "exact_lookups": self.exact_lookups,
+            "false_positives": self.false_positives,
+        }
@@ -0,0 +1,228 @@
+# Declarative per-site extraction profiles for the news scraper
+# Sites are listed in a JSON config file (news_sites.json by default). Each profile has:
+#   name, url                 required
+#   limit                     number of items to keep (default 4)
+#   parser                    "lxml" or "html.parser" (default: lxml when installed)
+#   stream                    read the page in chunks and stop once `limit` items are found
+#                             (default: on for sites without selectors, see NEWS_STREAMING)
+#   connect_timeout, read_timeout, retries, backoff
+#                             fetch budget, see news_fetcher.DEFAULT_SITE_SETTINGS
+#   selectors                 optional {"type": "css" | "xpath", "item", "title", "link", "image"}
+#   feed                      optional RSS or Atom feed URL
+# A site with a feed is read from the feed (feed_parser.py), and its page is only scraped
+# when the feed can't be fetched or has no stories. Without selectors a page is scraped
+# with the generic h2/h3 heading extractor (extractor.py). With selectors, "item" picks
+# each article and the other selectors are relative to the item.
+# Selectors are compiled once when the profiles are loaded and reused on every run. Each
+# compiled profile also gets a fingerprint of its extraction settings, which the page
+# cache stores results under.
+# Selector profiles parse a growing prefix of the page (PREFIX_SIZE characters, doubling)
+# and stop once the prefix holds `limit` items that are complete, i.e. closed before the
+# end of the prefix; they only parse the whole page when it has fewer items than that.
+# Selectors that depend on what follows an item (:last-child, last()) see only the prefix.
+import hashlib
+import json
+import os
+
+import soupsieve
+from bs4 import BeautifulSoup
+from urllib.parse import urljoin
+
+import extractor
+import feed_parser
+
+DEFAULT_LIMIT = 4
+# Streaming needs the incremental heading extractor, so it only applies to sites without selectors
+STREAMING_ENABLED = os.getenv('NEWS_STREAMING', 'true').lower() != 'false'
+FETCH_SETTINGS = ("connect_timeout", "read_timeout", "retries", "backoff")
+# Bump when an extractor change alters what the same profile scrapes from a page, so
+# results cached before the change (see http_cache.py) are scraped again
+EXTRACTION_VERSION = 2
+PREFIX_SIZE = 64 * 1024  # Characters of a page parsed first for selector profiles
+
+
+# Raised when a profile in the config file is invalid
+class SiteProfileError(ValueError):
+    pass
+
+
+# Growing prefixes of a page, as (text, whether it's the whole page)
+def _prefixes(html):
+    size = PREFIX_SIZE
+    while size < len(html):
+        yield html[:size], False
+        size *= 2
+    yield html, True
+
+
+# Whether a BeautifulSoup element was closed before the end of the text it was parsed
+# from: something outside it follows it
+def _soup_closed(element):
+    while getattr(element, "contents", None):
+        element = element.contents[-1]
+    return element.next_element is not None
+
+
+# Same for an lxml element: it, or one of its ancestors, has a tail or a next sibling
+def _lxml_closed(element):
+    while element is not None:
+        if element.tail or element.getnext() is not None:
+            return True
+        element = element.getparent()
+    return False
+
+
+# CSS selectors, run with soupsieve on a BeautifulSoup tree
+class CssSelectors:
+    def __init__(self, spec):
+        self.item = soupsieve.compile(spec["item"])
+        self.title = soupsieve.compile(spec["title"]) if spec.get("title") else None
+        self.link = soupsieve.compile(spec.get("link") or "a[href]")
+        self.image = soupsieve.compile(spec["image"]) if spec.get("image") else None
+
+    # Stops parsing and matching as soon as `limit` complete items are found
+    def items(self, html, parser, limit):
+        for prefix, whole in _prefixes(html):
+            items = self.item.select(BeautifulSoup(prefix, parser), limit=limit)
+            if whole or (len(items) == limit and all(map(_soup_closed, items))):
+                break
+        for item in items:
+            title = self.title.select_one(item) if self.title else item
+            link = item if item.name == "a" else self.link.select_one(item)
+            image = self.image.select_one(item) if self.image else None
+            yield (
+                title.get_text(" ", strip=True) if title else None,
+                link.get("href") if link else None,
+                (image.get("src") or image.get("data-src")) if image else None,
+            )
+
+
+# XPath selectors, run on an lxml tree (requires lxml)
+# With the "html.parser" parser the page is parsed by BeautifulSoup and converted to an
+# lxml tree, so it's read the same way as with CSS selectors.
+class XPathSelectors:
+    def __init__(self, spec):
+        if extractor.etree is None:
+            raise SiteProfileError("XPath selectors need lxml installed")
+        etree = extractor.etree
+        self.item = etree.XPath(spec["item"])
+        self.title = etree.XPath(spec["title"]) if spec.get("title") else None
+        self.link = etree.XPath(spec.get("link") or ".//a/@href")
+        self.image = etree.XPath(spec["image"]) if spec.get("image") else None
+
+    @staticmethod
+    def _first(xpath, item, attribute=None):
+        results = xpath(item) if xpath is not None else []
+        if not results:
+            return None
+        value = results[0]
+        if isinstance(value, str):
+            return value.strip()  # The selector picked an attribute or text() node
+        if attribute:
+            return value.get(attribute) or value.get("data-" + attribute)
+        return " ".join(" ".join(value.itertext()).split())
+
+    @staticmethod
+    def _parse(html, parser):
+        if parser == "lxml":
+            from lxml import html as lxml_html
+            return lxml_html.fromstring(html)
+        from lxml.html import soupparser
+        return soupparser.fromstring(html, features=parser)
+
+    # Stops parsing as soon as a prefix of the page holds `limit` complete items
+    def items(self, html, parser, limit):
+        for prefix, whole in _prefixes(html):
+            items = self.item(self._parse(prefix, parser))[:limit]
+            if whole or (len(items) == limit and all(map(_lxml_closed, items))):
+                break
+        for item in items:
+            title = self._first(self.title, item) if self.title is not None else " ".join(" ".join(item.itertext()).split())
+            link = item.get("href") if item.tag == "a" else self._first(self.link, item, "href")
+            yield title, link, self._first(self.image, item, "src")
+
+
+# Short hash of the settings that decide what is scraped from a page or feed
+def fingerprint(*settings):
+    return hashlib.sha1(json.dumps([EXTRACTION_VERSION, *settings], sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Check a profile from the config file and compile its selectors
+def compile_profile(raw):
+    for key in ("name", "url"):
+        if not raw.get(key):
+            raise SiteProfileError(f"Site profile is missing '{key}': {raw}")
+
+    profile = {key: raw[key] for key in FETCH_SETTINGS if key in raw}
+    profile.update({
+        "name": raw["name"],
+        "url": raw["url"],
+        "limit": int(raw.get("limit", DEFAULT_LIMIT)),
+        "parser": raw.get("parser") or extractor.DEFAULT_PARSER,
+        "selectors": None,
+        "stream": False,
+        "feed": raw.get("feed"),
+        "is_feed": False,
+    })
+
+    spec = raw.get("selectors")
+    if spec:
+        if not spec.get("item"):
+            raise SiteProfileError(f"Selectors for {raw['name']} need an 'item' selector")
+        kind = spec.get("type", "css")
+        try:
+            if kind == "css":
+                profile["selectors"] = CssSelectors(spec)
+            elif kind == "xpath":
+                profile["selectors"] = XPathSelectors(spec)
+            else:
+                raise SiteProfileError(f"Unknown selector type '{kind}' for {raw['name']}")
+        except (soupsieve.SelectorSyntaxError, SyntaxError) as e:
+            raise SiteProfileError(f"Bad selector for {raw['name']}: {e}") from e
+    profile["stream"] = bool(STREAMING_ENABLED and profile["selectors"] is None and raw.get("stream", True))
+    profile["fingerprint"] = fingerprint("page", profile["limit"], profile["parser"], spec or None, profile["stream"], profile["feed"])
+    return profile
+
+
+# Load and compile every profile in a JSON config file
+def load_site_profiles(path):
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    profiles = [compile_profile(raw) for raw in config.get("sites", [])]
+    names = [profile["name"] for profile in profiles]
+    if len(set(names)) != len(names):
+        raise SiteProfileError(f"Duplicate site names in {path}")
+    return profiles
+
+
+# The profile to fetch a site's feed with: same name, limit and fetch budget, but the feed's
+# URL, and always streamed
+def feed_source(profile):
+    return {**profile, "url": profile["feed"], "stream": True, "is_feed": True, "fingerprint": fingerprint("feed", profile["limit"], profile["feed"])}
+
+
+# Read up to profile["limit"] articles from a streamed feed (a feed_source() profile)
+def extract_site_feed(profile, chunks):
+    return feed_parser.extract_feed_from_chunks(chunks, profile["url"], profile["limit"])
+
+
+# Extract up to profile["limit"] articles from a streamed page (only for profiles without selectors)
+def extract_site_stream(profile, chunks, encoding=None):
+    return extractor.extract_articles_from_chunks(chunks, profile["url"], profile["limit"], profile["parser"], encoding)
+
+
+# Extract up to profile["limit"] articles from a page using the site's profile
+def extract_site(profile, html):
+    if profile["selectors"] is None:
+        return extractor.extract_articles(html, profile["url"], profile["limit"], profile["parser"])
+
+    articles = []
+    for title, href, image_src in profile["selectors"].items(html, profile["parser"], profile["limit"]):
+        if not title or not href:
+            continue
+        articles.append({
+            'title': title,
+            'link': urljoin(profile["url"], href),
+            'image_url': urljoin(profile["url"], image_src) if image_src else None
+        })
+    return articles
@@ -0,0 +1,253 @@
+# Rate-limit-aware layer for outbound Slack Web API calls
+# Every call goes through a token bucket sized to the method's Slack rate-limit tier
+# (chat.postMessage is limited per channel). HTTP 429 responses are retried after their
+# Retry-After delay plus jitter, and the bucket is paused so other threads back off too.
+# Transient server errors and calls that got no answer (a timeout, a dropped connection)
+# are retried with exponential backoff, except by call_once(): Slack may have acted on a
+# call before it failed, so a post that mustn't be repeated blindly gets the error back
+# instead (see outbox.py). For the same reason the clients given to a poster should have
+# slack_sdk's own connection-error retries turned off (retry_handlers=[]). AsyncSlackPoster
+# does the same for slack_sdk's AsyncWebClient without blocking the event loop.
+#
+# call_many() fans one method out over many channels (e.g. a DM to every member of a
+# cohort) with a bounded number of calls in flight. Each channel has its own bucket, so
+# every fan-out of a method also shares one more bucket, and a 429 on any call pauses it.
+# Past MAX_CHANNEL_BUCKETS channel buckets, the least recently used ones are dropped once
+# they are idle (full and not paused), so DMs to every member don't keep a bucket each.
+import asyncio
+import http.client
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from slack_sdk.errors import SlackApiError
+
+import metrics
+from rate_limit import TokenBucket
+
+# (tokens per second, burst) per method, from Slack's published tiers
+TIER_2 = (20 / 60, 3)
+TIER_3 = (50 / 60, 5)
+TIER_4 = (100 / 60, 10)
+METHOD_LIMITS = {
+    "chat.postMessage": (1.0, 3),  # Special tier: about 1 message per second per channel
+    "conversations.open": TIER_3,
+    "conversations.members": TIER_4,
+    "conversations.history": TIER_3,
+}
+DEFAULT_LIMIT = TIER_3
+PER_CHANNEL_METHODS = {"chat.postMessage"}
+MAX_CHANNEL_BUCKETS = 1000  # Per-channel buckets kept before idle ones are dropped
+RETRYABLE_ERRORS = {"ratelimited", "internal_error", "fatal_error", "service_unavailable", "request_timeout"}
+FANOUT_LIMIT = (5.0, 10)  # Shared by every call_many() of a method: about 300 a minute
+FANOUT_CONCURRENCY = 8  # Calls in flight at once in call_many()
+MAX_RETRIES = 3
+BACKOFF = 1.0  # Seconds before the first retry of a transient error
+# Raised by a call that got no answer from Slack, which may or may not have acted on it
+# (urllib's URLError, socket timeouts and dropped connections are all OSErrors)
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException, asyncio.TimeoutError)
+
+SLACK_CALL_SECONDS = metrics.histogram("slack_api_call_seconds", "Slack Web API call latency, by method")
+SLACK_CALL_ERRORS = metrics.counter("slack_api_errors_total", "Slack Web API errors, by method and error code")
+SLACK_RATE_LIMIT_WAIT_SECONDS = metrics.histogram("slack_api_rate_limit_wait_seconds", "Time calls waited for a rate-limit token, by method")
+
+logger = logging.getLogger(__name__)
+
+
+# True if Slack turned the call away for rate limiting, so it certainly wasn't acted on
+def is_rate_limited(error):
+    return error.response.status_code == 429 or error.response.get("error") == "ratelimited"
+
+
+# Pick the wait before retrying a failed call, or None if it shouldn't be retried
+# With server_errors=False only rate-limited calls are retried.
+def retry_delay(error, attempt, server_errors=True):
+    response = error.response
+    if response.status_code == 429:
+        return float(response.headers.get("Retry-After", 1)) + random.uniform(0, 1)
+    if not server_errors and not is_rate_limited(error):
+        return None
+    if response.status_code >= 500 or response.get("error") in RETRYABLE_ERRORS:
+        return BACKOFF * (2 ** attempt) * (1 + random.random())
+    return None
+
+
+class SlackPoster:
+    transport_errors = TRANSPORT_ERRORS
+
+    def __init__(self, client, max_retries=MAX_RETRIES):
+        self.client = client
+        self.max_retries = max_retries
+        self.buckets = {}
+        self.channel_buckets = OrderedDict()  # (method, channel) -> bucket, least recently used first
+        self.lock = threading.Lock()
+
+        # Counters
+        self.sent = 0  # Successful calls
+        self.throttled = 0  # HTTP 429 responses
+        self.retried = 0  # Retries of any kind
+        self.failed = 0  # Calls that gave up
+
+    def bucket(self, method, channel=None):
+        if method in PER_CHANNEL_METHODS:
+            return self._channel_bucket(method, channel)
+        key = (method, None)
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*METHOD_LIMITS.get(method, DEFAULT_LIMIT))
+            return self.buckets[key]
+
+    def _channel_bucket(self, method, channel):
+        key = (method, channel)
+        with self.lock:
+            bucket = self.channel_buckets.get(key)
+            if bucket is not None:
+                self.channel_buckets.move_to_end(key)
+                return bucket
+            bucket = self.channel_buckets[key] = TokenBucket(*METHOD_LIMITS.get(method, DEFAULT_LIMIT))
+            # Drop idle buckets from the least recently used end; busy ones are kept, over the cap if need be
+            excess = len(self.channel_buckets) - MAX_CHANNEL_BUCKETS
+            for old_key in list(islice(self.channel_buckets, max(0, excess))):
+                if self.channel_buckets[old_key].is_idle():
+                    del self.channel_buckets[old_key]
+            return bucket
+
+    def fanout_bucket(self, method):
+        with self.lock:
+            if ("fanout", method) not in self.buckets:
+                self.buckets[("fanout", method)] = TokenBucket(*FANOUT_LIMIT)
+            return self.buckets[("fanout", method)]
+
+    # Record a failed attempt; returns the delay before retrying, or re-raises the error
+    def _handle_error(self, error, buckets, method, attempt, retry_server_errors=True):
+        SLACK_CALL_ERRORS.inc(method=method, error=error.response.get("error") or error.response.status_code)
+        delay = retry_delay(error, attempt, retry_server_errors)
+        if error.response.status_code == 429:
+            self.throttled += 1
+            for bucket in buckets:
+                bucket.pause(delay)
+        if delay is None or attempt >= self.max_retries:
+            self.failed += 1
+            raise error
+        self.retried += 1
+        logger.warning("Retrying %s in %.1fs after error: %s", method, delay, error.response.get('error'))
+        return delay
+
+    # Record a call that got no answer; returns the delay before retrying, or re-raises the error
+    def _handle_transport_error(self, error, method, attempt, retry):
+        SLACK_CALL_ERRORS.inc(method=method, error=type(error).__name__)
+        if not retry or attempt >= self.max_retries:
+            self.failed += 1
+            raise error
+        self.retried += 1
+        delay = BACKOFF * (2 ** attempt) * (1 + random.random())
+        logger.warning("Retrying %s in %.1fs after %r", method, delay, error)
+        return delay
+
+    # Call a Web API method by name, e.g. call("chat.postMessage", channel=..., text=...)
+    def call(self, method, **kwargs):
+        return self._call(method, kwargs)
+
+    # Like call(), but only rate limits are retried; a server or transport error is raised at once
+    def call_once(self, method, **kwargs):
+        return self._call(method, kwargs, retry_server_errors=False)
+
+    # `shared` is an extra bucket the call must also take a token from
+    def _call(self, method, kwargs, shared=None, retry_server_errors=True):
+        buckets = [self.bucket(method, kwargs.get("channel"))] + ([shared] if shared else [])
+        api_method = getattr(self.client, method.replace(".", "_"))
+        attempt = 0
+        while True:
+            SLACK_RATE_LIMIT_WAIT_SECONDS.observe(sum(bucket.acquire() for bucket in buckets), method=method)
+            try:
+                with SLACK_CALL_SECONDS.time(method=method):
+                    response = api_method(**kwargs)
+                self.sent += 1
+                return response
+            except SlackApiError as e:
+                time.sleep(self._handle_error(e, buckets, method, attempt, retry_server_errors))
+            except self.transport_errors as e:
+                time.sleep(self._handle_transport_error(e, method, attempt, retry_server_errors))
+            attempt += 1
+
+    # Make one call per set of arguments in `calls`, `concurrency` at a time
+    # Returns a response, or the SlackApiError or transport error, per call, in order. With
+    # retry_server_errors=False calls are made as by call_once().
+    def call_many(self, method, calls, concurrency=FANOUT_CONCURRENCY, retry_server_errors=True):
+        calls = list(calls)
+        if not calls:
+            return []
+        shared = self.fanout_bucket(method)
+
+        def call(kwargs):
+            try:
+                return self._call(method, kwargs, shared, retry_server_errors)
+            except (SlackApiError, *self.transport_errors) as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(calls)), thread_name_prefix="slack-fanout") as executor:
+            return list(executor.map(call, calls))
+
+    def post_message(self, channel, **kwargs):
+        return self.call("chat.postMessage", channel=channel, **kwargs)
+
+    def stats(self):
+        return {
+            "sent": self.sent, "throttled": self.throttled, "retried": self.retried, "failed": self.failed,
+            "channel_buckets": len(self.channel_buckets),
+        }
+
+
+# Same buckets, retries and counters for AsyncWebClient; waits with asyncio.sleep
+class AsyncSlackPoster(SlackPoster):
+    def __init__(self, client, max_retries=MAX_RETRIES):
+        import aiohttp  # Already loaded by AsyncWebClient; a dropped connection there isn't always an OSError
+
+        super().__init__(client, max_retries)
+        self.transport_errors = TRANSPORT_ERRORS + (aiohttp.ClientError,)
+
+    async def call(self, method, **kwargs):
+        return await self._call(method, kwargs)
+
+    async def call_once(self, method, **kwargs):
+        return await self._call(method, kwargs, retry_server_errors=False)
+
+    async def _call(self, method, kwargs, shared=None, retry_server_errors=True):
+        buckets = [self.bucket(method, kwargs.get("channel"))] + ([shared] if shared else [])
+        api_method = getattr(self.client, method.replace(".", "_"))
+        attempt = 0
+        while True:
+            wait = max(bucket.reserve() for bucket in buckets)
+            SLACK_RATE_LIMIT_WAIT_SECONDS.observe(wait, method=method)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                with SLACK_CALL_SECONDS.time(method=method):
+                    response = await api_method(**kwargs)
+                self.sent += 1
+                return response
+            except SlackApiError as e:
+                await asyncio.sleep(self._handle_error(e, buckets, method, attempt, retry_server_errors))
+            except self.transport_errors as e:
+                await asyncio.sleep(self._handle_transport_error(e, method, attempt, retry_server_errors))
+            attempt += 1
+
+    async def call_many(self, method, calls, concurrency=FANOUT_CONCURRENCY, retry_server_errors=True):
+        shared = self.fanout_bucket(method)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(kwargs):
+            async with semaphore:
+                try:
+                    return await self._call(method, kwargs, shared, retry_server_errors)
+                except (SlackApiError, *self.transport_errors) as e:
+                    return e
+
+        return await asyncio.gather(*(call(kwargs) for kwargs in calls))
+
+    async def post_message(self, channel, **kwargs):
+        return await self.call("chat.postMessage", channel=channel, **kwargs)
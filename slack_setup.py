@@ -0,0 +1,43 @@
+# Slack client, poster and outbox shared by the web app (bot.py) and the scheduled jobs (jobs.py)
+# Both import them from here. jobs.py must not import bot.py: when the app is started with
+# `python bot.py`, bot.py is loaded as __main__, and importing `bot` would run it a second
+# time, with a second Flask app, event adapter, dispatcher pool and outbox drainer.
+import os
+
+from slack_sdk import WebClient
+
+import metrics
+from outbox import Outbox
+from slack_poster import SlackPoster
+
+SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
+SLACK_API_URL = os.getenv('SLACK_API_URL', WebClient.BASE_URL)  # Pointed at benchmarks/fake_slack.py for load tests
+
+client = WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL)  # For Socket Mode's own calls (socket_mode.py)
+# Rate-limited, retrying wrapper used for every outbound Slack call. Its client has no
+# slack_sdk retries, which would resend a post after a dropped connection even though it
+# may have gone out (see slack_poster.py); the poster decides what is safe to retry.
+slack_poster = SlackPoster(WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL, retry_handlers=[]))
+
+# Every post is recorded in a durable outbox before it's sent, and a drainer thread in each
+# process delivers whatever a crash or a Slack outage left behind (see outbox.py)
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.db')
+OUTBOX_DRAIN_SECONDS = float(os.getenv('OUTBOX_DRAIN_SECONDS', 30))  # 0 disables the drainer
+OUTBOX_RETRY_SECONDS = float(os.getenv('OUTBOX_RETRY_SECONDS', 60))  # Before a post that failed is retried; doubles each time
+outbox = Outbox(OUTBOX_PATH, slack_poster, retry_backoff=OUTBOX_RETRY_SECONDS)
+
+# Channel IDs
+MEMBER_LOG_ID = "C06Q2RN2MTJ"  # Member log channel ID
+TECH_NEWS_ID = "C06PPLGLV2T"  # Tech News Channel ID
+COMMUNITY_MEMES_ID = "C06L8B2QFM2"  # Community Memes channel ID
+
+metrics.register_collector("slack_poster", "Slack posting stats", slack_poster.stats)
+metrics.register_collector("outbox", "Outbound post outbox stats", outbox.stats)
+
+
+# Start this process's outbox drainer, once
+# The drainer only sends records whose hooks are registered in the process, so bot.py and
+# jobs.py each start it: a worker that runs only the jobs still delivers their posts.
+def start_outbox_drainer():
+    if OUTBOX_DRAIN_SECONDS > 0:
+        outbox.start(OUTBOX_DRAIN_SECONDS)
@@ -0,0 +1,83 @@
+# Socket Mode entry point: events arrive over a WebSocket instead of POST /slack/events
+# Run with: SLACK_APP_TOKEN=xapp-... python socket_mode.py
+# (Socket Mode must be enabled in the Slack app settings, and the app-level token needs
+# the connections:write scope.)
+#
+# The bot opens one outbound WebSocket to Slack (apps.connections.open), so it needs no
+# public URL, and events don't each cost an HTTP request and a signature check. Each
+# envelope is acked over the socket as soon as it's read, then the event goes to the same
+# handlers as the HTTP endpoint, through the same background dispatch queue (see
+# bot.dispatch_event). Slack's redeliveries of an envelope keep the event_id, so
+# claim_welcome's dedup applies unchanged.
+#
+# This uses slack_sdk's websocket-client adapter rather than its built-in WebSocket
+# client: under a burst, the built-in one drops frames that arrive together in one read,
+# and those envelopes are only handled when Slack redelivers them.
+import logging
+import os
+import signal
+import threading
+
+from slack_sdk.socket_mode.websocket_client import SocketModeClient
+from slack_sdk.socket_mode.response import SocketModeResponse
+
+import bot
+import metrics
+import slack_setup
+
+logger = logging.getLogger(__name__)
+
+SLACK_APP_TOKEN = os.getenv('SLACK_APP_TOKEN')
+
+EVENT_HANDLERS = {
+    "member_joined_channel": bot.handle_member_joined,
+    "member_left_channel": bot.handle_member_left,
+}
+
+SOCKET_MODE_ENVELOPES = metrics.counter("socket_mode_envelopes_total", "Socket Mode envelopes received, by type and whether Slack was redelivering")
+
+
+# Ack the envelope, then hand its event to the bot's handler, unless it's a redelivery of
+# an event already handled here (see bot.absorb_retry)
+def process_envelope(client, envelope):
+    client.send_socket_mode_response(SocketModeResponse(envelope_id=envelope.envelope_id))
+    SOCKET_MODE_ENVELOPES.inc(type=envelope.type, retry=bool(envelope.retry_attempt))
+    if envelope.type != "events_api":
+        return
+    event_id = envelope.payload.get("event_id")
+    if bot.absorb_retry(event_id, envelope.retry_reason):
+        return
+    handler = EVENT_HANDLERS.get(envelope.payload.get("event", {}).get("type"))
+    if handler:
+        bot.dispatch_event(handler, envelope.payload)
+    if event_id:
+        bot.replay_cache.add(event_id)
+
+
+# The Web API calls the client makes (apps.connections.open) go through the bot's WebClient,
+# so they follow SLACK_API_URL like every other call
+def create_client(app_token=None):
+    client = SocketModeClient(app_token=app_token or SLACK_APP_TOKEN, web_client=slack_setup.client)
+    client.socket_mode_request_listeners.append(process_envelope)
+    return client
+
+
+def main():
+    if not SLACK_APP_TOKEN:
+        raise SystemExit("Set SLACK_APP_TOKEN to an app-level token (xapp-...) with the connections:write scope")
+    metrics.prune()  # Drop earlier runs' metrics, as gunicorn_config.py does for the web app
+    client = create_client()
+    client.connect()
+    logger.info("Connected to Slack in Socket Mode")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
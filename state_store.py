@@ -0,0 +1,325 @@
+# Shared state backends for event dedup and welcome tracking
+# gunicorn runs several worker processes, so anything used to stop duplicate welcomes has
+# to live outside a single process. Every backend offers the same small API:
+#   claim(key, ttl)      -> True only for the first caller to claim the key (atomic)
+#   get(key) / set(key, value, ttl) / delete(key)
+#   append(key, value, ttl) / take(key)
+#                        a shared list: take() returns everything appended so far and
+#                        empties it, atomically, so each item is taken exactly once
+# Keys with a ttl (in seconds) are evicted once they expire.
+# claim() is the one call that must never be answered wrongly: a lost claim means a
+# member is never welcomed, a doubled one that they're welcomed twice. The redis backend
+# only retries commands that are safe to run twice, and checks a claim whose reply was
+# lost (see RedisStateStore.claim).
+# The default backend is sqlite, which works for any number of workers on one machine;
+# memory only dedups within one process.
+import contextlib
+import heapq
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+SWEEP_EVERY = 500  # Writes between sweeps of expired keys
+
+logger = logging.getLogger(__name__)
+
+
+# In-process store; only safe with a single worker, but handy for local runs
+class MemoryStateStore:
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at or None)
+        self.expiry_heap = []  # (expires_at, key) for TTL eviction
+        self.lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiry_heap)
+            entry = self.data.get(key)
+            if entry and entry[1] == expires_at:
+                del self.data[key]
+
+    def _put(self, key, value, ttl, now):
+        expires_at = now + ttl if ttl else None
+        self.data[key] = (value, expires_at)
+        if expires_at:
+            heapq.heappush(self.expiry_heap, (expires_at, key))
+
+    def claim(self, key, ttl=None):
+        now = time.time()
+        with self.lock:
+            self._evict_expired(now)
+            if key in self.data:
+                return False
+            self._put(key, "1", ttl, now)
+            return True
+
+    def get(self, key):
+        with self.lock:
+            self._evict_expired(time.time())
+            entry = self.data.get(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self.lock:
+            self._evict_expired(now)
+            self._put(key, str(value), ttl, now)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def append(self, key, value, ttl=None):
+        now = time.time()
+        with self.lock:
+            self._evict_expired(now)
+            entry = self.data.get(key)
+            self._put(key, (entry[0] if entry else []) + [str(value)], ttl, now)
+
+    def take(self, key):
+        with self.lock:
+            self._evict_expired(time.time())
+            entry = self.data.pop(key, None)
+            return entry[0] if entry else []
+
+
+# SQLite file in WAL mode, shared by every worker on the same machine
+class SQLiteStateStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()  # One connection per thread
+        self.writes = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_lists ("
+            " id INTEGER PRIMARY KEY, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS state_lists_key ON state_lists (key)")
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit: every statement below is atomic on its own
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _after_write(self, conn, now):
+        self.writes += 1
+        if self.writes % SWEEP_EVERY == 0:
+            conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM state_lists WHERE expires_at <= ?", (now,))
+
+    def claim(self, key, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        # Insert, or take over an expired row; a live row is left untouched
+        cursor = conn.execute(
+            "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+            (key, "1", now + ttl if ttl else None, now)
+        )
+        self._after_write(conn, now)
+        return cursor.rowcount == 1
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, str(value), now + ttl if ttl else None)
+        )
+        self._after_write(conn, now)
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def append(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO state_lists (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, str(value), now + ttl if ttl else None)
+        )
+        self._after_write(conn, now)
+
+    def take(self, key):
+        conn = self._conn()
+        # Write lock first, so no other worker can take the same rows in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT value FROM state_lists WHERE key = ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY id",
+                (key, time.time())
+            ).fetchall()
+            conn.execute("DELETE FROM state_lists WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [value for (value,) in rows]
+
+
+# Raised when a Redis-protocol server replies with an error
+class RedisProtocolError(Exception):
+    pass
+
+
+# Minimal RESP client, so any Redis-protocol server (Redis, Valkey, KeyDB or a local
+# stand-in) can back the store without extra dependencies
+class RedisStateStore:
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.local = threading.local()  # One connection per thread
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        self.local.sock = sock
+        self.local.reader = sock.makefile("rb")
+        try:
+            if self.password:
+                self._command("AUTH", self.password)
+            if self.db:
+                self._command("SELECT", self.db)
+        except BaseException:
+            self._disconnect()
+            raise
+
+    # Drop this thread's connection; the next command opens a new one
+    def _disconnect(self):
+        sock = getattr(self.local, "sock", None)
+        self.local.sock = None
+        if sock is not None:
+            with contextlib.suppress(OSError):
+                sock.close()
+
+    def _command(self, *args):
+        return self._commands(args)[0]
+
+    # Send several commands in one write and read all their replies
+    def _commands(self, *commands):
+        parts = []
+        for args in commands:
+            parts.append(f"*{len(args)}\r\n".encode())
+            for arg in args:
+                data = str(arg).encode()
+                parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.local.sock.sendall(b"".join(parts))
+        return [self._read_reply() for _ in commands]
+
+    def _read_reply(self):
+        line = self.local.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisProtocolError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            return self.local.reader.read(length + 2)[:-2].decode()
+        if kind == b"*":
+            count = int(payload)
+            return None if count == -1 else [self._read_reply() for _ in range(count)]
+        raise RedisProtocolError(f"Unexpected reply: {line!r}")
+
+    # Run a command on this thread's connection
+    # After a dropped connection or a timeout the command may or may not have run, so it's
+    # only sent again, on a new connection, with retry=True: for commands that can safely
+    # run twice. Otherwise the error is raised and the next command reconnects.
+    def execute(self, *args, retry=True):
+        for attempt in range(2 if retry else 1):
+            if getattr(self.local, "sock", None) is None:
+                self._connect()
+            try:
+                return self._command(*args)
+            except (ConnectionError, OSError):
+                self._disconnect()
+                if not retry or attempt:
+                    raise
+
+    # The key is set to a token unique to this call, so if the reply is lost the claim can
+    # be checked: the SET is repeated with the same token on a new connection, and the
+    # caller won if that one succeeds or the key already holds the token
+    def claim(self, key, ttl=None):
+        token = uuid.uuid4().hex
+        args = ["SET", key, token, "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        try:
+            return self.execute(*args, retry=False) == "OK"
+        except (ConnectionError, OSError):
+            return self.execute(*args, retry=False) == "OK" or self.execute("GET", key) == token
+
+    def get(self, key):
+        return self.execute("GET", key)
+
+    def set(self, key, value, ttl=None):
+        args = ["SET", key, value]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        self.execute(*args)
+
+    def delete(self, key):
+        self.execute("DEL", key)
+
+    # Not retried: RPUSH run twice would queue the value twice
+    def append(self, key, value, ttl=None):
+        self.execute("RPUSH", key, value, retry=False)
+        if ttl:
+            self.execute("PEXPIRE", key, int(ttl * 1000))
+
+    def take(self, key):
+        if getattr(self.local, "sock", None) is None:
+            self._connect()
+        # MULTI/EXEC so the read and the delete can't be split by another worker's take;
+        # not retried on a dropped connection, as the transaction may already have run
+        try:
+            replies = self._commands(("MULTI",), ("LRANGE", key, 0, -1), ("DEL", key), ("EXEC",))
+        except (ConnectionError, OSError):
+            self._disconnect()
+            raise
+        return replies[-1][0] or []
+
+
+# Build the store selected by STATE_BACKEND (sqlite, redis or memory)
+def create_state_store(backend=None):
+    backend = (backend or os.getenv('STATE_BACKEND', 'sqlite')).lower()
+    if backend == "sqlite":
+        return SQLiteStateStore(os.getenv('STATE_SQLITE_PATH', 'bot_state.db'))
+    if backend == "redis":
+        return RedisStateStore(os.getenv('STATE_REDIS_URL', 'redis://localhost:6379/0'))
+    if backend == "memory":
+        logger.warning("STATE_BACKEND=memory: event dedup and welcome state aren't shared between worker processes")
+        return MemoryStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
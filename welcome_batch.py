@@ -0,0 +1,92 @@
+# Coalesces member joins that arrive close together into one welcome
+# When a whole cohort is added to the member log channel at once, Slack sends one
+# member_joined_channel event per member. Instead of a welcome post, a conversations.open
+# and a DM for each of them, joins are collected for a few seconds and welcomed together:
+# one channel post mentioning everyone, then one DM per member.
+#
+# New members are appended to a list in the shared state store, so joins handled by
+# different gunicorn workers land in the same batch. The join that starts a batch claims
+# the flush key, and that worker flushes the batch `window` seconds later. A flush releases
+# the key before taking the list, so a join that misses the take always finds the key free
+# and starts the next batch.
+#
+# The flush timer lives only in the worker that claimed the key. If that worker exits
+# before it fires (a crash, a restart, a deploy), its members would wait for the next
+# join. Every worker therefore runs a sweep (start()) that claims the flush key once it
+# has expired and flushes whatever is still pending.
+import logging
+import threading
+import time
+
+PENDING_KEY = "welcome_batch:pending"
+FLUSH_KEY = "welcome_batch:flush"
+PENDING_TTL = 24 * 60 * 60  # Members still pending after this are dropped
+FLUSH_KEY_WINDOWS = 10  # The flush key expires after this many windows, in case its owner died
+
+logger = logging.getLogger(__name__)
+
+
+class WelcomeBatch:
+    def __init__(self, store, window):
+        self.store = store
+        self.window = window  # Seconds to collect joins for
+        self.lock = threading.Lock()
+        self.sweeper = None
+
+        # Counters
+        self.added = 0  # Members queued for a welcome
+        self.batches = 0  # Non-empty batches taken
+        self.largest = 0  # Most members in one batch
+        self.stranded = 0  # Members taken by a sweep because their batch's flush was lost
+
+    # Queue a member; returns True if the caller should call take() after `window` seconds
+    def add(self, user_id):
+        self.store.append(PENDING_KEY, user_id, PENDING_TTL)
+        with self.lock:
+            self.added += 1
+        return self.store.claim(FLUSH_KEY, self.window * FLUSH_KEY_WINDOWS)
+
+    # Members queued since the last take, each once, in the order they joined
+    def take(self):
+        self.store.delete(FLUSH_KEY)
+        user_ids = list(dict.fromkeys(self.store.take(PENDING_KEY)))
+        if user_ids:
+            with self.lock:
+                self.batches += 1
+                self.largest = max(self.largest, len(user_ids))
+        return user_ids
+
+    # Members of a batch whose flush was lost, or [] while a flush is still due
+    # Claims the flush key as a join starting a batch would, so it only succeeds once the
+    # owner's key has been released or has expired.
+    def take_stranded(self):
+        if not self.store.claim(FLUSH_KEY, self.window * FLUSH_KEY_WINDOWS):
+            return []
+        user_ids = self.take()
+        if user_ids:
+            with self.lock:
+                self.stranded += len(user_ids)
+            logger.warning("Welcoming %d members whose welcome batch was never flushed", len(user_ids))
+        return user_ids
+
+    # Every `interval` seconds on a daemon thread, pass stranded members to flush(user_ids)
+    def start(self, interval, flush):
+        if self.sweeper is not None:
+            return self.sweeper
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    user_ids = self.take_stranded()
+                    if user_ids:
+                        flush(user_ids)
+                except Exception:
+                    logger.exception("Welcome batch sweep failed")
+
+        self.sweeper = threading.Thread(target=run, name="welcome-sweeper", daemon=True)
+        self.sweeper.start()
+        return self.sweeper
+
+    def stats(self):
+        return {"added": self.added, "batches": self.batches, "largest": self.largest, "stranded": self.stranded}